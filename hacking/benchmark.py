@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Benchmark tito commands against a generated git repository.
+
+Creates a synthetic monorepo of the requested size, times tito build, tag,
+report and release in it and writes the results as JSON. Compare two result
+files to spot regressions between commits:
+
+    hacking/benchmark.py --output before.json
+    git checkout my-branch
+    hacking/benchmark.py --output after.json --compare before.json
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+TITO_SRC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "src")
+
+SPEC = """Name:           %(name)s
+Version:        1.0
+Release:        %(release)s%%{?dist}
+Summary:        Synthetic tito benchmark package
+License:        GPLv2
+BuildArch:      noarch
+Source0:        %%{name}-%%{version}.tar.gz
+
+%%description
+Synthetic tito benchmark package.
+
+%%prep
+%%setup -q
+
+%%build
+
+%%install
+
+%%files
+
+%%changelog
+"""
+
+# Releaser which exercises everything tito does up to the point where a real
+# releaser would talk to a remote service:
+FAKE_RELEASER = '''
+from tito.release import Releaser
+
+
+class FakeReleaser(Releaser):
+
+    def release(self, dry_run=False, no_build=False, scratch=False):
+        self.builder.tgz()
+'''
+
+
+def git(repo, *args):
+    subprocess.check_call(["git", "-C", repo] + list(args),
+        stdout=subprocess.DEVNULL)
+
+
+def write(path, contents):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(contents)
+
+
+def generate_repo(work_dir, options):
+    """
+    Create a git repository with options.packages tito packages, each with
+    options.files files, options.history commits spread over all packages
+    and options.tags tags per package. Returns the repository path.
+    """
+    repo = os.path.join(work_dir, "repo")
+    os.makedirs(repo)
+    git(repo, "init", "-q")
+    git(repo, "config", "user.name", "Tito Benchmark")
+    git(repo, "config", "user.email", "tito@example.com")
+
+    write(os.path.join(repo, ".tito", "tito.props"),
+        "[buildconfig]\n"
+        "builder = tito.builder.Builder\n"
+        "tagger = tito.tagger.VersionTagger\n"
+        "changelog_do_not_remove_cherrypick = 0\n"
+        "changelog_format = %s (%ae)\n"
+        "lib_dir = .tito/lib\n"
+        "offline = true\n")
+    write(os.path.join(repo, ".tito", "lib", "benchmark_releaser.py"),
+        FAKE_RELEASER)
+    targets = ["[fake-%s]\nreleaser = benchmark_releaser.FakeReleaser\n" % i
+        for i in range(options.releasers)]
+    write(os.path.join(repo, ".tito", "releasers.conf"), "\n".join(targets))
+
+    packages = ["pkg-%s" % i for i in range(options.packages)]
+    for package in packages:
+        write(os.path.join(repo, package, "%s.spec" % package),
+            SPEC % {'name': package, 'release': 1})
+        for i in range(options.files):
+            write(os.path.join(repo, package, "src", "dir-%s" % (i % 10),
+                "file-%s.txt" % i), "%s %s\n" % (package, i) * 20)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "Initial import")
+
+    for i in range(options.submodules):
+        sub = os.path.join(work_dir, "submodule-%s" % i)
+        os.makedirs(sub)
+        git(sub, "init", "-q")
+        write(os.path.join(sub, "README"), "submodule %s\n" % i)
+        git(sub, "add", "-A")
+        git(sub, "-c", "user.name=Tito Benchmark",
+            "-c", "user.email=tito@example.com", "commit", "-q", "-m", "init")
+        git(repo, "-c", "protocol.file.allow=always", "submodule", "add",
+            "-q", sub, os.path.join(packages[i % len(packages)],
+                "submodule-%s" % i))
+    if options.submodules:
+        git(repo, "commit", "-q", "-m", "Add submodules")
+
+    # Spread the history over all packages, tagging each of them
+    # options.tags times along the way:
+    commits = max(options.history, options.tags * len(packages))
+    tag_every = max(1, commits // max(1, options.tags * len(packages)))
+    releases = dict((package, 1) for package in packages)
+    for i in range(commits):
+        package = packages[i % len(packages)]
+        path = os.path.join(repo, package, "src", "dir-%s" % (i % 10),
+            "file-%s.txt" % (i % max(1, options.files)))
+        write(path, "change %s\n" % i)
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "Change %s" % i)
+
+        if i % tag_every == 0 and releases[package] <= options.tags:
+            release = releases[package]
+            write(os.path.join(repo, package, "%s.spec" % package),
+                SPEC % {'name': package, 'release': release})
+            write(os.path.join(repo, ".tito", "packages", package),
+                "1.0-%s %s/\n" % (release, package))
+            git(repo, "add", "-A")
+            git(repo, "commit", "-q", "-m", "Automatic commit of package "
+                "[%s] release [1.0-%s]." % (package, release))
+            git(repo, "tag", "-a", "-m", "Tagging package [%s] version "
+                "[1.0-%s]." % (package, release), "%s-1.0-%s" % (package,
+                    release))
+            releases[package] += 1
+
+    # Every package needs at least one tag to be built:
+    for package in packages:
+        if releases[package] == 1:
+            write(os.path.join(repo, ".tito", "packages", package),
+                "1.0-1 %s/\n" % package)
+            git(repo, "add", "-A")
+            git(repo, "commit", "-q", "-m", "Tag %s" % package)
+            git(repo, "tag", "-a", "-m", "Tag", "%s-1.0-1" % package)
+    return repo
+
+
+def tito(args, cwd, env, exit_codes=(0,)):
+    """ Run tito from this source tree, raising an error if it fails. """
+    process = subprocess.run([sys.executable, "-m", "tito.cli"] + args,
+        cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    if process.returncode not in exit_codes:
+        raise RuntimeError("tito %s failed:\n%s" % (" ".join(args),
+            process.stdout))
+
+
+def time_runs(repeat, run, reset=None):
+    """
+    Call run repeat times and return the wall clock duration of each call.
+    reset is called after every run, untimed, to restore the repository.
+    """
+    durations = []
+    for _i in range(repeat):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+        if reset:
+            reset()
+    return durations
+
+
+def run_benchmarks(repo, work_dir, options):
+    package = "pkg-%s" % (options.packages // 2)
+    package_dir = os.path.join(repo, package)
+    output_dir = os.path.join(work_dir, "output")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([TITO_SRC] +
+        [p for p in [env.get('PYTHONPATH')] if p])
+    # Keep the artifact cache of the user out of the measurements:
+    env['XDG_CACHE_HOME'] = os.path.join(work_dir, "cache")
+
+    def build(*args):
+        def run():
+            tito(["build", "--offline", "--output", output_dir] +
+                list(args), package_dir, env)
+        return run
+
+    def clean_output():
+        shutil.rmtree(output_dir, ignore_errors=True)
+        shutil.rmtree(env['XDG_CACHE_HOME'], ignore_errors=True)
+
+    def undo_tag():
+        tito(["tag", "--undo"], package_dir, env)
+
+    benchmarks = [
+        ("build --tgz", build("--tgz"), clean_output),
+        ("build --tgz --test", build("--tgz", "--test"), clean_output),
+    ]
+    if shutil.which("rpmbuild"):
+        benchmarks.append(("build --srpm", build("--srpm", "--no-cache"),
+            clean_output))
+    else:
+        print("rpmbuild not found, skipping srpm builds")
+    benchmarks.extend([
+        ("tag", lambda: tito(["tag", "--accept-auto-changelog"], package_dir,
+            env), undo_tag),
+        # tito report always exits with 1:
+        ("report --untagged-commits", lambda: tito(["report",
+            "--untagged-commits"], repo, env, (0, 1)), None),
+        ("report --untagged-diffs", lambda: tito(["report",
+            "--untagged-diffs"], repo, env, (0, 1)), None),
+        ("release --all", lambda: tito(["release", "--all", "--yes",
+            "--offline", "--output", output_dir], package_dir, env),
+            clean_output),
+    ])
+
+    results = {}
+    for name, run, reset in benchmarks:
+        if options.only and name not in options.only:
+            continue
+        durations = time_runs(options.repeat, run, reset)
+        results[name] = {
+            'runs': durations,
+            'min': min(durations),
+            'median': statistics.median(durations),
+        }
+        print("%-28s min %8.3fs  median %8.3fs" % (name,
+            results[name]['min'], results[name]['median']))
+    return results
+
+
+def compare(results, baseline_file):
+    """ Print the change of each median against an earlier result file. """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    print("\nCompared to %s (%s):" % (baseline_file,
+        baseline.get('commit', 'unknown commit')))
+    for name, result in sorted(results.items()):
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median']
+        change = (result['median'] - before) / before * 100 if before else 0
+        print("%-28s %8.3fs -> %8.3fs  %+6.1f%%" % (name, before,
+            result['median'], change))
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]",
+        description="Time tito commands in a generated git repository.")
+    parser.add_option("--packages", type="int", default=5,
+        help="Number of packages in the repository. (default: %default)")
+    parser.add_option("--files", type="int", default=200,
+        help="Number of files per package. (default: %default)")
+    parser.add_option("--tags", type="int", default=10,
+        help="Number of tags per package. (default: %default)")
+    parser.add_option("--history", type="int", default=200,
+        help="Minimal number of commits. (default: %default)")
+    parser.add_option("--submodules", type="int", default=0,
+        help="Number of git submodules. (default: %default)")
+    parser.add_option("--releasers", type="int", default=3,
+        help="Number of fake release targets. (default: %default)")
+    parser.add_option("--repeat", type="int", default=3,
+        help="How often to run each command. (default: %default)")
+    parser.add_option("--only", action="append",
+        help="Only run the named benchmark, may be given multiple times.")
+    parser.add_option("--output", default="tito-benchmark.json",
+        help="Write results to this file. (default: %default)")
+    parser.add_option("--compare", metavar="FILE",
+        help="Compare results to those of an earlier run.")
+    parser.add_option("--keep", action="store_true", default=False,
+        help="Keep the generated repository.")
+    (options, _args) = parser.parse_args()
+    options.packages = max(1, options.packages)
+
+    work_dir = tempfile.mkdtemp(prefix="tito-benchmark-")
+    try:
+        start = time.perf_counter()
+        repo = generate_repo(work_dir, options)
+        print("Generated %s in %.1fs" % (repo, time.perf_counter() - start))
+        results = run_benchmarks(repo, work_dir, options)
+    finally:
+        if options.keep:
+            print("Keeping %s" % work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    commit = subprocess.run(["git", "-C", TITO_SRC, "rev-parse", "HEAD"],
+        stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    with open(options.output, "w") as f:
+        json.dump({
+            'commit': commit,
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': dict((key, getattr(options, key)) for key in [
+                'packages', 'files', 'tags', 'history', 'submodules',
+                'releasers', 'repeat']),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print("Wrote: %s" % options.output)
+
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
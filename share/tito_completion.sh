@@ -20,10 +20,13 @@ __tito_build_opts='
     --debug
     --dist=
     --help
+    --incremental
     --install
     --list-tags
+    --no-cache
     --no-cleanup
     --output=
+    --resume
     --rpm
     --rpmbuild-options=
     --scl=
@@ -43,11 +46,15 @@ __tito_release_opts='
     --help
     --list
     --no-build
+    --no-cache
     --no-cleanup
     --output=
+    --parallel=
     --scratch
     --tag=
     --test
+    --wait
+    --watch
     --yes
 '
 
@@ -62,6 +69,7 @@ __tito_report_opts='
 __tito_tag_opts='
     --accept-auto-changelog
     --auto-changelog-message=
+    --changed
     --changelog
     --debug
     --help
@@ -18,7 +18,7 @@
 from tito.builder.main import BuilderBase
 from tito.config_object import ConfigObject
 from tito.common import error_out, debug, get_spec_version_and_release, \
-    get_class_by_name
+    get_class_by_name, copy_file
 
 
 class FetchBuilder(ConfigObject, BuilderBase):
@@ -132,7 +132,7 @@ def fetch(self):
         # we are not using a copy from a past git commit.
         self.spec_file = os.path.join(self.builder.rpmbuild_sourcedir,
                     '%s.spec' % self.builder.project_name)
-        shutil.copyfile(
+        copy_file(
             os.path.join(self.builder.start_dir, '%s.spec' %
                 self.builder.project_name),
             self.spec_file)
@@ -145,7 +145,7 @@ def fetch(self):
             base_name = os.path.basename(s)
             dest_filepath = os.path.join(self.builder.rpmbuild_sourcedir,
                     base_name)
-            shutil.copyfile(s, dest_filepath)
+            copy_file(s, dest_filepath)
             self.sources.append(dest_filepath)
 
             # Add a line to replace in the spec for each source:
@@ -15,11 +15,17 @@
 and rpms.
 """
 
+import copy
 import gzip
+import hashlib
+import json
 import os
 import sys
 import re
+import shlex
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import mkdtemp
 import rpm
 
@@ -31,15 +37,31 @@
     get_commit_count, find_gemspec_file, create_builder, compare_version,\
     find_cheetah_template_file, render_cheetah, replace_spec_release, \
     find_spec_like_file, warn_out, get_commit_timestamp, chdir, mkdir_p, \
-    find_git_root, info_out, munge_specfile, BUILDCONFIG_SECTION
+    find_git_root, info_out, munge_specfile, get_cache_dir, copy_file, \
+    BUILDCONFIG_SECTION
 from tito.compat import (getstatusoutput, getoutput, urlparse, urlretrieve,
                          Version)
 from tito.exception import RunCommandException
 from tito.exception import TitoException
 from tito.config_object import ConfigObject
+from tito.cache import ArtifactCache
+from tito.buildstate import BuildState
 from tito.tar import TarFixer
 from tito import __version__
 
+# Hours a mock root may be reused before it is initialized again:
+DEFAULT_MOCK_MAX_AGE = 24
+
+MOCK_INCLUDE_RE = re.compile(r'''include\(\s*['"]([^'"]+)['"]\s*\)''')
+
+MOCK_WROTE_RE = re.compile(r'Wrote: (\S+\.rpm)')
+
+# Bookkeeping of incremental builds, kept in their persistent build dir:
+INCREMENTAL_STATE_FILENAME = "tito-incremental.json"
+
+SPEC_SOURCE_RE = re.compile(r'^\s*(?:Source|Patch)\d*\s*:\s*(\S+)',
+    re.MULTILINE | re.IGNORECASE)
+
 
 class BuilderBase(object):
     """
@@ -52,6 +74,10 @@ class BuilderBase(object):
     """
     REQUIRED_ARGS = []
 
+    # Whether the builder can keep its rpmbuild tree around between test
+    # builds and only re-run %build and %install (tito build --incremental):
+    SUPPORTS_INCREMENTAL = False
+
     # TODO: merge config into an object and kill the ConfigObject parent class
     def __init__(self, name=None, build_dir=None,
             config=None, user_config=None,
@@ -129,6 +155,26 @@ def __init__(self, name=None, build_dir=None,
         # Artifacts we built:
         self.artifacts = []
 
+        self.incremental = self._get_optional_arg(kwargs, 'incremental', False)
+        if self.incremental and not self.SUPPORTS_INCREMENTAL:
+            raise TitoException("%s does not support incremental builds" %
+                self.__class__.__name__)
+
+        # Cache of previous build results, skipped entirely with --no-cache.
+        # Incremental builds keep their own build tree instead:
+        self.no_cache = self._get_optional_arg(kwargs, 'no_cache', False)
+        self.artifact_cache = None
+        if not self.no_cache and not self.incremental:
+            self.artifact_cache = ArtifactCache.from_user_config(user_config)
+
+        # Manifest of completed build stages, see run():
+        self.resume = self._get_optional_arg(kwargs, 'resume', False)
+        self.build_state = None
+
+        # Artifacts shared with the other builders of this tito invocation,
+        # see tito.cache.ArtifactBroker:
+        self.broker = self._get_optional_arg(kwargs, 'broker', None)
+
         # Use most suitable package manager for current OS
         self.package_manager = package_manager()
 
@@ -160,6 +206,18 @@ def run(self, options):
         # Reset list of artifacts on each call to run().
         self.artifacts = []
 
+        # Stages are only recorded for --resume, regular builds skip the
+        # checksums and the split rpmbuild run in rpm():
+        if self.resume:
+            key = self._build_state_key()
+            if key:
+                self.build_state = BuildState.load(os.path.join(
+                    self.rpmbuild_basedir, ".tito-state",
+                    "%s.json" % self.project_name), key)
+            else:
+                warn_out("%s can not resume builds, starting over" %
+                    self.__class__.__name__)
+
         try:
             try:
                 if options.tgz:
@@ -181,7 +239,9 @@ def cleanup(self):
         """
         Remove all temporary files and directories.
         """
-        if not self.no_cleanup:
+        if self.incremental:
+            debug("Keeping incremental build dir: %s" % self.rpmbuild_dir)
+        elif not self.no_cleanup:
             debug("Cleaning up %s" % self.rpmbuild_dir)
             shutil.rmtree(self.rpmbuild_dir)
         else:
@@ -222,6 +282,92 @@ def srpm(self, dist=None):
         """
         Build a source RPM.
         """
+        if self._resume("srpm"):
+            return
+        cache_key = self._cache_key("srpm", self.dist or dist)
+        if self._restore_cached_artifacts(cache_key):
+            return
+        self._prepare_srpm()
+        self._rpmbuild_srpm(dist, cache_key)
+
+    def build_srpms(self, variants):
+        """
+        Build a source RPM for each (dist, scl) pair in variants.
+
+        Sources are prepared once, then rpmbuild runs for every distinct pair
+        in parallel, each in its own temporary topdir. An scl of None means
+        the software collection this builder was configured with.
+
+        Returns a dictionary mapping each of the given pairs to the resulting
+        srpm in the output directory.
+        """
+        # Pairs which result in the same rpmbuild invocation share an srpm:
+        wanted = {}
+        for dist, scl in variants:
+            effective = (self.dist or dist or '',
+                self.scl if scl is None else scl)
+            wanted[(dist, scl)] = effective
+        distinct = []
+        for effective in wanted.values():
+            if effective not in distinct:
+                distinct.append(effective)
+
+        self._prepare_srpm()
+        if len(distinct) == 1:
+            dist, scl = distinct[0]
+            builder = self
+            if scl != self.scl:
+                builder = copy.copy(self)
+                builder.scl = scl
+                builder.artifacts = self.artifacts
+            builder._rpmbuild_srpm(dist)
+            self.srpm_location = builder.srpm_location
+            return dict((variant, self.srpm_location) for variant in wanted)
+
+        builders = {}
+        for dist, scl in distinct:
+            builder = copy.copy(self)
+            builder.scl = scl
+            builder.artifacts = []
+            # Output of parallel rpmbuilds would be unreadable:
+            builder.quiet = True
+            # Private topdir and srpm output directory, so concurrent
+            # rpmbuilds never write to the same location:
+            builder.rpmbuild_dir = mkdtemp(dir=self.rpmbuild_dir,
+                prefix="srpm-")
+            builder.rpmbuild_basedir = builder.rpmbuild_dir
+            # Their srpms are moved out of the topdir and can not be resumed
+            # from, nor may the threads write the manifest at the same time:
+            builder.build_state = None
+            builders[(dist, scl)] = builder
+
+        info_out("Building %s source RPMs in parallel..." % len(builders))
+        workers = min(len(builders), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict((variant, executor.submit(builder._rpmbuild_srpm,
+                variant[0])) for variant, builder in builders.items())
+            for future in futures.values():
+                future.result()
+
+        srpms = {}
+        for variant in distinct:
+            built = builders[variant].srpm_location
+            srpm_location = os.path.join(self.rpmbuild_basedir,
+                os.path.basename(built))
+            shutil.move(built, srpm_location)
+            info_out("Wrote: %s" % srpm_location)
+            if srpm_location not in self.artifacts:
+                self.artifacts.append(srpm_location)
+            srpms[variant] = srpm_location
+            self.srpm_location = srpm_location
+
+        return dict((variant, srpms[effective])
+            for variant, effective in wanted.items())
+
+    def _prepare_srpm(self):
+        """
+        Set up everything rpmbuild needs to create a source RPM.
+        """
         self._create_build_dirs()
         if not self.ran_tgz:
             self.tgz()
@@ -231,6 +377,13 @@ def srpm(self, dist=None):
 
         self.copy_extra_sources()
 
+    def _rpmbuild_srpm(self, dist=None, cache_key=None):
+        """
+        Run rpmbuild to create a source RPM from the prepared sources.
+
+        cache_key is the artifact cache key of the srpm if the caller
+        already looked it up, otherwise the cache is checked here.
+        """
         debug("Creating srpm from spec file: %s" % self.spec_file)
         define_dist = ""
         if self.dist:
@@ -242,20 +395,36 @@ def srpm(self, dist=None):
         else:
             debug("*NOT* using dist at all")
 
-        rpmbuild_options = self.rpmbuild_options + self._scl_to_rpmbuild_option()
-
-        cmd = ('rpmbuild %s %s %s --nodeps -bs %s' % (
-               rpmbuild_options, self._get_rpmbuild_dir_options(),
-               define_dist, self.spec_file))
-
-        run_command_func = run_command if self.quiet else run_command_print
-        output = run_command_func(cmd)
-        self.srpm_location = find_wrote_in_rpmbuild_output(output)[0]
+        if cache_key is None:
+            cache_key = self._cache_key("srpm", self.dist or dist)
+            if self._restore_cached_artifacts(cache_key):
+                return
+
+        def build():
+            self._record_sources()
+            rpmbuild_options = self.rpmbuild_options + \
+                self._scl_to_rpmbuild_option()
+
+            cmd = ('rpmbuild %s %s %s --nodeps -bs %s' % (
+                   rpmbuild_options, self._get_rpmbuild_dir_options(),
+                   define_dist, self.spec_file))
+
+            run_command_func = run_command if self.quiet else run_command_print
+            output = run_command_func(cmd)
+            srpm_location = find_wrote_in_rpmbuild_output(output)[0]
+            self._cache_artifacts(cache_key, [srpm_location])
+            return [srpm_location]
+
+        self.srpm_location = self._obtain_from_broker(
+            self._broker_key("srpm", self.dist or dist),
+            self.rpmbuild_basedir, build)[0]
         self.artifacts.append(self.srpm_location)
+        self._record_stage("srpm", [self.srpm_location])
 
-    # Assume that if tito's --no-cleanup option is set, also disable %clean in rpmbuild:
+    # Assume that if tito's --no-cleanup option is set, also disable %clean in rpmbuild.
+    # Incremental builds need the build tree for the next run as well:
     def _get_clean_option(self):
-        if self.no_cleanup:
+        if self.no_cleanup or self.incremental:
             output = run_command('rpmbuild --help')
             if '--noclean' in output:
                 return "--noclean"
@@ -272,11 +441,132 @@ def _get_verbosity_option(self):
 
     def rpm(self):
         """ Build an RPM. """
+        # Before any sources are prepared, a cached build needs none:
+        cache_key = self._cache_key("rpm", self.dist)
+        if self._restore_cached_artifacts(cache_key):
+            return
+
+        self._prepare_rpm()
+        if self.build_state is None:
+            output = self._run_rpmbuild('-ba {0}'.format(self.spec_file))
+            files_written = find_wrote_in_rpmbuild_output(output)
+        else:
+            # With --resume, source and binary packages are built in
+            # separate steps, so the source package can be recorded and a
+            # failing binary build resumed from it:
+            self._record_sources()
+            output = self._run_rpmbuild(
+                '--nodeps -bs {0}'.format(self.spec_file))
+            self.srpm_location = find_wrote_in_rpmbuild_output(output)[0]
+            self._record_stage("srpm", [self.srpm_location])
+
+            output = self._run_rpmbuild('-bb {0}'.format(self.spec_file))
+            files_written = [self.srpm_location] + \
+                find_wrote_in_rpmbuild_output(output)
+        if len(files_written) < 2:
+            error_out("Error parsing rpmbuild output")
+        self.srpm_location = files_written[0]
+        self.artifacts.extend(files_written)
+        self._cache_artifacts(cache_key, files_written)
+        self._record_stage("rpm", files_written)
+
+        print
+        info_out("Successfully built: %s" % '\n\t- '.join(files_written))
+
+    def _prepare_rpm(self):
+        """
+        Set up everything rpmbuild needs to create binary RPMs.
+        """
         self._create_build_dirs()
         if not self.ran_tgz:
             self.tgz()
         self.copy_extra_sources()
 
+    def _rebuild_srpm(self, srpm_location):
+        """
+        Build binary RPMs from a previously built source RPM.
+        """
+        self._create_build_dirs()
+        output = self._run_rpmbuild('--rebuild {0}'.format(srpm_location))
+        files_written = [srpm_location] + find_wrote_in_rpmbuild_output(output)
+        if len(files_written) < 2:
+            error_out("Error parsing rpmbuild output")
+        self.srpm_location = srpm_location
+        self.artifacts.extend(files_written)
+        self._record_stage("rpm", files_written)
+
+        print
+        info_out("Successfully built: %s" % '\n\t- '.join(files_written))
+
+    def _build_state_key(self):
+        """
+        Return a key identifying the inputs of a build, used to tell whether
+        the recorded build stages belong to the build we're about to run.
+        None if this builder can not resume builds.
+        """
+        return None
+
+    def _record_stage(self, stage, paths, **info):
+        """
+        Record that stage completed with the given output files.
+        """
+        if self.build_state is not None:
+            self.build_state.record(stage, paths, **info)
+
+    def _record_sources(self):
+        """
+        Record the prepared sources, builders which can restore them from the
+        manifest with _restore_sources() implement this.
+        """
+        pass
+
+    def _restore_sources(self, entry):
+        """
+        Set up the sources recorded by _record_sources() again. Returns True
+        on success.
+        """
+        return False
+
+    def _resume(self, stage):
+        """
+        Continue an earlier build of stage ("srpm" or "rpm") from the last
+        stage it completed, if --resume was given.
+
+        Returns True if the stage is complete, False if it still needs to
+        be built. Restored sources are picked up by the regular build.
+        """
+        if not self.resume or self.build_state is None:
+            return False
+
+        done = self.build_state.verified(stage)
+        if done:
+            files = [recorded['path'] for recorded in done['files']]
+            self.srpm_location = files[0]
+            self.artifacts.extend(files)
+            info_out("Already built: %s" % '\n\t- '.join(files))
+            return True
+
+        if stage == "rpm":
+            srpm = self.build_state.verified("srpm")
+            if srpm:
+                srpm_location = srpm['files'][0]['path']
+                info_out("Resuming from source RPM: %s" % srpm_location)
+                self._rebuild_srpm(srpm_location)
+                return True
+
+        sources = self.build_state.verified("sources")
+        if sources and self._restore_sources(sources):
+            info_out("Resuming with sources: %s" % '\n\t- '.join(
+                recorded['path'] for recorded in sources['files']))
+        else:
+            info_out("Nothing to resume, starting from scratch")
+        return False
+
+    def _run_rpmbuild(self, build_args):
+        """
+        Run rpmbuild with the given build mode arguments (e.g. "-ba
+        foo.spec") in our build directories, and return its output.
+        """
         cmd = 'rpmbuild {0}'.format(
             " ".join([
                 self.rpmbuild_options,
@@ -285,7 +575,7 @@ def rpm(self):
                 "--define 'dist {0}'".format(self.dist) if self.dist else "",
                 self._get_clean_option(),
                 self._get_verbosity_option(),
-                '-ba {0}'.format(self.spec_file),
+                build_args,
             ])
         )
         try:
@@ -306,14 +596,65 @@ def rpm(self):
         except Exception:
             err = sys.exc_info()[1]
             error_out('%s' % str(err))
-        files_written = find_wrote_in_rpmbuild_output(output)
-        if len(files_written) < 2:
-            error_out("Error parsing rpmbuild output")
-        self.srpm_location = files_written[0]
-        self.artifacts.extend(files_written)
+        return output
 
-        print
-        info_out("Successfully built: %s" % '\n\t- '.join(files_written))
+    def _cache_key(self, stage, dist=None):
+        """
+        Return a key identifying all inputs of the given build stage ("srpm"
+        or "rpm"), or None if the results can not be cached.
+
+        Builders which know where their sources come from override this,
+        the base builder never caches anything.
+        """
+        return None
+
+    def _restore_cached_artifacts(self, cache_key):
+        """
+        Restore previously built artifacts for cache_key into the output
+        directory. Returns the list of restored files, None on a cache miss.
+        """
+        if cache_key is None or self.artifact_cache is None:
+            return None
+        restored = self.artifact_cache.restore(cache_key,
+            self.rpmbuild_basedir)
+        if not restored:
+            debug("No cached artifacts for key: %s" % cache_key)
+            return None
+        self.srpm_location = restored[0]
+        self.artifacts.extend(restored)
+        info_out("Inputs unchanged, reusing cached build: %s" %
+            '\n\t- '.join(restored))
+        return restored
+
+    def _cache_artifacts(self, cache_key, files):
+        """
+        Store freshly built artifacts so the next build with the same inputs
+        can skip rpmbuild.
+        """
+        if cache_key is None or self.artifact_cache is None:
+            return
+        self.artifact_cache.store(cache_key, self.rpmbuild_basedir, files)
+
+    def _broker_key(self, stage, dist=None):
+        """
+        Return a key identifying what the given build stage ("sources" or
+        "srpm") produces within this tito invocation, or None if its results
+        can not be shared with other builders.
+        """
+        return None
+
+    def _obtain_from_broker(self, broker_key, dest_dir, build):
+        """
+        Return the artifacts build() produces, or copies of the ones another
+        builder of this invocation already produced for broker_key.
+        """
+        if broker_key is None or self.broker is None:
+            return build()
+        paths, built = self.broker.obtain(broker_key, dest_dir, build)
+        if not built:
+            info_out("Reusing artifacts built for another release target: %s" %
+                '\n\t- '.join(paths))
+        return paths
 
     def _scl_to_rpmbuild_option(self):
         """ Returns rpmbuild option which disable or enable SC and print warning if needed """
@@ -370,6 +711,13 @@ class Builder(ConfigObject, BuilderBase):
     """
     REQUIRED_ARGS = []
 
+    # Whether the result of a build is fully determined by the git tree we
+    # build from, the spec file and the build options, so it can be served
+    # from the artifact cache:
+    CACHEABLE = True
+
+    SUPPORTS_INCREMENTAL = True
+
     # TODO: drop version
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -434,6 +782,17 @@ def __init__(self, name=None, tag=None, build_dir=None,
         self.tgz_dir = tgz_base
         self.artifacts = []
 
+        if self.incremental:
+            # Replace the temporary build dir with one that survives
+            # between builds:
+            shutil.rmtree(self.rpmbuild_dir)
+            self.rpmbuild_dir = os.path.join(self.rpmbuild_basedir,
+                "incremental", self.project_name)
+            self.rpmbuild_sourcedir = os.path.join(self.rpmbuild_dir,
+                "SOURCES")
+            self.rpmbuild_builddir = os.path.join(self.rpmbuild_dir, "BUILD")
+            debug("Building incrementally in: %s" % self.rpmbuild_dir)
+
         # A copy of the git code from commit we're building:
         self.rpmbuild_gitcopy = os.path.join(self.rpmbuild_sourcedir,
                 self.tgz_dir)
@@ -569,8 +928,7 @@ def _copy_extra_sources(self, download_sources=False):
             if os.path.islink(src) and os.path.isabs(src):
                 src = os.path.join(self.start_dir, os.readlink(src))
 
-            debug("Copying %s -> %s" % (src, self.rpmbuild_sourcedir))
-            shutil.copy(src, self.rpmbuild_sourcedir)
+            copy_file(src, self.rpmbuild_sourcedir)
 
     def tgz(self):
         """
@@ -580,9 +938,8 @@ def tgz(self):
         """
         self._setup_sources()
 
-        run_command("cp %s/%s %s/" %
-                (self.rpmbuild_sourcedir, self.tgz_filename,
-                    self.rpmbuild_basedir))
+        copy_file(os.path.join(self.rpmbuild_sourcedir, self.tgz_filename),
+            self.rpmbuild_basedir)
 
         self.ran_tgz = True
         full_path = os.path.join(self.rpmbuild_basedir, self.tgz_filename)
@@ -593,13 +950,260 @@ def tgz(self):
 
     def rpm(self):
         """ Build an RPM. """
+        if self.incremental:
+            return self._incremental_rpm()
+        if self._resume("rpm"):
+            return
+        BuilderBase.rpm(self)
+
+    def _prepare_rpm(self):
         self._create_build_dirs()
         if not self.ran_tgz:
             self.tgz()
+        if self.test:
+            self._setup_test_specfile()
+        self.copy_extra_sources()
+
+    def _incremental_rpm(self):
+        """
+        Build binary RPMs in a build tree kept from the previous incremental
+        build of this package.
+
+        If only regular source files changed since then, they are copied
+        into the unpacked sources in BUILD and rpmbuild short-circuits
+        straight to %build, %install and packaging. Changes to the spec
+        file, to files it lists as Source or Patch, or to the build options
+        trigger a full build from scratch.
+
+        Short-circuited packages depend on rpmlib(ShortCircuited) and can
+        not be installed without --nodeps, they are meant for local testing
+        only.
+        """
+        state_file = os.path.join(self.rpmbuild_dir,
+            INCREMENTAL_STATE_FILENAME)
+        state = None
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                try:
+                    state = json.load(f)
+                except ValueError:
+                    debug("Ignoring unreadable %s" % state_file)
+
+        files = self._git_tree_files()
+        options = ArtifactCache.make_key(
+            dist=self.dist,
+            rpmbuild_options=self.rpmbuild_options,
+            scl=self.scl,
+            test_version_suffix=self.test_version_suffix,
+            builder="%s.%s" % (self.__class__.__module__,
+                self.__class__.__name__),
+            args=dict(self.args or {}),
+        )
+
+        reason = self._incremental_full_build_reason(state, files, options)
+        if reason:
+            info_out("Running a full build: %s" % reason)
+            srcdir = self._incremental_full_build()
+        else:
+            srcdir = self._incremental_sync(state, files)
+
+        # Recorded before the short-circuit build, its BUILD tree is already
+        # in sync with these files whether or not rpmbuild succeeds:
+        with open(state_file, "w") as f:
+            json.dump({
+                'options': options,
+                'files': files,
+                'tgz_dir': self.tgz_dir,
+                'tgz': self.tgz_filename,
+                'srcdir': srcdir,
+            }, f, indent=2)
+
+        if reason:
+            return
+
+        for stage in ["-bc", "-bi", "-bb"]:
+            output = self._run_rpmbuild("--short-circuit %s %s" % (stage,
+                self.spec_file))
+        files_written = find_wrote_in_rpmbuild_output(output)
+        if not files_written:
+            error_out("Error parsing rpmbuild output")
+        self.artifacts.extend(files_written)
+
+        print
+        info_out("Successfully built: %s" % '\n\t- '.join(files_written))
+
+    def _incremental_full_build_reason(self, state, files, options):
+        """
+        Return why the changes since the previous incremental build need a
+        full build, or None if short-circuiting to %build is sufficient.
+        """
+        if not state:
+            return "no previous incremental build"
+        if state.get('options') != options:
+            return "build options changed"
+        if not state.get('srcdir') or not os.path.isdir(
+                os.path.join(self.rpmbuild_builddir, state['srcdir'])):
+            return "previous build tree not found"
+
+        old_files = state.get('files', {})
+        specs = [path for path in files
+            if "/" not in path and path.endswith(".spec")]
+        if len(specs) != 1:
+            return "unable to locate the spec file"
+        spec = specs[0]
+        if old_files.get(spec) != files[spec]:
+            return "spec file changed"
+
+        changed = set(path for path in set(files) | set(old_files)
+            if files.get(path) != old_files.get(path))
+        if not changed:
+            return None
+        spec_sources = set(os.path.basename(source) for source in
+            SPEC_SOURCE_RE.findall(run_command("git -C %s cat-file blob %s"
+                % (self.git_root, files[spec].split()[2]))))
+        touched = sorted(path for path in changed
+            if os.path.basename(path) in spec_sources)
+        if touched:
+            return "sources or patches changed: %s" % ", ".join(touched)
+        return None
+
+    def _incremental_full_build(self):
+        """
+        Build from scratch in the incremental build dir. Returns the location
+        of the unpacked sources relative to BUILD, None if not found.
+        """
+        for build_dir in [self.rpmbuild_sourcedir, self.rpmbuild_builddir]:
+            if os.path.exists(build_dir):
+                shutil.rmtree(build_dir)
+        self._create_build_dirs()
+        self.tgz()
         if self.test:
             self._setup_test_specfile()
         BuilderBase.rpm(self)
 
+        # %setup unpacks into BUILD or, with newer rpm versions, into a
+        # per-package directory below it:
+        for root, dirs, _files in os.walk(self.rpmbuild_builddir):
+            if self.tgz_dir in dirs:
+                return os.path.relpath(os.path.join(root, self.tgz_dir),
+                    self.rpmbuild_builddir)
+            if root != self.rpmbuild_builddir:
+                dirs[:] = []
+        warn_out("Unable to find %s in %s, next build will be a full "
+            "build again" % (self.tgz_dir, self.rpmbuild_builddir))
+        return None
+
+    def _incremental_sync(self, state, files):
+        """
+        Bring the sources kept from the previous incremental build up to
+        date with the commit we're building. Returns the location of the
+        unpacked sources relative to BUILD.
+        """
+        old_files = state['files']
+        changed = sorted(path for path in files
+            if files[path] != old_files.get(path))
+        removed = sorted(path for path in old_files if path not in files)
+        info_out("Incremental build: %s files changed, %s removed" %
+            (len(changed), len(removed)))
+
+        # The test version is part of the directory names, follow it:
+        old_gitcopy = os.path.join(self.rpmbuild_sourcedir, state['tgz_dir'])
+        if old_gitcopy != self.rpmbuild_gitcopy:
+            os.rename(old_gitcopy, self.rpmbuild_gitcopy)
+        old_tgz = os.path.join(self.rpmbuild_sourcedir, state['tgz'])
+        if old_tgz != os.path.join(self.rpmbuild_sourcedir,
+                self.tgz_filename) and os.path.exists(old_tgz):
+            os.rename(old_tgz, os.path.join(self.rpmbuild_sourcedir,
+                self.tgz_filename))
+
+        spec = [path for path in files
+            if "/" not in path and path.endswith(".spec")][0]
+        # The spec copy was munged by the previous test build:
+        self._sync_git_files(sorted(set(changed + [spec])), removed,
+            self.rpmbuild_gitcopy)
+        self.spec_file_name = spec
+        self.spec_file = os.path.join(self.rpmbuild_gitcopy, spec)
+        if self.test:
+            self._setup_test_specfile()
+
+        # Newer rpm versions unpack into a per-package directory below BUILD
+        # named after the release, which changes along with the test version:
+        old_srcdir = os.path.join(self.rpmbuild_builddir, state['srcdir'])
+        package_dir = os.path.dirname(state['srcdir'])
+        if package_dir:
+            package_dir = self._package_build_dir()
+            old_package_dir = os.path.dirname(old_srcdir)
+            new_package_dir = os.path.join(self.rpmbuild_builddir,
+                package_dir)
+            if old_package_dir != new_package_dir:
+                os.rename(old_package_dir, new_package_dir)
+            old_srcdir = os.path.join(new_package_dir,
+                os.path.basename(old_srcdir))
+        srcdir = os.path.join(self.rpmbuild_builddir, package_dir,
+            self.tgz_dir)
+        if old_srcdir != srcdir:
+            os.rename(old_srcdir, srcdir)
+        self._sync_git_files(changed, removed, srcdir)
+        return os.path.relpath(srcdir, self.rpmbuild_builddir)
+
+    def _sync_git_files(self, changed, removed, dest):
+        """ Remove the removed files from dest and extract the changed. """
+        for path in removed:
+            if os.path.lexists(os.path.join(dest, path)):
+                os.remove(os.path.join(dest, path))
+        if changed:
+            self._extract_git_files(changed, dest)
+
+    def _package_build_dir(self):
+        """
+        Return the name of the per-package directory rpm >= 4.20 unpacks
+        sources into, %{name}-%{version}-%{release}-build.
+        """
+        nvr = run_command("rpm -q --qf '%%{name}-%%{version}-%%{release}\n' "
+            "%s --define '_sourcedir %s' %s --specfile %s 2> /dev/null | "
+            "grep -e '^$' -v | head -1" % (self._scl_to_rpmbuild_option(),
+                self.rpmbuild_sourcedir, "--define 'dist %s'" % self.dist
+                if self.dist else "", self.spec_file))
+        if not nvr:
+            error_out("Unable to determine the build directory of %s, try "
+                "without --incremental" % self.spec_file)
+        return "%s-build" % nvr
+
+    def _extract_git_files(self, paths, dest):
+        """
+        Write the given files of the project directory, as of the commit
+        we're building, into dest.
+        """
+        debug("Extracting %s into %s" % (paths, dest))
+        run_command("git -C %s archive --format=tar %s:%s -- %s | "
+            "tar -xf - -C %s" % (self.git_root, self.git_commit_id,
+                self._git_tree_path(), " ".join(shlex.quote(path)
+                    for path in paths), dest))
+
+    def _git_tree_path(self):
+        """
+        Return the project directory relative to the git root, as used in
+        <commit>:<path> git tree references.
+        """
+        tree_path = self.relative_project_dir.strip("/")
+        if tree_path in ("", "."):
+            tree_path = ""
+        return tree_path
+
+    def _git_tree_files(self):
+        """
+        Return a dictionary mapping each file in the project directory, as
+        of the commit we're building, to its git mode, type and object id.
+        """
+        output = run_command("git -C %s ls-tree -r -z %s:%s" % (
+            self.git_root, self.git_commit_id, self._git_tree_path()))
+        files = {}
+        for entry in output.split("\0"):
+            if entry:
+                meta, path = entry.split("\t", 1)
+                files[path] = meta
+        return files
+
     def _setup_sources(self):
         """
         Create a copy of the git source for the project at the point in time
@@ -609,11 +1213,16 @@ def _setup_sources(self):
         """
         self._create_build_dirs()
 
-        debug("Creating %s from git tag: %s..." % (self.tgz_filename,
-            self.git_commit_id))
-        create_tgz(self.git_root, self.tgz_dir, self.git_commit_id,
-                self.relative_project_dir,
-                os.path.join(self.rpmbuild_sourcedir, self.tgz_filename))
+        tgz_path = os.path.join(self.rpmbuild_sourcedir, self.tgz_filename)
+
+        def build():
+            debug("Creating %s from git tag: %s..." % (self.tgz_filename,
+                self.git_commit_id))
+            create_tgz(self.git_root, self.tgz_dir, self.git_commit_id,
+                    self.relative_project_dir, tgz_path)
+            return [tgz_path]
+        self._obtain_from_broker(self._broker_key("sources"),
+            self.rpmbuild_sourcedir, build)
 
         # Extract the source so we can get at the spec file, etc.
         debug("Copying git source to: %s" % self.rpmbuild_gitcopy)
@@ -631,6 +1240,145 @@ def _setup_sources(self):
         self.spec_file = os.path.join(
             self.rpmbuild_gitcopy, self.spec_file_name)
 
+    def _broker_key(self, stage, dist=None):
+        """
+        Builders of one invocation share the tarball of a commit, and source
+        RPMs built from it with the same options.
+        """
+        key = dict(
+            stage=stage,
+            commit=self.git_commit_id,
+            project_dir=self.relative_project_dir,
+            tgz=self.tgz_filename,
+            test=self.test,
+            builder="%s.%s" % (self.__class__.__module__,
+                self.__class__.__name__),
+        )
+        if stage != "sources":
+            key.update(
+                dist=dist or '',
+                scl=self.scl,
+                rpmbuild_options=self.rpmbuild_options,
+                args=dict(self.args or {}),
+            )
+        return ArtifactCache.make_key(**key)
+
+    def _cache_key(self, stage, dist=None):
+        """
+        Key the artifact cache on the git tree of the project directory,
+        whatever goes into munging the spec file of test builds, the packages
+        installed on the build host and every option that influences what
+        rpmbuild produces.
+
+        The key only depends on git and the build options, so it can be
+        looked up before the sources are prepared.
+        """
+        if not self.CACHEABLE or self.artifact_cache is None:
+            return None
+
+        try:
+            tree_id = run_command("git -C %s rev-parse %s:%s" % (
+                self.git_root, self.git_commit_id, self._git_tree_path()))
+        except RunCommandException:
+            debug("Unable to determine git tree, not using artifact cache")
+            return None
+
+        buildroot = self._buildroot_fingerprint()
+        if buildroot is None:
+            debug("Unable to read the rpm database, not using artifact cache")
+            return None
+
+        test_version = None
+        if self.test:
+            # The spec of the tree gets the commit in its release:
+            test_version = dict(
+                commit=self.git_commit_id,
+                commit_count=self.commit_count,
+                test_version_suffix=self.test_version_suffix,
+            )
+
+        builder_class = "%s.%s" % (self.__class__.__module__,
+            self.__class__.__name__)
+        return ArtifactCache.make_key(
+            stage=stage,
+            tree=tree_id.strip(),
+            test_version=test_version,
+            tgz=self.tgz_filename,
+            buildroot=buildroot,
+            # Without an explicit dist, rpmbuild falls back to the host's:
+            dist=dist or rpm.expandMacro("%{?dist}"),
+            arch=rpm.expandMacro("%{_arch}"),
+            rpmbuild_options=self.rpmbuild_options,
+            scl=self.scl,
+            builder=builder_class,
+            args=dict(self.args or {}),
+        )
+
+    def _buildroot_fingerprint(self):
+        """
+        Identify the packages installed on this host, rpmbuild builds with
+        whatever compilers, macros and BuildRequires are installed here.
+        Returns None if the rpm database can not be read.
+        """
+        try:
+            # Changes whenever a package is installed, updated or removed:
+            return rpm.TransactionSet().dbCookie()
+        except (AttributeError, rpm.error):
+            pass
+        try:
+            output = run_command("rpm -qa --qf '%{NEVRA}\\n'")
+        except RunCommandException:
+            return None
+        packages = "\n".join(sorted(output.splitlines()))
+        return hashlib.sha256(packages.encode('utf-8')).hexdigest()
+
+    def _build_state_key(self):
+        return ArtifactCache.make_key(
+            commit=self.git_commit_id,
+            project_dir=self.relative_project_dir,
+            test=self.test,
+            test_version_suffix=self.test_version_suffix,
+            dist=self.dist,
+            rpmbuild_options=self.rpmbuild_options,
+            scl=self.scl,
+            builder="%s.%s" % (self.__class__.__module__,
+                self.__class__.__name__),
+            args=dict(self.args or {}),
+        )
+
+    def _record_sources(self):
+        """
+        Record the tarball and a copy of the (possibly munged) spec file, the
+        temporary build directory they were prepared in is gone once the
+        build fails.
+        """
+        tgz = os.path.join(self.rpmbuild_basedir, self.tgz_filename)
+        if self.build_state is None or not os.path.exists(tgz):
+            return
+        spec_copy = self.build_state.file_path(self.spec_file_name)
+        copy_file(self.spec_file, spec_copy)
+        self._record_stage("sources", [tgz, spec_copy],
+            spec_file_name=self.spec_file_name,
+            build_version=self.build_version)
+
+    def _restore_sources(self, entry):
+        tgz, spec_copy = [recorded['path'] for recorded in entry['files']]
+        self._create_build_dirs()
+        copy_file(tgz, self.rpmbuild_sourcedir)
+        run_command("cd %s/ && tar xzf %s" % (self.rpmbuild_sourcedir,
+            os.path.basename(tgz)))
+        self.spec_file_name = entry['spec_file_name']
+        self.spec_file = os.path.join(self.rpmbuild_gitcopy,
+            self.spec_file_name)
+        copy_file(spec_copy, self.spec_file)
+        # The recorded spec file is already set up for a test build:
+        self.build_version = entry['build_version']
+        self.ran_setup_test_specfile = True
+        self.ran_tgz = True
+        self.sources.append(tgz)
+        self.artifacts.append(tgz)
+        return True
+
     def _setup_test_specfile(self):
         if self.test and not self.ran_setup_test_specfile:
             # If making a test rpm we need to get a little crazy with the spec
@@ -689,6 +1437,11 @@ class NoTgzBuilder(Builder):
     Builder for packages that do not require the creation of a tarball.
     Usually these packages have source tarballs checked directly into git.
     """
+    SUPPORTS_INCREMENTAL = False
+
+    def _record_sources(self):
+        # No tarball of our own, resuming starts from the srpm at the earliest.
+        pass
 
     def tgz(self):
         """ Override parent behavior, we already have a tgz. """
@@ -794,6 +1547,9 @@ class UpstreamBuilder(NoTgzBuilder):
     i.e. spacewalk-setup-0.4.0-20 built from spacewalk-setup-0.4.0-1 and any
     patches applied in satellite git.
     """
+    # Patches are generated against the upstream tag, which the cache key
+    # does not cover:
+    CACHEABLE = False
 
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -840,9 +1596,8 @@ def tgz(self):
 
         self.spec_file = os.path.join(self.rpmbuild_sourcedir,
                 self.spec_file_name)
-        command = "cp %s %s" % (os.path.join(self.rpmbuild_gitcopy,
-            self.spec_file_name), self.spec_file)
-        run_command(command)
+        copy_file(os.path.join(self.rpmbuild_gitcopy, self.spec_file_name),
+            self.spec_file)
 
         # Create the upstream tgz:
         prefix = "%s-%s" % (self.upstream_name, self.upstream_version)
@@ -940,7 +1695,7 @@ def patch_upstream(self):
         # just out of laziness. Some builders need sources in SOURCES and
         # others need them in the git copy. Being lazy here avoids one-off
         # hacks and both copies get cleaned up anyhow.
-        run_command("cp %s %s" % (patch_file, self.rpmbuild_sourcedir))
+        copy_file(patch_file, self.rpmbuild_sourcedir)
 
         (patch_number, patch_insert_index, patch_apply_index, lines) = self._patch_upstream()
 
@@ -1001,6 +1756,10 @@ class SatelliteBuilder(UpstreamBuilder):
 
 
 class MeadBuilder(Builder):
+    # Sources come out of a maven build with external dependencies:
+    CACHEABLE = False
+    SUPPORTS_INCREMENTAL = False
+
     def __init__(self, name=None, tag=None, build_dir=None,
         config=None, user_config=None, args=None, **kwargs):
 
@@ -1088,10 +1847,10 @@ def tgz(self):
             full_path = os.path.join(self.rpmbuild_sourcedir, self.tgz_filename)
             create_tgz(self.git_root, self.tgz_dir, self.git_commit_id, self.relative_project_dir, full_path)
             print("Creating %s from git tag: %s..." % (self.tgz_filename, self.build_tag))
-            shutil.copy(full_path, destination_file)
+            copy_file(full_path, destination_file)
 
         debug("Copying git source to: %s" % self.rpmbuild_gitcopy)
-        shutil.copy(destination_file, self.rpmbuild_gitcopy)
+        copy_file(destination_file, self.rpmbuild_gitcopy)
 
         # Extract the source so we can get at the spec file, etc.
         with chdir(self.rpmbuild_gitcopy):
@@ -1109,7 +1868,7 @@ def tgz(self):
 
                 # Place the Maven artifacts in the SOURCES directory for rpmbuild to use
                 for artifact in dir_artifacts_with_path:
-                    shutil.copy(artifact, self.rpmbuild_sourcedir)
+                    copy_file(artifact, self.rpmbuild_sourcedir)
 
                 dir_artifacts_with_path = map(lambda x: os.path.relpath(x, self.deploy_dir), dir_artifacts_with_path)
                 all_artifacts_with_path.extend(dir_artifacts_with_path)
@@ -1158,6 +1917,7 @@ class MockBuilder(Builder):
     OS version than you may be currently using.
     """
     REQUIRED_ARGS = ['mock']
+    SUPPORTS_INCREMENTAL = False
 
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -1181,15 +1941,32 @@ def __init__(self, name=None, tag=None, build_dir=None,
             and "builder" in config
             and "mock" in config["builder"]
             ):
-            args["mock"] = [config.get("builder", "mock")]
+            args["mock"] = config.get("builder", "mock").split()
 
         Builder.__init__(self, name=name, tag=tag,
                 build_dir=build_dir, config=config,
                 user_config=user_config,
                 args=args, **kwargs)
 
-        self.mock_tag = args['mock'][0]
+        # Every mock= argument is one chroot to build in, the first one is
+        # kept as mock_tag for compatibility:
+        self.mock_tags = []
+        for mock_tag in args['mock']:
+            if mock_tag not in self.mock_tags:
+                self.mock_tags.append(mock_tag)
+        self.mock_tag = self.mock_tags[0]
+
+        # How many chroots may build at the same time:
+        self.mock_jobs = min(len(self.mock_tags), os.cpu_count() or 1)
+        if 'mock_jobs' in args:
+            try:
+                self.mock_jobs = max(1, int(args['mock_jobs'][0]))
+            except ValueError:
+                raise TitoException("Invalid mock_jobs: %s" %
+                    args['mock_jobs'][0])
+
         self.mock_cmd_args = ""
+        self.mock_config_dir = None
         if 'mock_config_dir' in args:
             mock_config_dir = args['mock_config_dir'][0]
             if not mock_config_dir.startswith("/"):
@@ -1197,8 +1974,20 @@ def __init__(self, name=None, tag=None, build_dir=None,
                 mock_config_dir = os.path.join(self.git_root, mock_config_dir)
             if not os.path.exists(mock_config_dir):
                 raise TitoException("No such mock config dir: %s" % mock_config_dir)
+            self.mock_config_dir = mock_config_dir
             self.mock_cmd_args = "%s --configdir=%s" % (self.mock_cmd_args, mock_config_dir)
 
+        # Mock roots are reused between builds while their config and the
+        # package's BuildRequires stay the same, but never for longer than
+        # this many hours:
+        self.mock_max_age = DEFAULT_MOCK_MAX_AGE
+        if 'mock_max_age' in args:
+            try:
+                self.mock_max_age = float(args['mock_max_age'][0])
+            except ValueError:
+                raise TitoException("Invalid mock_max_age: %s" %
+                    args['mock_max_age'][0])
+
         # Optional argument which will skip mock --init and add --no-clean
         # and --no-cleanup-after:
         self.speedup = False
@@ -1226,6 +2015,19 @@ def srpm(self, dist=None):
         self.srpm_location = self.normal_builder.srpm_location
         self.artifacts.append(self.srpm_location)
 
+    def build_srpms(self, variants):
+        """ Build all source RPMs with the normal builder. """
+        srpms = self.normal_builder.build_srpms(variants)
+        self.srpm_location = self.normal_builder.srpm_location
+        for srpm_location in srpms.values():
+            if srpm_location not in self.artifacts:
+                self.artifacts.append(srpm_location)
+        return srpms
+
+    def _build_state_key(self):
+        # Builds happen in mock roots, there are no stages to resume:
+        return None
+
     def rpm(self):
         """
         Uses the SRPM
@@ -1233,42 +2035,272 @@ def rpm(self):
         """
 
         print("Creating rpms for %s-%s in mock: %s" % (
-            self.project_name, self.display_version, self.mock_tag))
+            self.project_name, self.display_version,
+            ", ".join(self.mock_tags)))
         if not self.srpm_location:
             self.srpm()
         print("Using srpm: %s" % self.srpm_location)
-        self._build_in_mock()
+
+        if len(self.mock_tags) == 1:
+            self.artifacts.extend(self._build_in_mock(self.mock_tag))
+            return
+        self._build_in_mock_chroots()
 
     def cleanup(self):
         if self.normal_builder:
             self.normal_builder.cleanup()
 
-    def _build_in_mock(self):
-        run_command_func = run_command if self.quiet else run_command_print
-        if not self.speedup:
-            print("Initializing mock...")
-            run_command_func("mock %s -r %s --init" % (self.mock_cmd_args, self.mock_tag))
-        else:
-            print("Skipping mock --init due to speedup option.")
+    def _build_in_mock_chroots(self):
+        """
+        Build the srpm in all requested chroots at once, at most mock_jobs
+        of them running concurrently. Results of each chroot land in their
+        own sub-directory of the output directory.
+        """
+        info_out("Building in %s mock chroots, %s at a time..." % (
+            len(self.mock_tags), self.mock_jobs))
+
+        # A root of our own for each chroot, so parallel builds never share
+        # one with each other or with other mock invocations:
+        uniqueext = "tito-%s" % self.project_name
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.mock_jobs) as executor:
+            futures = {}
+            for mock_tag in self.mock_tags:
+                output_dir = os.path.join(self.rpmbuild_basedir,
+                    self._mock_dir_name(mock_tag))
+                futures[mock_tag] = executor.submit(self._timed_build_in_mock,
+                    mock_tag, output_dir, uniqueext)
+            for mock_tag in self.mock_tags:
+                results[mock_tag] = futures[mock_tag].result()
+
+        failed = []
+        info_out("Mock build results:")
+        for mock_tag in self.mock_tags:
+            rpms, error, duration = results[mock_tag]
+            if error:
+                failed.append(mock_tag)
+                print("  %-30s FAILED     %5ds  %s" % (mock_tag, duration,
+                    error.command))
+            else:
+                print("  %-30s succeeded  %5ds  %s rpms" % (mock_tag,
+                    duration, len(rpms)))
+                self.artifacts.extend(rpms)
+
+        for mock_tag in failed:
+            error = results[mock_tag][1]
+            output = error.output.strip().split("\n")
+            warn_out(["Build in %s failed, last lines of output:" % mock_tag]
+                + output[-20:])
+        if failed:
+            error_out("Mock build failed in: %s" % ", ".join(failed))
+
+    def _timed_build_in_mock(self, mock_tag, output_dir, uniqueext):
+        """
+        Build in a single chroot on behalf of _build_in_mock_chroots().
 
-        print("Building RPMs in mock...")
-        run_command_func('mock %s -r %s --rebuild %s' %
-                (self.mock_cmd_args, self.mock_tag, self.srpm_location))
-        mock_output_dir = os.path.join(self.rpmbuild_dir, "mockoutput")
-        run_command_func("mock %s -r %s --copyout /builddir/build/RPMS/ %s" %
-                (self.mock_cmd_args, self.mock_tag, mock_output_dir))
+        Returns a (rpms, error, duration) tuple, error being the
+        RunCommandException of the failed mock command, if any.
+        """
+        start = time.time()
+        rpms = []
+        error = None
+        try:
+            rpms = self._build_in_mock(mock_tag, output_dir, uniqueext,
+                quiet=True)
+        except RunCommandException as e:
+            error = e
+        return (rpms, error, time.time() - start)
+
+    def _build_in_mock(self, mock_tag=None, output_dir=None, uniqueext=None,
+            quiet=None):
+        """
+        Build the srpm in the given chroot and copy the resulting rpms into
+        output_dir.
 
-        # Copy everything mock wrote out to /tmp/tito:
-        files = os.listdir(mock_output_dir)
-        for rpm in files:
-            shutil.copy2(os.path.join(mock_output_dir, rpm), self.rpmbuild_basedir)
+        Returns the list of rpms written.
+        """
+        mock_tag = mock_tag or self.mock_tag
+        output_dir = output_dir or self.rpmbuild_basedir
+        if quiet is None:
+            quiet = self.quiet
+        run_command_func = run_command if quiet else run_command_print
+
+        mock = "mock %s -r %s" % (self.mock_cmd_args, mock_tag)
+        if uniqueext:
+            mock = "%s --uniqueext=%s" % (mock, uniqueext)
+
+        rebuild_args = self._prepare_mock_root(mock, mock_tag,
+            run_command_func)
+
+        # Have mock write its results straight into our temp dir, which is
+        # on the same filesystem as the output dir:
+        result_dir = os.path.join(self.rpmbuild_dir,
+            "mockresult-%s" % self._mock_dir_name(mock_tag))
+        print("Building RPMs in mock %s..." % mock_tag)
+        run_command_func('%s %s --resultdir=%s --rebuild %s' % (mock,
+            rebuild_args, result_dir, self.srpm_location))
+
+        mkdir_p(output_dir)
+        rpms = []
+        for rpm in self._find_mock_results(result_dir):
+            rpm_path = os.path.join(output_dir, rpm)
+            # Nothing rewrites the results in place, rpmsign and
+            # createrepo write new files:
+            copy_file(os.path.join(result_dir, rpm), rpm_path,
+                allow_link=True, preserve=True)
+            rpms.append(rpm_path)
         print
-        info_out("Wrote:")
-        for rpm in files:
-            rpm_path = os.path.join(self.rpmbuild_basedir, rpm)
+        info_out("Wrote (%s):" % mock_tag)
+        for rpm_path in rpms:
             print("  %s" % rpm_path)
-            self.artifacts.append(rpm_path)
         print
+        return rpms
+
+    def _mock_dir_name(self, mock_tag):
+        """
+        Return a directory name for the chroot, which may be given as the
+        path of its config file.
+        """
+        name = os.path.basename(mock_tag)
+        if name.endswith(".cfg"):
+            name = name[:-len(".cfg")]
+        return name
+
+    def _find_mock_results(self, result_dir):
+        """
+        Return the file names of binary rpms mock built into result_dir.
+
+        Taken from the rpmbuild "Wrote:" lines in mock's build.log, falling
+        back to all binary rpms in result_dir if the log is not there.
+        """
+        build_log = os.path.join(result_dir, "build.log")
+        rpms = []
+        if os.path.exists(build_log):
+            with open(build_log) as f:
+                for path in MOCK_WROTE_RE.findall(f.read()):
+                    rpm = os.path.basename(path)
+                    if rpm not in rpms and \
+                            os.path.exists(os.path.join(result_dir, rpm)):
+                        rpms.append(rpm)
+        if not rpms:
+            debug("No 'Wrote:' lines in %s, scanning result dir" % build_log)
+            rpms = sorted(f for f in os.listdir(result_dir)
+                if f.endswith(".rpm"))
+        return [rpm for rpm in rpms if not rpm.endswith(".src.rpm")]
+
+    def _prepare_mock_root(self, mock, mock_tag, run_command_func):
+        """
+        Make sure the mock root is ready to build in.
+
+        A root initialized for the same mock config and BuildRequires is
+        reused as is, as long as it is not older than mock_max_age. Otherwise
+        it is scrubbed and initialized from scratch. The speedup argument
+        skips all of this and never initializes the root.
+
+        Returns additional arguments for the mock build command.
+        """
+        if self.speedup:
+            print("Skipping mock --init due to speedup option.")
+            return ""
+
+        state_file = self._mock_state_file(mock)
+        state = self._read_mock_state(state_file)
+        fingerprint = self._mock_fingerprint(mock_tag)
+        if not self.no_cache and self._mock_root_is_fresh(state, fingerprint):
+            print("Mock root for %s is up to date, skipping --init." %
+                mock_tag)
+        else:
+            if state:
+                print("Mock root for %s is outdated, scrubbing..." % mock_tag)
+                run_command_func("%s --scrub=chroot" % mock)
+            print("Initializing mock %s..." % mock_tag)
+            run_command_func("%s --init" % mock)
+            root_path = run_command("%s --print-root-path" % mock)
+            self._write_mock_state(state_file, {
+                'fingerprint': fingerprint,
+                'initialized': time.time(),
+                'root': root_path.strip().split("\n")[-1],
+            })
+
+        # Keep the root around (and as it is) for the next build:
+        return "--no-clean --no-cleanup-after"
+
+    def _mock_root_is_fresh(self, state, fingerprint):
+        """
+        Check whether a mock root recorded in state can be reused for a
+        build with the given fingerprint.
+        """
+        if not state or state.get('fingerprint') != fingerprint:
+            return False
+        age = time.time() - state.get('initialized', 0)
+        if age > self.mock_max_age * 3600:
+            debug("Mock root is %d seconds old, too old to reuse" % age)
+            return False
+        return os.path.isdir(state.get('root') or '')
+
+    def _mock_fingerprint(self, mock_tag):
+        """
+        Fingerprint everything that determines the contents of a freshly
+        initialized mock root: the mock config (including the files it
+        includes), mock arguments and the BuildRequires of our srpm.
+        """
+        fingerprint = hashlib.sha256()
+        fingerprint.update(self.mock_cmd_args.encode("utf-8"))
+        for config_file in self._mock_config_files(mock_tag):
+            fingerprint.update(config_file.encode("utf-8"))
+            with open(config_file, 'rb') as f:
+                fingerprint.update(f.read())
+
+        requires = run_command("rpm -qp --requires %s" % self.srpm_location)
+        requires = sorted(set(line.strip() for line in requires.split("\n")))
+        fingerprint.update("\n".join(requires).encode("utf-8"))
+        return fingerprint.hexdigest()
+
+    def _mock_config_files(self, mock_tag):
+        """
+        Return the mock config files used for the given chroot, following
+        include() statements.
+        """
+        config_dir = self.mock_config_dir or "/etc/mock"
+        if mock_tag.endswith(".cfg"):
+            main_config = os.path.abspath(mock_tag)
+        else:
+            main_config = os.path.join(config_dir, "%s.cfg" % mock_tag)
+
+        candidates = [
+            os.path.join(config_dir, "site-defaults.cfg"),
+            main_config,
+            os.path.expanduser("~/.config/mock.cfg"),
+        ]
+        config_files = []
+        while candidates:
+            config_file = candidates.pop(0)
+            if config_file in config_files or not os.path.isfile(config_file):
+                continue
+            config_files.append(config_file)
+            with open(config_file) as f:
+                for include in MOCK_INCLUDE_RE.findall(f.read()):
+                    candidates.append(os.path.join(config_dir, include))
+        return config_files
+
+    def _mock_state_file(self, mock):
+        """ Where we keep track of the root used by the given mock command. """
+        key = hashlib.sha256(mock.encode("utf-8")).hexdigest()
+        return os.path.join(get_cache_dir(self.user_config), "mock",
+            "%s.json" % key)
+
+    def _read_mock_state(self, state_file):
+        try:
+            with open(state_file) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_mock_state(self, state_file, state):
+        mkdir_p(os.path.dirname(state_file))
+        with open(state_file, 'w') as f:
+            json.dump(state, f)
 
 
 class BrewDownloadBuilder(Builder):
@@ -1278,6 +2310,7 @@ class BrewDownloadBuilder(Builder):
     generating yum repositories during a release.
     """
     REQUIRED_ARGS = ['disttag']
+    SUPPORTS_INCREMENTAL = False
 
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -1311,8 +2344,10 @@ def _fetch_from_brew(self):
 
         # Copy everything brew downloaded out to /tmp/tito:
         files = os.listdir(self.rpmbuild_dir)
-        run_command("cp -v %s/*.rpm %s" %
-                (self.rpmbuild_dir, self.rpmbuild_basedir))
+        for rpm in files:
+            if rpm.endswith(".rpm"):
+                copy_file(os.path.join(self.rpmbuild_dir, rpm),
+                    self.rpmbuild_basedir)
         print
         info_out("Wrote:")
         for rpm in files:
@@ -1354,7 +2389,7 @@ def _setup_sources(self):
         for annex in annexed_files:
             debug("Copying unlocked file %s" % annex)
             os.remove(os.path.join(self.rpmbuild_gitcopy, annex))
-            shutil.copy(annex, self.rpmbuild_gitcopy)
+            copy_file(annex, self.rpmbuild_gitcopy)
 
         self._lock()
         os.chdir(self.old_cwd)
@@ -1410,7 +2445,7 @@ def _setup_sources(self):
                 debug("Copying file %s " % mstr)
                 debug("To %s " % self.rpmbuild_gitcopy)
                 os.remove(os.path.join(self.rpmbuild_gitcopy, mstr))
-                shutil.copy(mstr, self.rpmbuild_gitcopy)
+                copy_file(mstr, self.rpmbuild_gitcopy)
 
         os.chdir(self.old_cwd)
 
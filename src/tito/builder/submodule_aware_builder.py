@@ -39,6 +39,8 @@ class SubmoduleAwareBuilder(Builder):
     """
 
     REQUIRED_ARGS = []
+    # Submodule contents are not part of the project's git tree:
+    SUPPORTS_INCREMENTAL = False
 
     def _setup_sources(self):
         """
@@ -0,0 +1,99 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Manifest of the stages a build got through, so a failed build can be resumed
+with tito build --resume instead of starting over.
+"""
+
+import json
+import os
+
+from tito.common import debug, file_checksum, mkdir_p
+
+# Build stages in the order they run. Recording a stage invalidates all
+# stages after it:
+STAGES = ["sources", "srpm", "rpm"]
+
+
+class BuildState(object):
+    """
+    Stages completed by the last build of a package, with checksums of the
+    files each of them produced.
+
+    The manifest is only valid for the build inputs it was written for,
+    identified by key. Loading it for different inputs starts a new, empty
+    one.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.stages = {}
+
+    @classmethod
+    def load(cls, path, key):
+        state = cls(path, key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return state
+        if data.get('key') != key:
+            debug("Build inputs changed since %s was written" % path)
+            return state
+        state.stages = data.get('stages', {})
+        return state
+
+    def file_path(self, name):
+        """
+        Return a location next to the manifest to keep a copy of a file
+        which would otherwise only live in a temporary directory.
+        """
+        return os.path.join(os.path.dirname(self.path), "%s-%s" % (
+            os.path.splitext(os.path.basename(self.path))[0], name))
+
+    def record(self, stage, paths, **info):
+        """
+        Mark stage as done, producing the given files. Extra information
+        needed to resume from this stage can be passed as keyword arguments.
+        """
+        entry = dict(info)
+        entry['files'] = [{'path': os.path.abspath(path),
+            'sha256': file_checksum(path)} for path in paths]
+        self.stages[stage] = entry
+        for later in STAGES[STAGES.index(stage) + 1:]:
+            self.stages.pop(later, None)
+        self.save()
+
+    def verified(self, stage):
+        """
+        Return the recorded entry for stage if all of its files still exist
+        unmodified, otherwise None.
+        """
+        entry = self.stages.get(stage)
+        if not entry:
+            return None
+        for recorded in entry['files']:
+            path = recorded['path']
+            if not os.path.isfile(path) or \
+                    file_checksum(path) != recorded['sha256']:
+                debug("%s of stage %s is missing or modified" % (path, stage))
+                return None
+        return entry
+
+    def save(self):
+        mkdir_p(os.path.dirname(self.path))
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, "w") as f:
+            json.dump({'key': self.key, 'stages': self.stages}, f, indent=2)
+        os.rename(tmp_path, self.path)
@@ -0,0 +1,303 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Cache of previously built artifacts, so repeated builds of unchanged inputs
+can skip rpmbuild entirely.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from tito.common import copy_file, debug, file_lock, get_cache_dir, \
+    mkdir_p
+
+# Default upper bound for the size of the artifact cache (2 GiB):
+DEFAULT_CACHE_MAX_SIZE = 2 * 1024 ** 3
+
+MANIFEST_FILENAME = "manifest.json"
+
+SIZE_SUFFIXES = {
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4,
+}
+
+
+def parse_size(value):
+    """
+    Convert a human readable size such as "500M" or "2G" into bytes.
+    Plain numbers are taken as bytes.
+    """
+    value = str(value).strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    multiplier = 1
+    if value and value[-1] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[value[-1]]
+        value = value[:-1]
+    try:
+        return int(float(value) * multiplier)
+    except ValueError:
+        raise ValueError("Invalid size: %s" % value)
+
+
+class ArtifactCache(object):
+    """
+    A directory of build results keyed by a hash of all inputs that went
+    into producing them.
+
+    Every entry is a directory named after its key, holding copies of the
+    artifacts plus a manifest listing them relative to the output directory
+    they were originally written to. Entries are least recently used first
+    when the cache grows over its size limit.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_MAX_SIZE):
+        self.cache_dir = os.path.join(cache_dir, "artifacts")
+        self.max_size = max_size
+
+    @classmethod
+    def from_user_config(cls, user_config):
+        """
+        Create a cache using CACHE_DIR and CACHE_MAX_SIZE from ~/.titorc,
+        if set.
+        """
+        user_config = user_config or {}
+        max_size = DEFAULT_CACHE_MAX_SIZE
+        if 'CACHE_MAX_SIZE' in user_config:
+            max_size = parse_size(user_config['CACHE_MAX_SIZE'])
+        return cls(get_cache_dir(user_config), max_size)
+
+    @staticmethod
+    def make_key(**inputs):
+        """
+        Return a stable key for the given build inputs. Values must be
+        serializable to JSON.
+        """
+        blob = json.dumps(inputs, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        """
+        Return the list of artifacts (relative paths) stored for the key, or
+        None if there is no complete entry for it.
+        """
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, MANIFEST_FILENAME)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        files = manifest.get("files", [])
+        for rel_path in files:
+            if not os.path.isfile(os.path.join(entry_dir, "files", rel_path)):
+                debug("Cache entry %s is incomplete, ignoring" % key)
+                return None
+
+        # Mark the entry as recently used, eviction goes by this mtime:
+        os.utime(manifest_path, None)
+        return files
+
+    def restore(self, key, dest_dir):
+        """
+        Copy the artifacts stored for the key into dest_dir, recreating
+        the directory layout they were stored with.
+
+        Returns the list of full paths restored, or None on a cache miss.
+        """
+        if not self.enabled:
+            return None
+        files = self.lookup(key)
+        if not files:
+            return None
+
+        restored = []
+        for rel_path in files:
+            src = os.path.join(self._entry_dir(key), "files", rel_path)
+            dst = os.path.join(dest_dir, rel_path)
+            mkdir_p(os.path.dirname(dst))
+            debug("Restoring %s -> %s" % (src, dst))
+            copy_file(src, dst, preserve=True)
+            restored.append(dst)
+        return restored
+
+    def store(self, key, base_dir, paths):
+        """
+        Store copies of the given artifacts under key. All paths must be
+        located below base_dir, they are restored relative to it later.
+
+        Returns True if the artifacts were stored.
+        """
+        if not self.enabled or not paths:
+            return False
+
+        base_dir = os.path.abspath(base_dir)
+        rel_paths = []
+        for path in paths:
+            rel_path = os.path.relpath(os.path.abspath(path), base_dir)
+            if rel_path.startswith(os.pardir):
+                debug("Not caching artifacts, %s is outside of %s" %
+                      (path, base_dir))
+                return False
+            rel_paths.append(rel_path)
+
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+        mkdir_p(self.cache_dir)
+        # Populate a temporary directory and rename it in place once
+        # complete, so concurrent builds never see a half written entry:
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for path, rel_path in zip(paths, rel_paths):
+                dst = os.path.join(tmp_dir, "files", rel_path)
+                mkdir_p(os.path.dirname(dst))
+                copy_file(path, dst, preserve=True)
+            with open(os.path.join(tmp_dir, MANIFEST_FILENAME), "w") as f:
+                json.dump({"files": rel_paths}, f, indent=2)
+            os.rename(tmp_dir, entry_dir)
+        except (IOError, OSError) as e:
+            debug("Unable to store artifacts in cache: %s" % e)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        debug("Stored %s in cache entry %s" % (rel_paths, key))
+        self.evict()
+        return True
+
+    def _entries(self):
+        """
+        Return a list of (last_used, size, path) tuples for all entries.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            manifest_path = os.path.join(entry_dir, MANIFEST_FILENAME)
+            if name.startswith(".") or not os.path.isfile(manifest_path):
+                continue
+            size = 0
+            for root, _dirs, files in os.walk(entry_dir):
+                for f in files:
+                    size += os.path.getsize(os.path.join(root, f))
+            entries.append((os.path.getmtime(manifest_path), size, entry_dir))
+        return entries
+
+    def size(self):
+        """ Total size of all cache entries in bytes. """
+        return sum(size for _used, size, _path in self._entries())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits into
+        its size limit.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _used, size, _path in entries)
+        for _used, size, entry_dir in entries:
+            if total <= self.max_size:
+                break
+            debug("Evicting cache entry: %s" % entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+
+class ArtifactBroker(object):
+    """
+    Artifacts built during a single tito invocation, shared between all
+    builders asking for the same thing.
+
+    tito release creates one broker for all of its release targets, so the
+    tarball and source RPM of a package are built once no matter how many
+    targets need them. Targets may be released in separate processes, so
+    every key is guarded by a file lock: the first builder to ask produces
+    the artifacts while the others wait for them and then get copies.
+    """
+
+    def __init__(self, broker_dir):
+        self.broker_dir = broker_dir
+
+    @classmethod
+    def create(cls, build_dir):
+        """ Create a broker in a new temporary directory below build_dir. """
+        mkdir_p(build_dir)
+        return cls(tempfile.mkdtemp(dir=build_dir, prefix="tito-broker-"))
+
+    def obtain(self, key, dest_dir, build):
+        """
+        Return the artifacts for key, placed in dest_dir.
+
+        If no builder produced them yet, build is called and has to return
+        the list of full paths it wrote. Otherwise copies of the earlier
+        results are written to dest_dir instead.
+
+        Returns a tuple of the list of paths and whether build was called.
+        """
+        entry_dir = os.path.join(self.broker_dir, key)
+        with file_lock(os.path.join(self.broker_dir, "%s.lock" % key)):
+            files = self._lookup(entry_dir)
+            if files is not None:
+                return self._restore(entry_dir, files, dest_dir), False
+
+            paths = build()
+            self._store(entry_dir, paths)
+            return paths, True
+
+    def _lookup(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, MANIFEST_FILENAME)) as f:
+                return json.load(f)["files"]
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def _restore(self, entry_dir, files, dest_dir):
+        mkdir_p(dest_dir)
+        restored = []
+        for name in files:
+            dst = os.path.join(dest_dir, name)
+            debug("Reusing brokered artifact: %s" % dst)
+            # Another target may be using a file of the same name in
+            # dest_dir already, replace it in one step:
+            tmp_path = "%s.tmp-%s" % (dst, os.getpid())
+            copy_file(os.path.join(entry_dir, name), tmp_path, preserve=True)
+            os.rename(tmp_path, dst)
+            restored.append(dst)
+        return restored
+
+    def _store(self, entry_dir, paths):
+        tmp_dir = tempfile.mkdtemp(dir=self.broker_dir, prefix=".tmp-")
+        names = []
+        for path in paths:
+            names.append(os.path.basename(path))
+            copy_file(path, os.path.join(tmp_dir, names[-1]), preserve=True)
+        with open(os.path.join(tmp_dir, MANIFEST_FILENAME), "w") as f:
+            json.dump({"files": names}, f, indent=2)
+        os.rename(tmp_dir, entry_dir)
+
+    def cleanup(self):
+        shutil.rmtree(self.broker_dir, ignore_errors=True)
@@ -17,15 +17,22 @@
 import sys
 import os
 import errno
+import json
+import select
+import shutil
+import time
+import traceback
 
 from optparse import OptionParser, SUPPRESS_HELP
+from tempfile import mkdtemp
 
 from tito import __version__
 from tito.common import find_git_root, error_out, debug, get_class_by_name, \
     DEFAULT_BUILDER, BUILDCONFIG_SECTION, DEFAULT_TAGGER, \
     create_builder, get_project_name, get_relative_project_dir, \
     DEFAULT_BUILD_DIR, run_command, tito_config_dir, warn_out, info_out, \
-    read_user_config
+    read_user_config, mkdir_p
+from tito.cache import ArtifactBroker
 from tito.compat import RawConfigParser, getstatusoutput, getoutput
 from tito.exception import TitoException
 
@@ -63,10 +70,11 @@ class ConfigLoader(object):
     from a past tag to ensure build consistency.
     """
 
-    def __init__(self, package_name, output_dir, tag):
+    def __init__(self, package_name, output_dir, tag, project_dir=None):
         self.package_name = package_name
         self.output_dir = output_dir
         self.tag = tag
+        self.project_dir = project_dir
 
     def load(self):
         self.config = self._read_config()
@@ -145,7 +153,8 @@ def _read_project_config(self):
 
         # Use the properties file in the current project directory, if it
         # exists:
-        current_props_file = os.path.join(os.getcwd(), TITO_PROPS)
+        current_props_file = os.path.join(self.project_dir or os.getcwd(),
+            TITO_PROPS)
         if (os.path.exists(current_props_file)):
             self.config.read(current_props_file)
             print("Loaded package specific tito.props overrides")
@@ -396,6 +405,19 @@ def __init__(self):
         self.parser.add_option("--fetch-sources", dest='fetch_sources',
                                action="store_true",
                                help="Download sources from predefined Source<N> addresses to the SOURCE folder")
+        self.parser.add_option("--no-cache", dest="no_cache",
+                action="store_true", default=False,
+                help="Always run rpmbuild, do not reuse or store artifacts "
+                    "from previous builds with identical inputs.")
+        self.parser.add_option("--incremental", dest="incremental",
+                action="store_true", default=False,
+                help="Keep the rpmbuild tree between builds and only re-run "
+                    "%build and %install if just source files changed. "
+                    "Resulting packages are for local testing only.")
+        self.parser.add_option("--resume", dest="resume",
+                action="store_true", default=False,
+                help="Continue a failed build from the last stage that "
+                    "completed, if its output is still intact.")
 
     def main(self, argv):
         BaseCliModule.main(self, argv)
@@ -419,6 +441,9 @@ def main(self, argv):
             'quiet': self.options.quiet,
             'verbose': self.options.verbose,
             'fetch_sources': self.options.fetch_sources,
+            'no_cache': self.options.no_cache,
+            'incremental': self.options.incremental,
+            'resume': self.options.resume,
         }
 
         builder = create_builder(package_name, build_tag,
@@ -436,6 +461,11 @@ def _validate_options(self):
             error_out("Cannot build test version of specific tag.")
         if self.options.quiet and self.options.verbose:
             error_out("Cannot set --quiet and --verbose at the same time.")
+        if self.options.incremental and \
+                (not self.options.rpm or self.options.tgz):
+            error_out("--incremental can only be used with --rpm")
+        if self.options.incremental and self.options.resume:
+            error_out("Cannot combine --incremental and --resume")
 
     def _parse_builder_args(self):
         """
@@ -508,16 +538,40 @@ def __init__(self):
         self.parser.add_option("-s", "--scratch", dest="scratch",
                 action="store_true",
                 help="Perform a scratch build in Koji")
+        self.parser.add_option("--no-cache", dest="no_cache",
+                action="store_true", default=False,
+                help="Do not use cached build artifacts or repository "
+                    "checkouts, start from scratch")
+        self.parser.add_option("--wait", dest="wait",
+                action="store_true", default=False,
+                help="Wait for submitted DistGit builds to finish and "
+                    "summarize their results")
+        self.parser.add_option("--watch", dest="watch",
+                action="store_true", default=False,
+                help="Follow all Koji and Copr tasks submitted by the "
+                    "release targets until they finish, fail if any of "
+                    "them did not succeed")
         self.parser.add_option("--arg", dest="builder_args",
                 action="append",
                 help="Custom arguments to pass to the builder."
                     " (key=value)")
+        self.parser.add_option("--parallel", dest="parallel", type="int",
+                default=1, metavar="N",
+                help="Release to up to N targets at the same time, "
+                    "requires --yes. (default: %default)")
 
     def _validate_options(self):
 
         if self.options.all and self.options.all_starting_with:
             error_out("Cannot combine --all and --all-starting-with.")
 
+        if self.options.parallel < 1:
+            error_out("--parallel needs at least 1 job.")
+
+        if self.options.parallel > 1 and not self.options.auto_accept:
+            error_out("--parallel requires --yes, concurrent releases "
+                "can not ask for input.")
+
         if (self.options.all or self.options.all_starting_with) and \
                 len(self.args) > 1:
             error_out("Cannot use explicit release targets with "
@@ -600,61 +654,238 @@ def main(self, argv):
 
         targets = self._calc_release_targets(releaser_config)
         print("Will release to the following targets: %s" % ", ".join(targets))
-
-        orig_cwd = os.getcwd()
-
-        # Create an instance of the releaser we intend to use:
         for target in targets:
-            print("Releasing to target: %s" % target)
             if not releaser_config.has_section(target):
                 error_out("No such releaser configured: %s" % target)
-            releaser_class = get_class_by_name(releaser_config.get(target, "releaser"))
-            debug("Using releaser class: %s" % releaser_class)
-
-            builder_args = {}
-            if self.options.builder_args and len(self.options.builder_args) > 0:
-                for arg in self.options.builder_args:
-                    if '=' in arg:
-                        key, value = arg.split("=", 1)
-                    else:
-                        # Allow no value args such as 'myscript --auto'
-                        key = arg
-                        value = ''
-
-                    debug("Passing builder arg: %s = %s" % (key, value))
-                    builder_args.setdefault(key, []).append(value)
-            kwargs = {
-                'builder_args': builder_args,
-                'offline': self.options.offline
-            }
-
-            releaser = releaser_class(
-                name=package_name,
-                tag=self.options.tag,
-                build_dir=build_dir,
-                config=self.config,
-                user_config=self.user_config,
-                target=target,
-                releaser_config=releaser_config,
-                no_cleanup=self.options.no_cleanup,
-                test=self.options.test,
-                auto_accept=self.options.auto_accept,
-                **kwargs)
 
+        # Targets building the same tarball or source RPM share them:
+        broker = ArtifactBroker.create(build_dir)
+
+        # Each target writes the tasks it submitted here, targets released
+        # in parallel run in processes of their own:
+        tasks_dir = None
+        if self.options.watch:
+            mkdir_p(build_dir)
+            tasks_dir = mkdtemp(dir=build_dir, prefix="tito-tasks-")
+
+        def release_target(target):
+            tasks = self._release_target(target, package_name, build_dir,
+                releaser_config, broker)
+            if tasks_dir:
+                with open(os.path.join(tasks_dir, "%s.json" %
+                        targets.index(target)), "w") as f:
+                    json.dump([["%s %s" % (target, label), kind, client,
+                        task_id] for (label, kind, client, task_id) in tasks],
+                        f)
+
+        tasks = []
+        try:
+            if self.options.parallel > 1 and len(targets) > 1:
+                self._release_in_parallel(targets, self.options.parallel,
+                    release_target)
+            else:
+                orig_cwd = os.getcwd()
+                for target in targets:
+                    release_target(target)
+
+                    # Make sure we go back to where we started, otherwise
+                    # multiple builders gets very confused:
+                    os.chdir(orig_cwd)
+                    print
+        finally:
+            broker.cleanup()
+            if tasks_dir:
+                tasks = self._collect_tasks(tasks_dir)
+
+        if self.options.watch:
+            self._watch_tasks(tasks)
+
+    def _collect_tasks(self, tasks_dir):
+        """ Read and remove the tasks written by all release targets. """
+        tasks = []
+        for filename in sorted(os.listdir(tasks_dir),
+                key=lambda name: int(name.split(".")[0])):
+            with open(os.path.join(tasks_dir, filename)) as f:
+                tasks.extend(json.load(f))
+        shutil.rmtree(tasks_dir)
+        return tasks
+
+    def _watch_tasks(self, tasks):
+        """
+        Follow (label, kind, client, task ID) tasks until all of them
+        finished, exiting with an error if any of them did not succeed.
+        """
+        # Imported here, other commands do not need the releasers:
+        from tito.release.tasks import TaskWatcher, task_service
+
+        if not tasks:
+            info_out("No build tasks were submitted, nothing to watch.")
+            return
+        watcher = TaskWatcher()
+        for label, kind, client, task_id in tasks:
+            watcher.add(label, task_id, task_service(kind, client))
+        watcher.wait()
+        watcher.print_summary()
+        failed = watcher.failed()
+        if failed:
+            error_out("Tasks did not succeed: %s" % ", ".join(failed))
+
+    def _release_target(self, target, package_name, build_dir,
+            releaser_config, broker=None):
+        """
+        Create an instance of the releaser configured for target and run it.
+        Returns the build system tasks it submitted.
+        """
+        print("Releasing to target: %s" % target)
+        releaser_class = get_class_by_name(releaser_config.get(target, "releaser"))
+        debug("Using releaser class: %s" % releaser_class)
+
+        builder_args = {}
+        if self.options.builder_args and len(self.options.builder_args) > 0:
+            for arg in self.options.builder_args:
+                if '=' in arg:
+                    key, value = arg.split("=", 1)
+                else:
+                    # Allow no value args such as 'myscript --auto'
+                    key = arg
+                    value = ''
+
+                debug("Passing builder arg: %s = %s" % (key, value))
+                builder_args.setdefault(key, []).append(value)
+        kwargs = {
+            'builder_args': builder_args,
+            'offline': self.options.offline,
+            'broker': broker,
+            'wait': self.options.wait,
+            'no_cache': self.options.no_cache,
+        }
+
+        releaser = releaser_class(
+            name=package_name,
+            tag=self.options.tag,
+            build_dir=build_dir,
+            config=self.config,
+            user_config=self.user_config,
+            target=target,
+            releaser_config=releaser_config,
+            no_cleanup=self.options.no_cleanup,
+            test=self.options.test,
+            auto_accept=self.options.auto_accept,
+            **kwargs)
+
+        try:
+            try:
+                releaser.release(dry_run=self.options.dry_run,
+                        no_build=self.options.no_build,
+                        scratch=self.options.scratch)
+            except KeyboardInterrupt:
+                print("Interrupted, cleaning up...")
+        finally:
+            releaser.cleanup()
+        # Releasers from project libraries may not be derived from Releaser:
+        return getattr(releaser, "tasks", [])
+
+    def _release_in_parallel(self, targets, jobs, release_target):
+        """
+        Call release_target for each target, up to jobs of them at the same
+        time.
+
+        Builders and releasers change the working directory of the process,
+        so every target is released in a forked child process. The output of
+        each child is passed through line by line, prefixed with the name of
+        its target. Exits with an error once all targets are done if any of
+        them failed.
+        """
+        info_out("Releasing to %s targets, %s at a time" % (len(targets),
+            jobs))
+        pending = list(targets)
+        # Maps the read end of each child's output pipe to its target,
+        # process ID, start time and any incomplete line of output:
+        running = {}
+        results = {}
+
+        while pending or running:
+            while pending and len(running) < jobs:
+                target = pending.pop(0)
+                read_fd, write_fd = os.pipe()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read_fd)
+                    self._run_release_child(target, write_fd, release_target)
+                os.close(write_fd)
+                running[read_fd] = [target, pid, time.time(), b""]
+
+            readable, _unused, _unused = select.select(list(running), [], [])
+            for read_fd in readable:
+                child = running[read_fd]
+                data = os.read(read_fd, 65536)
+                lines = (child[3] + data).split(b"\n")
+                # Keep an incomplete last line until the rest of it arrives,
+                # unless the child closed its output:
+                child[3] = lines.pop() if data else b""
+                if not data and lines[-1] == b"":
+                    lines.pop()
+                for line in lines:
+                    print("[%s] %s" % (child[0],
+                        line.decode("utf-8", "replace")))
+                sys.stdout.flush()
+                if data:
+                    continue
+
+                os.close(read_fd)
+                del running[read_fd]
+                status = os.waitpid(child[1], 0)[1]
+                if os.WIFEXITED(status):
+                    status = os.WEXITSTATUS(status)
+                results[child[0]] = (status, time.time() - child[2])
+
+        print("")
+        print("Release summary:")
+        failed = []
+        for target in targets:
+            status, duration = results[target]
+            if status:
+                failed.append(target)
+            print("  %-30s %-8s %6.1fs" % (target,
+                "FAILED" if status else "OK", duration))
+        if failed:
+            error_out("Release failed for: %s" % ", ".join(failed))
+
+    def _run_release_child(self, target, output_fd, release_target):
+        """
+        Release target in a forked child process writing all of its output
+        to output_fd, and exit with the result.
+        """
+        status = 0
+        try:
+            # Nobody can answer questions, and commands must not wait for
+            # input either:
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.close(devnull)
+            os.dup2(output_fd, 1)
+            os.dup2(output_fd, 2)
+            os.close(output_fd)
+            sys.stdout = os.fdopen(1, "w", 1)
+            sys.stderr = sys.stdout
+            release_target(target)
+        except SystemExit:
+            code = sys.exc_info()[1].code
+            if isinstance(code, int):
+                status = code
+            elif code is not None:
+                print(code)
+                status = 1
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
             try:
-                try:
-                    releaser.release(dry_run=self.options.dry_run,
-                            no_build=self.options.no_build,
-                            scratch=self.options.scratch)
-                except KeyboardInterrupt:
-                    print("Interrupted, cleaning up...")
+                sys.stdout.flush()
             finally:
-                releaser.cleanup()
-
-            # Make sure we go back to where we started, otherwise multiple
-            # builders gets very confused:
-            os.chdir(orig_cwd)
-            print
+                os._exit(status)
 
 
 class TagModule(BaseCliModule):
@@ -696,10 +927,16 @@ def __init__(self):
         self.parser.add_option("--undo", "-u", dest="undo", action="store_true",
                 help="Undo the most recent (un-pushed) tag.")
 
+        self.parser.add_option("--changed", dest="changed", action="store_true",
+                help=("Tag all packages with changes since their last tag, "
+                    "in one commit. Run from anywhere in the git repository."))
+
     def main(self, argv):
         BaseCliModule.main(self, argv)
 
         build_dir = os.path.normpath(os.path.abspath(self.options.output_dir))
+        if self.options.changed:
+            return self._tag_changed(build_dir)
         package_name = get_project_name(tag=None)
 
         self.load_config(package_name, build_dir, None)
@@ -723,9 +960,71 @@ def main(self, argv):
             e = sys.exc_info()[1]
             error_out(e.message)
 
+    def _tag_changed(self, build_dir):
+        """
+        Tag a new version of every package changed since it was last
+        tagged, with one commit for all of them.
+        """
+        # Imported here, tagging a single package does not need it:
+        from tito.tagger.batch import MAX_WORKERS, find_changed_packages, \
+            tag_packages
+
+        self.load_config(None, build_dir, None)
+        git_root = find_git_root()
+        rel_eng_dir = os.path.join(git_root, tito_config_dir())
+        packages = find_changed_packages(git_root, rel_eng_dir)
+        if not packages:
+            info_out("No packages changed since they were last tagged.")
+            return []
+        print("Tagging changed packages: %s" % ", ".join(
+            name for (name, _relative_dir) in packages))
+
+        def create_tagger(package_name, project_dir):
+            config = ConfigLoader(package_name, build_dir, None,
+                project_dir=project_dir).load()
+            if config.has_option(BUILDCONFIG_SECTION, "block_tagging"):
+                error_out("Tagging has been disabled for %s in this git "
+                    "branch." % package_name)
+            tagger_class = get_class_by_name(config.get(
+                BUILDCONFIG_SECTION, DEFAULT_TAGGER))
+            debug("Using tagger class for %s: %s" % (package_name,
+                tagger_class))
+            return tagger_class(config=config,
+                user_config=self.user_config,
+                keep_version=self.options.keep_version,
+                offline=self.options.offline,
+                project_dir=project_dir)
+
+        # Each package's changelog is edited in turn, unless there is no
+        # editor to wait for:
+        max_workers = MAX_WORKERS
+        if not (self.options.accept_auto_changelog or
+                self.options.no_auto_changelog):
+            max_workers = 1
+        try:
+            tags = tag_packages(create_tagger, packages, self.options,
+                git_root, max_workers)
+        except TitoException:
+            e = sys.exc_info()[1]
+            error_out(e.message)
+
+        print
+        info_out("Created tags:")
+        for tag in tags:
+            print("   %s" % tag)
+        print("   View: git show HEAD")
+        print("   Push: git push --follow-tags origin")
+        return []
+
     def _validate_options(self):
         if self.options.keep_version and self.options.use_version:
             error_out("Cannot combine --keep-version and --use-version")
+        if self.options.changed:
+            for option, name in [(self.options.undo, "--undo"),
+                    (self.options.use_version, "--use-version"),
+                    (self.options.use_release, "--use-release")]:
+                if option:
+                    error_out("Cannot combine --changed and %s" % name)
 
 
 class InitModule(BaseCliModule):
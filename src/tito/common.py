@@ -17,8 +17,10 @@
 Common operations.
 """
 import errno
+import fcntl
 import fileinput
 import glob
+import hashlib
 import os
 import pickle
 import re
@@ -48,6 +50,14 @@
     'mead': 'tito.builder.MeadBuilder',
 }
 
+# ioctl cloning a whole file on filesystems with reflinks (btrfs, XFS),
+# only known to the fcntl module as of Python 3.12:
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+
+# Errors meaning a cheaper way of copying is not available here:
+COPY_FALLBACK_ERRNOS = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY,
+    errno.EINVAL, errno.ENOSYS, errno.EPERM, errno.EMLINK)
+
 
 def read_user_config():
     config = {}
@@ -69,6 +79,21 @@ def read_user_config():
     return config
 
 
+def get_cache_dir(user_config=None):
+    """
+    Return the directory where tito keeps data between runs, such as
+    previously built artifacts.
+
+    Can be overridden with CACHE_DIR in ~/.titorc, defaults to tito/
+    in the XDG cache directory.
+    """
+    if user_config and 'CACHE_DIR' in user_config:
+        return os.path.expanduser(user_config['CACHE_DIR'])
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "tito")
+
+
 def extract_sources(spec_file_lines):
     """
     Returns a list of sources from the given spec file.
@@ -142,6 +167,22 @@ def chdir(path):
         os.chdir(previous_dir)
 
 
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on path, created if needed, for the duration of
+    the block. Guards data shared between concurrently running tito
+    processes.
+    """
+    mkdir_p(os.path.dirname(path))
+    with open(path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
 def create_builder(package_name, build_tag,
         config, build_dir, user_config, args,
         builder_class=None, **kwargs):
@@ -289,12 +330,12 @@ def extract_sha1(output):
         return ""
 
 
-def run_command(command, print_on_success=False):
+def run_command(command, print_on_success=False, cwd=None):
     """
-    Run command.
+    Run command, in the directory cwd if given.
     If command fails, print status code and command output.
     """
-    (status, output) = getstatusoutput(command)
+    (status, output) = getstatusoutput(command, cwd=cwd)
     if status > 0:
         msgs = [
             "Error running command: %s\n" % command,
@@ -315,7 +356,7 @@ def run_command(command, print_on_success=False):
     return output
 
 
-def run_command_print(command, print_on_success=False):
+def run_command_print(command, print_on_success=False, cwd=None):
     """
     Simliar to run_command but prints each line of output on the fly.
     """
@@ -326,7 +367,7 @@ def run_command_print(command, print_on_success=False):
     try:
         p = subprocess.Popen(command,
                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
-                             universal_newlines=True, shell=True)
+                             universal_newlines=True, shell=True, cwd=cwd)
     except OSError as e:
         status = e.errno
         output = e.strerror
@@ -459,6 +500,46 @@ def undo_tag(tag):
     print(output)
 
 
+def git_stage(add=None, remove=None, cwd=None):
+    """
+    Update the git index in the repository at cwd: add the paths in add
+    and git rm those in remove, with one git process for each rather than
+    one per path.
+
+    Paths are taken literally, never as glob patterns.
+    """
+    for command, paths in [("add", add), ("rm", remove)]:
+        if not paths:
+            continue
+        status, output = _git_pathspec_command(command, paths, cwd)
+        if status == 129 and "pathspec-from-file" in output:
+            # Older git than 2.26, which can not read paths from stdin:
+            status, output = _git_pathspec_command(command, paths, cwd,
+                from_stdin=False)
+        if status > 0:
+            command = "git %s %s" % (command, " ".join(paths))
+            error_out(["Error running command: %s\n" % command,
+                "Status code: %s\n" % status,
+                "Command output: %s\n" % output], die=False)
+            raise RunCommandException(command, status, output)
+        debug("Staged with git %s: %s" % (command, " ".join(paths)))
+
+
+def _git_pathspec_command(command, paths, cwd, from_stdin=True):
+    args = ["git", "--literal-pathspecs", command]
+    stdin = None
+    if from_stdin:
+        args.extend(["--pathspec-from-file=-", "--pathspec-file-nul"])
+        stdin = "\0".join(paths).encode("utf-8")
+    else:
+        args.append("--")
+        args.extend(paths)
+    p = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, cwd=cwd)
+    output = p.communicate(stdin)[0].decode("utf-8", "replace")
+    return p.returncode, output.rstrip("\n")
+
+
 def is_git_state_clean():
     """
     Determines if the state of the current git repository is clean or not.
@@ -690,10 +771,11 @@ def scl_to_rpm_option(scl, silent=None):
     return rpm_options
 
 
-def get_project_name(tag=None, scl=None):
+def get_project_name(tag=None, scl=None, in_dir=None):
     """
-    Extract the project name from the specified tag or a spec file in the
-    current working directory. Error out if neither is present.
+    Extract the project name from the specified tag or a spec file in
+    in_dir, the current working directory by default. Error out if neither
+    is present.
     """
     if tag is not None:
         try:
@@ -705,7 +787,7 @@ def get_project_name(tag=None, scl=None):
                 error_out("Unable to determine project name in tag: %s" % tag)
         return package
     else:
-        file_path = find_spec_like_file()
+        file_path = find_spec_like_file(in_dir)
         if not os.path.exists(file_path):
             error_out("spec file: %s does not exist" % file_path)
 
@@ -772,16 +854,16 @@ def get_relative_project_dir(project_name, commit):
     return tokens[1]
 
 
-def get_relative_project_dir_cwd(git_root):
+def get_relative_project_dir_cwd(git_root, project_dir=None):
     """
     Returns the patch to the project we're working with relative to the
-    git root using the cwd.
+    git root using project_dir, or the cwd.
 
     *MUST* be called before doing any os.cwd().
 
     i.e. java/, satellite/install/Spacewalk-setup/, etc.
     """
-    current_dir = os.getcwd()
+    current_dir = project_dir or os.getcwd()
     relative = current_dir[len(git_root) + 1:] + "/"
     if relative == "/":
         relative = "./"
@@ -973,6 +1055,106 @@ def get_script_path(scriptname):
     return scriptpath
 
 
+def file_checksum(path, algorithm="sha256"):
+    """
+    Return the hex digest of the file's contents using the given hashlib
+    algorithm.
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_file(src, dst, allow_link=False, preserve=False):
+    """
+    Copy the file src to dst, which may be a directory, as cheaply as the
+    filesystem allows: a reflink first, then a hardlink if allow_link is
+    set, then copy_file_range and finally a plain copy.
+
+    Only allow links when neither file is ever modified in place. The
+    permission bits are copied, timestamps too if preserve is set.
+    An existing dst is replaced rather than written through.
+
+    Returns the number of bytes actually copied, 0 for reflinks and links.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.lexists(dst):
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return 0
+        os.unlink(dst)
+
+    copied = 0
+    if _reflink(src, dst):
+        method = "Reflinked"
+    elif allow_link and _hardlink(src, dst):
+        debug("Linked %s -> %s" % (src, dst))
+        return 0
+    else:
+        with open(src, "rb") as fsrc:
+            with open(dst, "wb") as fdst:
+                copied = _copy_file_contents(fsrc, fdst)
+        method = "Copied %s bytes" % copied
+    if preserve:
+        shutil.copystat(src, dst)
+    else:
+        shutil.copymode(src, dst)
+    debug("%s: %s -> %s" % (method, src, dst))
+    return copied
+
+
+def _reflink(src, dst):
+    """ Clone src to dst, returns False if the filesystem can not. """
+    with open(src, "rb") as fsrc:
+        with open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return True
+            except (IOError, OSError) as e:
+                if e.errno not in COPY_FALLBACK_ERRNOS:
+                    raise
+    os.unlink(dst)
+    return False
+
+
+def _hardlink(src, dst):
+    """ Hardlink src to dst, returns False if that is not possible. """
+    try:
+        os.link(src, dst)
+        return True
+    except OSError as e:
+        if e.errno not in COPY_FALLBACK_ERRNOS:
+            raise
+    return False
+
+
+def _copy_file_contents(fsrc, fdst):
+    """
+    Copy the contents of one open file to the other, in the kernel if
+    possible. Returns the number of bytes copied.
+    """
+    copied = 0
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            while True:
+                count = copy_file_range(fsrc.fileno(), fdst.fileno(),
+                    64 * 1024 ** 2)
+                if not count:
+                    return copied
+                copied += count
+        except OSError as e:
+            # Nothing was written yet if the call is not supported at all:
+            if copied or e.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+    for chunk in iter(lambda: fsrc.read(1024 * 1024), b''):
+        fdst.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
 # 511 is 777 in octal.  Python 2 and Python 3 disagree about the right
 # way to represent octal numbers.
 def mkdir_p(path, mode=511):
@@ -69,23 +69,38 @@ def ensure_binary(x, encoding="utf8"):
         raise TypeError("Not expecting type '%s'" % type(x))
 
 
-def getstatusoutput(cmd):
+def getstatusoutput(cmd, cwd=None):
     """
-    Returns (status, output) of executing cmd in a shell.
+    Returns (status, output) of executing cmd in a shell, in the directory
+    cwd if given.
     Supports Python 2.4 and 3.x.
     """
     if PY2:
+        if cwd:
+            cmd = "cd '%s' && %s" % (cwd, cmd)
         return commands.getstatusoutput(cmd)
-    else:
+    elif cwd is None:
         return subprocess.getstatusoutput(cmd)
 
+    # Same as subprocess.getstatusoutput(), which has no cwd argument:
+    try:
+        output = subprocess.check_output(cmd, shell=True, cwd=cwd,
+            universal_newlines=True, stderr=subprocess.STDOUT)
+        status = 0
+    except subprocess.CalledProcessError as e:
+        output = e.output
+        status = e.returncode
+    if output[-1:] == '\n':
+        output = output[:-1]
+    return status, output
+
 
-def getoutput(cmd):
+def getoutput(cmd, cwd=None):
     """
     Returns output of executing cmd in a shell.
     Supports Python 2.4 and 3.x.
     """
-    return getstatusoutput(cmd)[1]
+    return getstatusoutput(cmd, cwd=cwd)[1]
 
 
 def dictionary_override(d1, d2):
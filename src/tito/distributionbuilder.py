@@ -1,7 +1,7 @@
 import os
 
 from tito.builder import UpstreamBuilder
-from tito.common import debug, run_command, error_out
+from tito.common import copy_file, debug, run_command, error_out
 from tito.compat import getstatusoutput
 
 
@@ -38,7 +38,7 @@ def patch_upstream(self):
                 print(output)
                 error_out("You are doomed. Diff contains binary files. You can not use this builder")
 
-            run_command("cp %s/%s %s" % (self.rpmbuild_gitcopy, p_file, self.rpmbuild_sourcedir))
+            copy_file(os.path.join(self.rpmbuild_gitcopy, p_file), self.rpmbuild_sourcedir)
 
         (patch_number, patch_insert_index, patch_apply_index, lines) = self._patch_upstream()
 
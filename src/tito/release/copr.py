@@ -13,9 +13,11 @@
 
 import os.path
 import subprocess
+import sys
 
-from tito.common import run_command, info_out, error_out
-from tito.release import KojiReleaser
+from tito.common import run_command, info_out, error_out, warn_out
+from tito.release import KojiReleaser, coprclient
+from tito.release.tasks import extract_copr_build_ids
 
 
 class CoprReleaser(KojiReleaser):
@@ -37,7 +39,8 @@ def __init__(self, name=None, tag=None, build_dir=None,
 
         self.copr_project_name = \
             self.releaser_config.get(self.target, "project_name")
-        self.srpm_submitted = False
+        # Paths of the srpms uploaded to remote_location:
+        self.srpms_uploaded = set()
 
         # 'copr-cli build' options, e.g. --chroot
         # Default to --nowait, so that it mirrors the behavior of fedpkg
@@ -45,6 +48,9 @@ def __init__(self, name=None, tag=None, build_dir=None,
         if self.releaser_config.has_option(self.target, "copr_options"):
             self.copr_options = \
                 self.releaser_config.get(self.target, "copr_options")
+        # The same options for the Copr API, None if there are none:
+        self.copr_build_options = coprclient.parse_copr_options(
+            self.copr_options)
 
     def autobuild_tags(self):
         """ will return list of project for which we are building """
@@ -52,7 +58,7 @@ def autobuild_tags(self):
         return result.strip().split(" ")
 
     def _koji_release(self):
-        self.srpm_submitted = False
+        self.srpms_uploaded = set()
         if not self.builder.config.has_section(self.copr_project_name):
             self.builder.config.add_section(self.copr_project_name)
         KojiReleaser._koji_release(self)
@@ -68,6 +74,62 @@ def _check_releaser_config(self):
             self.remote_location = self.user_config['COPR_REMOTE_LOCATION']
         KojiReleaser._check_releaser_config(self)
 
+    def _koji_session(self):
+        """
+        Return a Copr API client to submit all builds in process, or None
+        if they have to be submitted with copr-cli.
+
+        The client is only used if copr_options can be expressed as API
+        build options.
+
+        NOTE: overrides KojiReleaser._koji_session.
+        """
+        if self.dry_run or not coprclient.requests or \
+                self.copr_build_options is None:
+            return None
+        return coprclient.CoprClient.from_config()
+
+    def _submit_builds(self, session, builds, build_opts):
+        """
+        Submit (project, srpm) builds to all projects at the same time.
+
+        With remote_location, each srpm is uploaded there once and Copr
+        fetches it from there. Otherwise the client uploads each srpm once
+        and the other projects build it from where Copr keeps it.
+
+        NOTE: overrides KojiReleaser._submit_builds.
+        """
+        if self.remote_location:
+            for srpm_location in sorted(set(srpm_location
+                    for (_project, srpm_location) in builds)):
+                self._upload(srpm_location)
+
+        sources = []
+        for project, srpm_location in builds:
+            source = srpm_location
+            if self.remote_location:
+                source = self.remote_location + os.path.basename(srpm_location)
+            sources.append((project, source))
+            print("\nSubmitting build of %s into %s" % (source, project))
+
+        info_out("Submitting builds into %s." % self.NAME)
+        failed = []
+        for project, build_ids, error in session.submit_builds(sources,
+                self.copr_build_options):
+            if error:
+                warn_out("Submitting build into %s failed: %s" % (project,
+                    error))
+                failed.append(project)
+                continue
+            print("Created builds: %s" % " ".join(str(build_id)
+                for build_id in build_ids))
+            for build_id in build_ids:
+                print("  %s" % session.build_url(build_id))
+                self._task_submitted(project, build_id, "copr", self.cli_tool)
+        if failed:
+            error_out("Unable to submit builds into %s: %s" % (self.NAME,
+                " ".join(failed)))
+
     def _submit_build(self, executable, koji_opts, tag, srpm_location):
         """
         Submit the build into Copr
@@ -82,8 +144,9 @@ def _submit_build(self, executable, koji_opts, tag, srpm_location):
         self._submit(path, tag)
 
     def _upload(self, srpm_location):
-        if self.srpm_submitted:
-            srpm_location = self.srpm_submitted
+        """ Upload the srpm to remote_location, unless it already is. """
+        if srpm_location in self.srpms_uploaded:
+            return
 
         # e.g. "scp %(srpm)s my.web.com:public_html/my_srpm/"
         cmd = self.releaser_config.get(self.target, "upload_command")
@@ -94,10 +157,9 @@ def _upload(self, srpm_location):
             return
 
         # TODO: no error handling when run_command fails:
-        if not self.srpm_submitted:
-            print("Uploading src.rpm.")
-            print(run_command(cmd_upload))
-            self.srpm_submitted = srpm_location
+        print("Uploading src.rpm.")
+        print(run_command(cmd_upload))
+        self.srpms_uploaded.add(srpm_location)
 
     def _submit(self, srpm_location, project):
         cmd_submit = "/usr/bin/%s build %s %s %s" % \
@@ -107,10 +169,22 @@ def _submit(self, srpm_location, project):
             return
 
         info_out("Submitting build into %s." % self.NAME)
-        self._run_command(cmd_submit)
+        output = self._run_command(cmd_submit)
+        for build_id in extract_copr_build_ids(output):
+            self._task_submitted(project, build_id, "copr", self.cli_tool)
 
     def _run_command(self, cmd):
-        process = subprocess.Popen(cmd.split())
+        """
+        Run cmd, passing its output through as it comes, and return the
+        output.
+        """
+        process = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        output = []
+        for line in process.stdout:
+            sys.stdout.write(line)
+            output.append(line)
         process.wait()
         if process.returncode > 0:
             error_out("Failed running `%s`" % cmd)
+        return "".join(output)
@@ -0,0 +1,252 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+In-process client for the Copr API, used instead of running copr-cli once per
+project when the requests library is installed.
+"""
+
+import json
+import os
+import shlex
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Optional dependency, without it builds are submitted with copr-cli:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+from tito.common import debug
+from tito.compat import RawConfigParser
+from tito.exception import TitoException
+
+DEFAULT_CONFIG = "~/.config/copr"
+
+# Upper bound for the number of builds submitted at the same time:
+MAX_SUBMISSIONS = 8
+
+# How long to wait for Copr to import an uploaded SRPM before uploading it
+# to the other projects as well, and how often to check:
+IMPORT_TIMEOUT = 300
+IMPORT_INTERVAL = 5
+
+# Build states after which an SRPM that is not imported yet never will be:
+FINISHED_STATES = ["failed", "canceled", "skipped"]
+
+# copr-cli build options with a value, mapped to their API field and
+# whether they can be given more than once:
+VALUE_OPTIONS = {
+    '--chroot': ('chroots', True),
+    '-r': ('chroots', True),
+    '--exclude-chroot': ('exclude_chroots', True),
+    '--timeout': ('timeout', False),
+    '--isolation': ('isolation', False),
+    '--bootstrap': ('bootstrap', False),
+    '--enable-net': ('enable_net', False),
+}
+
+
+def parse_copr_options(copr_options):
+    """
+    Translate copr-cli build options to Copr API build options.
+
+    Returns None if an option has no equivalent here, or if --nowait is
+    missing, since copr-cli has to wait for those builds.
+    """
+    words = shlex.split(copr_options)
+    if "--nowait" not in words:
+        return None
+    options = {}
+    while words:
+        word = words.pop(0)
+        value = None
+        if "=" in word and word.startswith("--"):
+            word, value = word.split("=", 1)
+        if word == "--nowait":
+            continue
+        if word == "--background":
+            options['background'] = True
+            continue
+        if word not in VALUE_OPTIONS:
+            debug("No Copr API equivalent of copr-cli option: %s" % word)
+            return None
+        if value is None:
+            if not words:
+                return None
+            value = words.pop(0)
+        field, multiple = VALUE_OPTIONS[word]
+        if field == 'timeout':
+            value = int(value)
+        elif field == 'enable_net':
+            value = value == "on"
+        if multiple:
+            options.setdefault(field, []).append(value)
+        else:
+            options[field] = value
+    return options
+
+
+class CoprClient(object):
+    """
+    Submits builds to Copr, all of them through one pool of HTTP
+    connections, authenticated with the API token copr-cli uses.
+    """
+
+    def __init__(self, copr_url, login, token, username):
+        self.copr_url = copr_url.rstrip("/")
+        self.username = username
+        self.session = requests.Session()
+        self.session.auth = (login, token)
+        adapter = HTTPAdapter(pool_maxsize=MAX_SUBMISSIONS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, path=None):
+        """
+        Create a client from the copr-cli config file, None if it has no
+        API token.
+        """
+        path = os.path.expanduser(path or DEFAULT_CONFIG)
+        config = RawConfigParser()
+        config.read(path)
+        section = "copr-cli"
+        for option in ["login", "token", "username"]:
+            if not config.has_option(section, option):
+                debug("No %s in %s" % (option, path))
+                return None
+        copr_url = "https://copr.fedorainfracloud.org"
+        if config.has_option(section, "copr_url"):
+            copr_url = config.get(section, "copr_url")
+        return cls(copr_url, config.get(section, "login"),
+            config.get(section, "token"), config.get(section, "username"))
+
+    def _project(self, name):
+        """ Split a project name into owner and project. """
+        if "/" in name:
+            return name.split("/", 1)
+        return self.username, name
+
+    def _request(self, method, endpoint, **kwargs):
+        response = self.session.request(method, "%s/api_3/%s" % (
+            self.copr_url, endpoint), **kwargs)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code >= 400:
+            raise TitoException("Copr API error %s: %s" % (
+                response.status_code, data.get('error', response.text)))
+        return data
+
+    def _post(self, endpoint, **kwargs):
+        data = self._request("POST", endpoint, **kwargs)
+        # One build is returned as is, more of them as items:
+        builds = data.get('items', [data])
+        return [build['id'] for build in builds]
+
+    def build_from_url(self, project, url, options=None):
+        """ Build the SRPM at url in project, returning the build IDs. """
+        owner, name = self._project(project)
+        data = dict(options or {}, ownername=owner, projectname=name,
+            pkgs=url)
+        return self._post("build/create/url", json=data)
+
+    def build_from_file(self, project, path, options=None):
+        """ Upload the SRPM at path and build it in project. """
+        owner, name = self._project(project)
+        data = dict(options or {}, ownername=owner, projectname=name)
+        with open(path, "rb") as srpm:
+            return self._post("build/create/upload", files={
+                'json': (None, json.dumps(data), "application/json"),
+                'pkgs': (os.path.basename(path), srpm, "application/x-rpm"),
+            })
+
+    def source_url(self, build_id, timeout=IMPORT_TIMEOUT,
+            interval=IMPORT_INTERVAL):
+        """
+        Wait for Copr to import the SRPM uploaded for a build and return the
+        URL it can be downloaded from, None if that does not happen in time.
+        """
+        deadline = time.time() + timeout
+        while True:
+            build = self._request("GET", "build/%s" % build_id)
+            url = (build.get('source_package') or {}).get('url')
+            if url:
+                return url
+            if build.get('state') in FINISHED_STATES or \
+                    time.time() + interval > deadline:
+                debug("No imported SRPM for build %s" % build_id)
+                return None
+            time.sleep(interval)
+
+    def submit_builds(self, builds, options=None):
+        """
+        Submit a list of (project, source) builds at the same time, source
+        being a URL or a local SRPM.
+
+        Each local SRPM is uploaded once, along with its build in the first
+        project it goes to. The other projects build it from the URL Copr
+        serves it at once imported, or get an upload of their own if that
+        is not there in time.
+
+        Returns a list of (project, build IDs, error), error being None for
+        each build which was submitted.
+        """
+        first_project = {}
+        for project, source in builds:
+            if "://" not in source:
+                first_project.setdefault(source, project)
+
+        def submit(build):
+            project, source = build
+            try:
+                if "://" in source:
+                    ids = self.build_from_url(project, source, options)
+                else:
+                    ids = self.build_from_file(project, source, options)
+            except (TitoException, requests.RequestException) as e:
+                return (project, [], e)
+            return (project, ids, None)
+
+        def upload(path):
+            result = submit((first_project[path], path))
+            url = None
+            if result[1]:
+                try:
+                    url = self.source_url(result[1][0])
+                except (TitoException, requests.RequestException) as e:
+                    debug("Unable to look up build %s: %s" % (result[1][0],
+                        e))
+            return result, url
+
+        def submit_rest(build):
+            project, source = build
+            if source in uploaded:
+                result, url = uploaded[source]
+                if project == first_project[source]:
+                    return result
+                source = url or source
+            return submit((project, source))
+
+        workers = min(len(builds), MAX_SUBMISSIONS) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            uploaded = dict(zip(first_project,
+                executor.map(upload, first_project)))
+            return list(executor.map(submit_rest, builds))
+
+    def build_url(self, build_id):
+        return "%s/coprs/build/%s" % (self.copr_url, build_id)
@@ -12,10 +12,14 @@
 # in this software or its documentation.
 import datetime
 import os.path
+import re
+import shutil
 import subprocess
 import sys
 import tempfile
 
+from concurrent.futures import ThreadPoolExecutor
+
 try:
     # Optional dependency available on Fedora and EPEL9+
     # Without it, branch aliases in releasers.conf won't work.
@@ -31,12 +35,17 @@
     chdir,
     warn_out,
     info_out,
+    file_checksum,
+    file_lock,
     find_mead_chain_file,
+    get_cache_dir,
     get_git_user_info,
+    git_stage,
 )
 from tito.compat import getoutput, getstatusoutput, write
 from tito.release import Releaser
 from tito.release.main import PROTECTED_BUILD_SYS_FILES
+from tito.release.tasks import TaskWatcher, extract_task_ids
 from tito.buildparser import BuildTargetParser
 from tito.exception import RunCommandException
 from tito.bugtracker import BugzillaExtractor, MissingBugzillaCredsException
@@ -45,11 +54,21 @@
 
 MEAD_SCM_USERNAME = 'MEAD_SCM_USERNAME'
 
+# Lines of a dist-git sources file, "SHA512 (name) = checksum" as written by
+# current tools, "checksum  name" with an MD5 sum by older ones:
+SOURCES_LINE_RE = re.compile(
+    r'^(?P<algorithm>\w+) \((?P<name>.+)\) = (?P<checksum>[0-9a-fA-F]+)$')
+LEGACY_SOURCES_LINE_RE = re.compile(
+    r'^(?P<checksum>[0-9a-fA-F]{32})\s+(?P<name>\S.*)$')
+
 
 class FedoraGitReleaser(Releaser):
 
     REQUIRED_CONFIG = ['branches']
 
+    # Client used to follow the submitted build tasks with --wait:
+    KOJI_CLI = "koji"
+
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
             target=None, releaser_config=None, no_cleanup=False,
@@ -76,6 +95,9 @@ def __init__(self, name=None, tag=None, build_dir=None,
         if overwrite_checkout:
             self.project_name = overwrite_checkout
 
+        # Wait for the submitted builds to finish:
+        self.wait = kwargs.get('wait', False)
+
         self.package_workdir = os.path.join(self.working_dir,
                 self.project_name)
 
@@ -128,18 +150,107 @@ def _get_build_target_for_branch(self, branch):
             return self.build_targets[branch]
         return None
 
+    def _mirror_dir(self):
+        """
+        Location of the cached mirror of the package's repository, per
+        command line tool and its options as those determine the remote.
+        """
+        tool = re.sub(r'[^\w.-]+', '_', self.cli_tool)
+        return os.path.join(get_cache_dir(self.user_config), "distgit", tool,
+            "%s.git" % self.project_name)
+
+    def _clone(self):
+        """
+        Clone the package repository into package_workdir.
+
+        A bare mirror of the repository is kept in the cache directory
+        between releases. Only the first release of a package clones over
+        the network, later ones fetch into the mirror and clone from it
+        locally.
+        """
+        clone_cmd = "%s clone %s" % (self.cli_tool, self.project_name)
+        if self.no_cache:
+            run_command(clone_cmd, cwd=self.working_dir)
+            return
+
+        mirror = self._mirror_dir()
+        with file_lock("%s.lock" % mirror):
+            if os.path.isdir(mirror):
+                info_out("Updating mirror: %s" % mirror)
+                try:
+                    run_command("git fetch --prune origin", cwd=mirror)
+                    self._clone_from_mirror(mirror)
+                    return
+                except RunCommandException as e:
+                    warn_out("Unable to use mirror %s, cloning again: %s" %
+                        (mirror, e.output))
+                    shutil.rmtree(mirror, ignore_errors=True)
+                    shutil.rmtree(self.package_workdir, ignore_errors=True)
+
+            run_command(clone_cmd, cwd=self.working_dir)
+            try:
+                self._create_mirror(mirror)
+            except RunCommandException as e:
+                warn_out("Unable to create mirror %s: %s" % (mirror, e.output))
+                shutil.rmtree(mirror, ignore_errors=True)
+
+    def _create_mirror(self, mirror):
+        """
+        Create the mirror from the fresh clone in package_workdir, with the
+        same remote, so it can be updated with a plain fetch later.
+        """
+        debug("Creating mirror: %s" % mirror)
+        run_command("git init -q --bare %s" % mirror)
+        for key in ("remote.origin.url", "remote.origin.pushurl"):
+            (status, value) = getstatusoutput("git config --get %s" % key,
+                cwd=self.package_workdir)
+            if status == 0:
+                run_command("git config %s %s" % (key, value), cwd=mirror)
+        run_command("git config remote.origin.fetch '+refs/*:refs/*'",
+            cwd=mirror)
+        run_command("git config remote.origin.mirror true", cwd=mirror)
+        run_command("git fetch -q %s 'refs/remotes/origin/*:refs/heads/*' "
+            "'refs/tags/*:refs/tags/*'" % self.package_workdir, cwd=mirror)
+        # origin/HEAD is no branch, it names the default one:
+        (status, head) = getstatusoutput(
+            "git symbolic-ref refs/remotes/origin/HEAD",
+            cwd=self.package_workdir)
+        getstatusoutput("git update-ref -d refs/heads/HEAD", cwd=mirror)
+        if status == 0:
+            run_command("git symbolic-ref HEAD refs/heads/%s" %
+                head.split("refs/remotes/origin/", 1)[-1], cwd=mirror)
+
+    def _clone_from_mirror(self, mirror):
+        """
+        Clone the mirror into package_workdir, pointing the clone at the
+        mirror's remote. Remote branches of the clone are those of the
+        remote as of the last fetch into the mirror.
+
+        The clone gets its own copy of the objects, it must keep working
+        when a broken mirror is removed and cloned again.
+        """
+        run_command("git clone -q --reference %s --dissociate %s %s" % (
+            mirror, mirror, self.package_workdir))
+        for key in ("remote.origin.url", "remote.origin.pushurl"):
+            (status, value) = getstatusoutput("git config --get %s" % key,
+                cwd=mirror)
+            if status == 0:
+                run_command("git config %s %s" % (key, value),
+                    cwd=self.package_workdir)
+
     def _git_release(self):
         getoutput("mkdir -p %s" % self.working_dir)
-        with chdir(self.working_dir):
-            run_command("%s clone %s" % (self.cli_tool, self.project_name))
-
-        with chdir(self.package_workdir):
-            run_command("%s switch-branch %s" % (self.cli_tool, self.git_branches[0]))
+        self._clone()
+        run_command("%s switch-branch %s" % (self.cli_tool,
+            self.git_branches[0]), cwd=self.package_workdir)
 
         # Set git user config to the distgit clone based on the current project
         self._git_set_user_config()
 
-        # Mead builds need to be in the git_root.  Other builders are agnostic.
+        # Builders still run commands in the current directory and expect
+        # the git root there (Mead builds clone it from it), so this changes
+        # the working directory of the whole process. Parallel releases are
+        # only safe because every target runs in a process of its own.
         with chdir(self.git_root):
             self.builder.tgz()
             self.builder.copy_and_download_extra_sources()
@@ -154,9 +265,10 @@ def _git_release(self):
     def _git_set_user_config(self):
         fullname, email = get_git_user_info()
         email = email or ""
-        with chdir(self.package_workdir):
-            run_command("git config user.name '{0}'".format(fullname))
-            run_command("git config user.email '{0}'".format(email))
+        run_command("git config user.name '{0}'".format(fullname),
+            cwd=self.package_workdir)
+        run_command("git config user.email '{0}'".format(email),
+            cwd=self.package_workdir)
 
     def _get_bz_flags(self):
         required_bz_flags = None
@@ -237,13 +349,13 @@ def _git_user_confirm_commit(self, project_checkout):
 
         main_branch = self.git_branches[0]
 
-        os.chdir(project_checkout)
-
         # Newer versions of git don't seem to want --cached here? Try both:
-        (unused, diff_output) = getstatusoutput("git diff --cached")
+        (unused, diff_output) = getstatusoutput("git diff --cached",
+            cwd=project_checkout)
         if diff_output.strip() == "":
             debug("git diff --cached returned nothing, falling back to git diff.")
-            (unused, diff_output) = getstatusoutput("git diff")
+            (unused, diff_output) = getstatusoutput("git diff",
+                cwd=project_checkout)
 
         if diff_output.strip() == "":
             print("No changes in main branch, skipping commit for: %s" % main_branch)
@@ -266,51 +378,115 @@ def _git_user_confirm_commit(self, project_checkout):
                 self.print_dry_run_warning(cmd)
             else:
                 print("Proceeding with commit.")
-                os.chdir(self.package_workdir)
-                run_command(cmd)
+                run_command(cmd, cwd=self.package_workdir)
 
             os.unlink(commit_msg_file)
 
-        cmd = self._push_command()
-        if self.dry_run:
-            self.print_dry_run_warning(cmd)
+        if len(self.git_branches) == 1:
+            self._push(self._push_command(), project_checkout)
         else:
-            # Push
-            print(cmd)
-            try:
-                run_command(cmd)
-            except RunCommandException as e:
-                error_out("`%s` failed with: %s" % (cmd, e.output))
+            # Main and all other branches go out in a single push:
+            refspecs = ["%s:%s" % (branch, branch)
+                for branch in self.git_branches]
+            for branch in self.git_branches[1:]:
+                self._propagate_branch(main_branch, branch, project_checkout)
+            self._push("git push origin %s" % " ".join(refspecs),
+                project_checkout)
+        print
 
         if not self.no_build:
-            self._build(main_branch)
+            self._build_branches(self.git_branches, project_checkout)
+
+    def _push(self, cmd, project_checkout):
+        if self.dry_run:
+            self.print_dry_run_warning(cmd)
+            return
+        print(cmd)
+        try:
+            run_command(cmd, cwd=project_checkout)
+        except RunCommandException as e:
+            error_out("`%s` failed with: %s" % (cmd, e.output))
 
-        for branch in self.git_branches[1:]:
-            info_out("Merging branch: '%s' -> '%s'" % (main_branch, branch))
-            run_command("%s switch-branch %s" % (self.cli_tool, branch))
-            self._merge(main_branch)
+    def _propagate_branch(self, main_branch, branch, project_checkout):
+        """
+        Bring branch up to date with main_branch, ready to be pushed.
 
-            cmd = "git push origin %s:%s" % (branch, branch)
-            if self.dry_run:
-                self.print_dry_run_warning(cmd)
-            else:
-                print(cmd)
-                try:
-                    run_command(cmd)
-                except RunCommandException as e:
-                    error_out("`%s` failed with: %s" % (cmd, e.output))
+        If the remote branch is an ancestor of main_branch, which it usually
+        is, the local branch ref is simply moved to main_branch without
+        touching the checkout. Only diverged branches are checked out and
+        merged.
+        """
+        remote_ref = "refs/remotes/origin/%s" % branch
+        (status, unused) = getstatusoutput(
+            "git merge-base --is-ancestor %s %s" % (remote_ref, main_branch),
+            cwd=project_checkout)
+        if status == 0:
+            info_out("Fast-forwarding branch: '%s' -> '%s'" % (main_branch,
+                branch))
+            run_command("git update-ref refs/heads/%s %s" % (branch,
+                main_branch), cwd=project_checkout)
+            run_command("git branch --set-upstream-to=origin/%s %s" % (
+                branch, branch), cwd=project_checkout)
+            return
 
-            if not self.no_build:
-                self._build(branch)
+        info_out("Merging branch: '%s' -> '%s'" % (main_branch, branch))
+        run_command("%s switch-branch %s" % (self.cli_tool, branch),
+            cwd=project_checkout)
+        self._merge(main_branch)
 
-            print
+    def _build_branches(self, branches, project_checkout):
+        """
+        Submit builds for all branches at the same time, once all of them
+        have been pushed.
+
+        The build tool builds whatever branch is checked out, so every branch
+        but the one in project_checkout gets a git worktree of its own.
+        With --wait, the submitted tasks are followed until they finish.
+        """
+        checkouts = {}
+        current = None
+        if not self.dry_run:
+            current = run_command("git rev-parse --abbrev-ref HEAD",
+                cwd=project_checkout)
+        for branch in branches:
+            checkouts[branch] = project_checkout
+            if self.dry_run or branch == current:
+                continue
+            checkouts[branch] = os.path.join(self.working_dir, "worktrees",
+                branch.replace("/", "_"))
+            run_command("git worktree add %s %s" % (checkouts[branch], branch),
+                cwd=project_checkout)
+
+        with ThreadPoolExecutor(max_workers=len(branches)) as executor:
+            futures = [(branch, executor.submit(self._build, branch,
+                checkouts[branch])) for branch in branches]
+            outputs = [(branch, future.result()) for branch, future in futures]
+
+        watcher = TaskWatcher(self.KOJI_CLI)
+        for branch, output in outputs:
+            if not output:
+                continue
+            # Print the task ID and URL:
+            for line in extract_task_info(output):
+                print("%s: %s" % (branch, line))
+            for task_id in extract_task_ids(output):
+                watcher.add(branch, task_id)
+                self._task_submitted(branch, task_id, "koji", self.KOJI_CLI)
+
+        if not self.wait or self.dry_run:
+            return
+        watcher.wait()
+        watcher.print_summary()
+        failed = watcher.failed()
+        if failed:
+            error_out("Builds did not succeed for: %s" % ", ".join(failed))
 
     def _push_command(self):
         return "%s push" % self.cli_tool
 
     def _merge(self, main_branch):
         try:
-            run_command("git merge %s" % main_branch)
+            run_command("git merge %s" % main_branch, cwd=self.package_workdir)
         except:
             print
             warn_out("Conflicts occurred during merge.")
@@ -325,10 +501,16 @@ def _merge(self, main_branch):
             print("  4. Return to the tito release: exit")
             print
             # TODO: maybe prompt y/n here
-            os.system(os.environ['SHELL'])
+            subprocess.call([os.environ['SHELL']], cwd=self.package_workdir)
+
+    def _build(self, branch, checkout=None):
+        """
+        Submit a Fedora build from the package checkout, or the given
+        checkout of branch.
 
-    def _build(self, branch):
-        """ Submit a Fedora build from current directory. """
+        Returns the output of the build tool, None on a dry run.
+        """
+        checkout = checkout or self.package_workdir
         target_param = ""
         scratch_param = ""
         build_target = self._get_build_target_for_branch(branch)
@@ -344,7 +526,7 @@ def _build(self, branch):
             return
 
         info_out("Submitting build: %s" % build_cmd)
-        (status, output) = getstatusoutput(build_cmd)
+        (status, output) = getstatusoutput(build_cmd, cwd=checkout)
         if status > 0:
             if "already been built" in output:
                 warn_out("Build has been submitted previously, continuing...")
@@ -354,10 +536,7 @@ def _build(self, branch):
                     "  Status code: %s\n" % status,
                     "  Output: %s\n" % output,
                 ])
-
-        # Print the task ID and URL:
-        for line in extract_task_info(output):
-            print(line)
+        return output
 
     def _git_upload_sources(self, project_checkout):
         """
@@ -371,21 +550,65 @@ def _git_upload_sources(self, project_checkout):
             debug("No sources need to be uploaded.")
             return
 
+        cmd = self._lookaside_command(project_checkout, sources)
+        if cmd is None:
+            info_out("Lookaside cache already has all sources, "
+                "skipping upload.")
+            return
+
         print("Uploading sources to lookaside:")
-        os.chdir(project_checkout)
-        cmd = '%s new-sources %s' % (self.cli_tool, " ".join(sources))
         debug(cmd)
 
         if self.dry_run:
             self.print_dry_run_warning(cmd)
             return
 
-        output = run_command(cmd)
+        output = run_command(cmd, cwd=project_checkout)
         debug(output)
         debug("Adding write permission for:")
         for filename in sources:
             run_command("chmod u+w %s" % filename)
 
+    def _lookaside_command(self, project_checkout, sources):
+        """
+        Return the command uploading sources to the lookaside cache, or None
+        if the checkout's sources file lists all of them, and nothing else,
+        with their current checksums.
+
+        Sources missing from the file are added with "upload" as long as all
+        listed ones are unchanged. Changed or dropped sources replace the
+        whole list with "new-sources".
+        """
+        listed = parse_sources_file(os.path.join(project_checkout, "sources"))
+        names = [os.path.basename(source) for source in sources]
+        known = [source for source in sources
+            if os.path.basename(source) in listed]
+
+        def changed(source):
+            algorithm, checksum = listed[os.path.basename(source)]
+            try:
+                return file_checksum(source, algorithm) != checksum
+            except ValueError:
+                debug("Unsupported checksum type %s for %s" % (algorithm,
+                    source))
+                return True
+
+        # Hashing large tarballs takes a while, do all of them at once:
+        workers = min(len(known), os.cpu_count() or 1) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            changed_sources = [source for source, is_changed in
+                zip(known, executor.map(changed, known)) if is_changed]
+        added = [source for source in sources if source not in known]
+        removed = [name for name in listed if name not in names]
+        debug("Lookaside sources changed: %s, added: %s, removed: %s" % (
+            changed_sources, added, removed))
+
+        if changed_sources or removed:
+            return '%s new-sources %s' % (self.cli_tool, " ".join(sources))
+        if added:
+            return '%s upload %s' % (self.cli_tool, " ".join(added))
+        return None
+
     def _list_files_to_copy(self):
         """
         Returns a list of the full file paths for each file that should be
@@ -454,24 +677,18 @@ def _git_sync_files(self, project_checkout):
         debug("Searching for files to copy to build system git:")
         files_to_copy = self._list_files_to_copy()
 
-        os.chdir(project_checkout)
-
         new, copied, old =  \
                 self._sync_files(files_to_copy, project_checkout)
 
-        os.chdir(project_checkout)
+        # Git add everything and clean up obsolete files, these are base
+        # filenames so this must run in the checkout:
+        git_stage(add=new + copied, remove=old, cwd=project_checkout)
 
-        # Git add everything:
-        for add_file in (new + copied):
-            run_command("git add %s" % add_file)
 
-        # Cleanup obsolete files:
-        for cleanup_file in old:
-            # Can't delete via full path, must not chdir:
-            run_command("git rm %s" % cleanup_file)
+class DistGitReleaser(FedoraGitReleaser):
 
+    KOJI_CLI = "brew"
 
-class DistGitReleaser(FedoraGitReleaser):
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
             target=None, releaser_config=None, no_cleanup=False,
@@ -515,21 +732,23 @@ def __init__(self, name=None, tag=None, build_dir=None,
 
     def _git_release(self):
         os.makedirs(self.working_dir, exist_ok=True)
-        with chdir(self.working_dir):
-            run_command("{cli_tool} clone {project_name}".format(cli_tool=self.cli_tool,
-                                                                 project_name=self.project_name))
-
-        with chdir(self.package_workdir):
-            run_command("{cli_tool} fork".format(cli_tool=self.cli_tool))
-            run_command("git fetch {username}".format(username=self.username))
-            self.new_branch_name = "release-branch-{timestamp}".format(
-                timestamp=int(datetime.datetime.utcnow().timestamp()))
-            run_command("git checkout -b {new_branch_name} {username}/{branch}".format(
-                new_branch_name=self.new_branch_name,
-                username=self.username,
-                branch=self.git_branches[0]))
-
-        # Mead builds need to be in the git_root.  Other builders are agnostic.
+        self._clone()
+
+        run_command("{cli_tool} fork".format(cli_tool=self.cli_tool),
+                    cwd=self.package_workdir)
+        run_command("git fetch {username}".format(username=self.username),
+                    cwd=self.package_workdir)
+        self.new_branch_name = "release-branch-{timestamp}".format(
+            timestamp=int(datetime.datetime.utcnow().timestamp()))
+        run_command("git checkout -b {new_branch_name} {username}/{branch}".format(
+            new_branch_name=self.new_branch_name,
+            username=self.username,
+            branch=self.git_branches[0]), cwd=self.package_workdir)
+
+        # Builders still run commands in the current directory and expect
+        # the git root there (Mead builds clone it from it), so this changes
+        # the working directory of the whole process. Parallel releases are
+        # only safe because every target runs in a process of its own.
         with chdir(self.git_root):
             self.builder.tgz()
             self.builder.copy_and_download_extra_sources()
@@ -598,17 +817,17 @@ def _sync_mead_scm(self):
             self.print_dry_run_warning(cmd)
             return
 
-        with chdir(self.git_root):
-            info_out("Syncing local repo with %s" % self.push_url)
-            try:
-                run_command(cmd)
-            except RunCommandException as e:
-                if "rejected" in e.output:
-                    if self._ask_yes_no("The remote rejected a push.  Force push? [y/n] ", False):
-                        run_command("git push --force %s %s" % (self.mead_scm, self.builder.build_tag))
-                    else:
-                        error_out("Could not sync with %s" % self.mead_scm)
-                raise
+        info_out("Syncing local repo with %s" % self.push_url)
+        try:
+            run_command(cmd, cwd=self.git_root)
+        except RunCommandException as e:
+            if "rejected" in e.output:
+                if self._ask_yes_no("The remote rejected a push.  Force push? [y/n] ", False):
+                    run_command("git push --force %s %s" % (self.mead_scm,
+                        self.builder.build_tag), cwd=self.git_root)
+                else:
+                    error_out("Could not sync with %s" % self.mead_scm)
+            raise
 
     def _git_release(self):
         self._sync_mead_scm()
@@ -633,19 +852,19 @@ def _git_upload_sources(self, project_checkout):
             }
             rendered_chain = template.safe_substitute(values)
 
-        with chdir(project_checkout):
-            with open("mead.chain", "w") as f:
-                f.write(rendered_chain)
+        with open(os.path.join(project_checkout, "mead.chain"), "w") as f:
+            f.write(rendered_chain)
 
-            cmd = "git add mead.chain"
-            if self.dry_run:
-                self.print_dry_run_warning(cmd)
-                info_out("Chain file contents:\n%s" % rendered_chain)
-            else:
-                run_command(cmd)
+        cmd = "git add mead.chain"
+        if self.dry_run:
+            self.print_dry_run_warning(cmd)
+            info_out("Chain file contents:\n%s" % rendered_chain)
+        else:
+            run_command(cmd, cwd=project_checkout)
 
-    def _build(self, branch):
-        """ Submit a Mead build from current directory. """
+    def _build(self, branch, checkout=None):
+        """ Submit a Mead build from the package checkout. """
+        checkout = checkout or self.package_workdir
         target_param = ""
         build_target = self._get_build_target_for_branch(branch)
         if build_target:
@@ -656,7 +875,7 @@ def _build(self, branch):
         if self.brew_target:
             build_cmd.append("--target=%s" % self.brew_target)
 
-        build_cmd.append("--ini=%s" % (os.path.join(self.package_workdir, "mead.chain")))
+        build_cmd.append("--ini=%s" % (os.path.join(checkout, "mead.chain")))
         build_cmd.append(target_param)
 
         if self.scratch:
@@ -669,7 +888,7 @@ def _build(self, branch):
             return
 
         info_out("Submitting build: %s" % build_cmd)
-        (status, output) = getstatusoutput(build_cmd)
+        (status, output) = getstatusoutput(build_cmd, cwd=checkout)
         if status > 0:
             if "already been built" in output:
                 warn_out("Build has been submitted previously, continuing...")
@@ -679,10 +898,33 @@ def _build(self, branch):
                     "  Status code: %s\n" % status,
                     "  Output: %s\n" % output,
                 ])
+        return output
 
-        # Print the task ID and URL:
-        for line in extract_task_info(output):
-            print(line)
+
+def parse_sources_file(path):
+    """
+    Return a dictionary mapping the file names listed in a dist-git sources
+    file to their (hashlib algorithm, checksum).
+    """
+    listed = {}
+    if not os.path.exists(path):
+        return listed
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            match = SOURCES_LINE_RE.match(line)
+            if match:
+                listed[match.group("name")] = (
+                    match.group("algorithm").lower(),
+                    match.group("checksum").lower())
+                continue
+            match = LEGACY_SOURCES_LINE_RE.match(line)
+            if match:
+                listed[match.group("name")] = ("md5",
+                    match.group("checksum").lower())
+            elif line:
+                debug("Ignoring unknown line in %s: %s" % (path, line))
+    return listed
 
 
 def extract_task_info(output):
@@ -0,0 +1,158 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+In-process client for submitting builds to Koji, used instead of running the
+koji command once per tag when the koji Python library is installed.
+"""
+
+import json
+import os
+import posixpath
+import random
+import time
+
+from optparse import Values
+from xmlrpc.client import Fault
+
+try:
+    # Optional dependency, without it builds are submitted with the koji
+    # command line client:
+    import koji
+    from koji_cli.lib import activate_session
+except ImportError:
+    koji = None
+
+from tito.common import debug, file_checksum, file_lock, mkdir_p
+
+
+class UploadRecord(object):
+    """
+    Files uploaded to Koji hubs, by content hash, kept in a JSON file so
+    retrying a release does not upload the same SRPM again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, hub, checksum):
+        """ Return where a file was uploaded to on a hub, None if it was not. """
+        return self._load().get(hub, {}).get(checksum)
+
+    def add(self, hub, checksum, location):
+        mkdir_p(os.path.dirname(self.path))
+        with file_lock("%s.lock" % self.path):
+            data = self._load()
+            data.setdefault(hub, {})[checksum] = location
+            tmp_path = "%s.tmp" % self.path
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.rename(tmp_path, self.path)
+
+
+class KojiSession(object):
+    """
+    One authenticated session to a Koji hub, submitting all builds of a
+    release in a single multicall.
+    """
+
+    def __init__(self, session, weburl=None, uploads=None):
+        self.session = session
+        self.weburl = weburl
+        # UploadRecord of earlier uploads to reuse, if any:
+        self.uploads = uploads
+
+    @classmethod
+    def connect(cls, profile=None, conf_file=None, uploads=None):
+        """
+        Log in to the hub of a koji profile, configured the same way as
+        for the koji command.
+        """
+        config = koji.read_config(profile or "koji", user_config=conf_file)
+        debug("Connecting to Koji hub %s" % config['server'])
+        session = koji.ClientSession(config['server'],
+            koji.grab_session_options(config))
+        activate_session(session, Values(config))
+        return cls(session, config.get('weburl'), uploads)
+
+    def upload(self, path):
+        """
+        Upload a file, returning its location on the hub. A file with the
+        same content which is still there from an earlier upload is used
+        instead.
+        """
+        name = os.path.basename(path)
+        checksum = file_checksum(path)
+        hub = self.session.baseurl
+        if self.uploads:
+            location = self.uploads.get(hub, checksum)
+            if location and self._uploaded(location, os.path.getsize(path)):
+                print("Reusing earlier upload of %s" % name)
+                return location
+
+        server_dir = "tito-build/%r.%s" % (time.time(),
+            random.randint(0, 1 << 32))
+        print("Uploading %s..." % name)
+        self.session.uploadWrapper(path, server_dir)
+        location = "%s/%s" % (server_dir, name)
+        if self.uploads:
+            self.uploads.add(hub, checksum, location)
+        return location
+
+    def _uploaded(self, location, size):
+        """ Check an earlier upload is still complete on the hub. """
+        server_dir, name = posixpath.split(location)
+        try:
+            info = self.session.checkUpload(server_dir, name)
+        except (koji.GenericError, Fault) as e:
+            debug("Unable to check upload %s: %s" % (location, e))
+            return False
+        # Sizes come as strings when they do not fit XML-RPC integers:
+        return bool(info) and int(info.get('size', -1)) == size
+
+    def submit_builds(self, builds, opts=None):
+        """
+        Submit a list of (target, source) builds. Sources which are local
+        files are uploaded first, each of them once no matter how many
+        targets build it, see upload().
+
+        Returns a list of (target, task ID, error), error being None for
+        each build which was submitted.
+        """
+        uploaded = {}
+        for target, source in builds:
+            if source not in uploaded and os.path.isfile(source):
+                uploaded[source] = self.upload(source)
+
+        with self.session.multicall(strict=False) as multicall:
+            calls = [(target, multicall.build(uploaded.get(source, source),
+                target, opts or {})) for target, source in builds]
+
+        results = []
+        for target, call in calls:
+            try:
+                results.append((target, call.result, None))
+            except (koji.GenericError, Fault) as e:
+                results.append((target, None, e))
+        return results
+
+    def task_url(self, task_id):
+        if not self.weburl:
+            return None
+        return "%s/taskinfo?taskID=%s" % (self.weburl.rstrip("/"), task_id)
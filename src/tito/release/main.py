@@ -14,19 +14,29 @@
 Code for submitting builds for release.
 """
 
-import copy
 import os
-import sys
+import re
 import rpm
 
-from tempfile import mkdtemp
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import mkdtemp, mkstemp
 import shutil
 
-from tito.common import create_builder, debug, \
-    run_command, get_project_name, warn_out, error_out
-from tito.compat import PY2, dictionary_override
-from tito.exception import TitoException
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from tito.common import copy_file, create_builder, debug, \
+    run_command, get_project_name, warn_out, error_out, info_out, \
+    file_checksum, file_lock, get_cache_dir, mkdir_p
+from tito.compat import PY2, dictionary_override, getstatusoutput
+from tito.exception import RunCommandException, TitoException
 from tito.config_object import ConfigObject
+from tito.release import kojisession
+from tito.release.rpmindex import RpmIndex, entry_evr, header_evr, \
+    header_string, read_rpm_header
+from tito.release.tasks import extract_task_ids
 
 # List of files to protect when syncing:
 PROTECTED_BUILD_SYS_FILES = ('branch', 'Makefile', 'sources', ".git", ".gitignore", ".osc", "tito-mead-url",
@@ -51,6 +61,7 @@ def __init__(self, name=None, tag=None, build_dir=None,
             test=False, auto_accept=False, **kwargs):
 
         ConfigObject.__init__(self, config=config)
+        self.user_config = user_config
         config_builder_args = self._parse_builder_args(releaser_config, target)
         if test:
             config_builder_args['test'] = [True]  # builder must know to build from HEAD
@@ -71,6 +82,9 @@ def __init__(self, name=None, tag=None, build_dir=None,
         if 'offline' in kwargs:
             self.offline = kwargs['offline']
 
+        # Start from scratch instead of reusing cached checkouts and mirrors:
+        self.no_cache = kwargs.get('no_cache', False)
+
         # Config for all releasers:
         self.releaser_config = releaser_config
 
@@ -85,7 +99,9 @@ def __init__(self, name=None, tag=None, build_dir=None,
         self.builder = create_builder(name, tag,
                 config,
                 build_dir, user_config, self.builder_args,
-                builder_class=builder_class, offline=self.offline)
+                builder_class=builder_class, offline=self.offline,
+                broker=kwargs.get('broker'),
+                no_cache=self.no_cache)
 
         self.project_name = self.builder.project_name
 
@@ -98,6 +114,9 @@ def __init__(self, name=None, tag=None, build_dir=None,
         self.auto_accept = auto_accept  # don't ask for input, just go ahead
         self.no_cleanup = no_cleanup
 
+        # Build system tasks started by this release, see _task_submitted():
+        self.tasks = []
+
         self._check_releaser_config()
 
     def _ask_yes_no(self, prompt="Y/N? ", default_auto_answer=True):
@@ -114,6 +133,14 @@ def _ask_yes_no(self, prompt="Y/N? ", default_auto_answer=True):
             if answer in answers:
                 return answer in yes
 
+    def _task_submitted(self, label, task_id, kind="koji", client="koji"):
+        """
+        Remember a task this release started in a build system, so
+        tito release --watch can follow it. kind is the kind of service
+        known to tito.release.tasks, client the command to query it with.
+        """
+        self.tasks.append((label, kind, client, task_id))
+
     def _check_releaser_config(self):
         """
         Verify this release target has all the config options it needs.
@@ -176,9 +203,17 @@ def print_dry_run_warning(self, command_that_would_be_run_otherwise):
         print
 
     def _sync_files(self, files_to_copy, dest_dir):
+        """
+        Copy files into dest_dir, skipping those it already has with the
+        same content.
+
+        Files are replaced by renaming a complete copy over them, never
+        written in place. Returns lists of the base filenames which were
+        added, which were changed and which are no longer among
+        files_to_copy and need to be removed by the caller.
+        """
         debug("Copying files: %s" % files_to_copy)
         debug("   to: %s" % dest_dir)
-        os.chdir(dest_dir)
 
         # Need a list of just the filenames for a set comparison later:
         filenames_to_copy = []
@@ -201,12 +236,17 @@ def _sync_files(self, files_to_copy, dest_dir):
             if not os.path.exists(dest_path):
                 print("   adding: %s" % base_filename)
                 new_files.append(base_filename)
+            elif os.path.getsize(copy_me) == os.path.getsize(dest_path) and \
+                    file_checksum(copy_me) == file_checksum(dest_path):
+                debug("   unchanged: %s" % base_filename)
+                continue
             else:
                 print("   copying: %s" % base_filename)
                 copied_files.append(base_filename)
 
-            cmd = "cp %s %s" % (copy_me, dest_path)
-            run_command(cmd)
+            tmp_path = "%s.tito-tmp" % dest_path
+            copy_file(copy_me, tmp_path)
+            os.rename(tmp_path, dest_path)
 
         # Track filenames that will need to be deleted by the caller.
         for filename in os.listdir(dest_dir):
@@ -248,6 +288,8 @@ def __init__(self, name=None, tag=None, build_dir=None,
 
         self.build_dir = build_dir
         self.prefix = prefix
+        # Files each repository did not have before we copied them in:
+        self.new_files = {}
 
         if self.releaser_config.has_option(self.target, "scl"):
             warn_out("please rename 'scl' to 'builder.scl' in releasers.conf")
@@ -272,51 +314,111 @@ def release(self, dry_run=False, no_build=False, scratch=False):
         if self.releaser_config.has_option(self.target, 'rsync_args'):
             self.rsync_args = self.releaser_config.get(self.target, 'rsync_args')
 
-        rsync_locations = self.releaser_config.get(self.target, 'rsync').split(" ")
-        for rsync_location in rsync_locations:
+        rsync_locations = []
+        for rsync_location in self.releaser_config.get(self.target, 'rsync').split(" "):
             if RSYNC_USERNAME in os.environ:
                 print("%s set, using rsync username: %s" % (RSYNC_USERNAME,
                         os.environ[RSYNC_USERNAME]))
                 rsync_location = "%s@%s" % (os.environ[RSYNC_USERNAME], rsync_location)
+            rsync_locations.append(rsync_location)
+
+        if len(rsync_locations) == 1:
+            self._release_to_location(rsync_locations[0])
+            return
+
+        # Locations are independent of each other, update all at once:
+        with ThreadPoolExecutor(max_workers=len(rsync_locations)) as executor:
+            futures = [executor.submit(self._release_to_location, location)
+                for location in rsync_locations]
+        for future in futures:
+            future.result()
+
+    def _release_to_location(self, rsync_location):
+        """
+        Sync the remote repository down, add our packages and sync it back up.
 
+        The repository is kept in a local mirror between releases, so only
+        what changed on the remote is downloaded. With --no-cache, a fresh
+        temporary directory is used instead.
+        """
+        if self.no_cache:
             # Make a temp directory to sync the existing repo contents into:
             temp_dir = mkdtemp(dir=self.build_dir, prefix=self.prefix)
-
             self._rsync_from_remote(self.rsync_args, rsync_location, temp_dir)
             self._copy_files_to_temp_dir(temp_dir)
             self.process_packages(temp_dir)
             self.rsync_to_remote(self.rsync_args, temp_dir, rsync_location)
+            if not self.no_cleanup:
+                debug("Cleaning up [%s]" % temp_dir)
+                shutil.rmtree(temp_dir)
+            else:
+                warn_out("leaving %s (--no-cleanup)" % temp_dir)
+            return
+
+        mirror = self._mirror_dir(rsync_location)
+        # Exists from the moment we change the mirror until it was pushed:
+        dirty_marker = "%s.dirty" % mirror
+        with file_lock("%s.lock" % mirror):
+            self._update_mirror(rsync_location, mirror)
+            open(dirty_marker, "w").close()
+            self._copy_files_to_temp_dir(mirror)
+            self.process_packages(mirror)
+            self.rsync_to_remote(self.rsync_args, mirror, rsync_location)
+            if not self.dry_run:
+                os.unlink(dirty_marker)
+
+    def _mirror_dir(self, rsync_location):
+        """ Location of the local mirror of an rsync location. """
+        name = re.sub(r'[^\w.-]+', '_', rsync_location).strip('_')
+        return os.path.join(get_cache_dir(self.user_config), "rsync", name)
+
+    def _update_mirror(self, rsync_location, mirror):
+        """
+        Bring the mirror in line with the remote repository.
+
+        Modification times are preserved in both directions, so rsync's
+        quick check finds unchanged files. If the last release did not
+        push its changes, files are compared by checksum instead. If the
+        mirror can not be updated at all, it is downloaded again.
+        """
+        rsync_args = "%s -t --delete" % self.rsync_args
+        if os.path.exists("%s.dirty" % mirror):
+            info_out("Last release did not finish, verifying %s" % mirror)
+            rsync_args += " --checksum"
+        mkdir_p(mirror)
+        try:
+            self._rsync_from_remote(rsync_args, rsync_location, mirror)
+        except RunCommandException as e:
+            warn_out("Unable to update %s, downloading it again: %s" % (mirror,
+                e.output))
+            shutil.rmtree(mirror, ignore_errors=True)
+            mkdir_p(mirror)
+            self._rsync_from_remote("%s -t" % self.rsync_args, rsync_location,
+                mirror)
 
     def _rsync_from_remote(self, rsync_args, rsync_location, temp_dir):
-        os.chdir(temp_dir)
         print("rsync %s %s %s" % (rsync_args, rsync_location, temp_dir))
-        output = run_command("rsync %s %s %s" % (rsync_args, rsync_location, temp_dir))
+        output = run_command("rsync %s %s %s" % (rsync_args, rsync_location,
+            temp_dir), cwd=temp_dir)
         debug(output)
 
     def rsync_to_remote(self, rsync_args, temp_dir, rsync_location):
-        print("rsync %s --delete %s/ %s" % (rsync_args, temp_dir, rsync_location))
-        os.chdir(temp_dir)
-        # TODO: configurable rsync options?
-        cmd = "rsync %s --delete %s/ %s" % (rsync_args, temp_dir, rsync_location)
+        # Keep modification times, the next pull compares against them:
+        cmd = "rsync %s -t --delete %s/ %s" % (rsync_args, temp_dir,
+            rsync_location)
+        print(cmd)
         if self.dry_run:
             self.print_dry_run_warning(cmd)
         else:
-            output = run_command(cmd)
+            output = run_command(cmd, cwd=temp_dir)
             debug(output)
-        if not self.no_cleanup:
-            debug("Cleaning up [%s]" % temp_dir)
-            os.chdir("/")
-            shutil.rmtree(temp_dir)
-        else:
-            warn_out("leaving %s (--no-cleanup)" % temp_dir)
 
     def _copy_files_to_temp_dir(self, temp_dir):
-        os.chdir(temp_dir)
-
         # overwrite default self.filetypes if filetypes option is specified in config
         if self.releaser_config.has_option(self.target, 'filetypes'):
             self.filetypes = self.releaser_config.get(self.target, 'filetypes').split(" ")
 
+        new_files = self.new_files.setdefault(temp_dir, [])
         for artifact in self.builder.artifacts:
             if artifact.endswith('.tar.gz'):
                 artifact_type = 'tgz'
@@ -329,7 +431,10 @@ def _copy_files_to_temp_dir(self, temp_dir):
 
             if artifact_type in self.filetypes:
                 print("copy: %s > %s" % (artifact, temp_dir))
-                shutil.copy(artifact, temp_dir)
+                if not os.path.exists(os.path.join(temp_dir,
+                        os.path.basename(artifact))):
+                    new_files.append(os.path.basename(artifact))
+                copy_file(artifact, temp_dir)
 
     def process_packages(self, temp_dir):
         """ no-op. This will be overloaded by a subclass if needed. """
@@ -355,7 +460,7 @@ class YumRepoReleaser(RsyncReleaser):
     # Default list of packages to copy
     filetypes = ['rpm']
 
-    # By default run createrepo_c without any paramaters
+    # Command used to rebuild the repodata from scratch:
     createrepo_command = "createrepo_c ."
 
     def __init__(self, name=None, tag=None, build_dir=None,
@@ -370,58 +475,124 @@ def _read_rpm_header(self, ts, new_rpm_path):
         """
         Read RPM header for the given file.
         """
-        fd = os.open(new_rpm_path, os.O_RDONLY)
-        header = ts.hdrFromFdno(fd)
-        os.close(fd)
-        return header
+        return read_rpm_header(ts, new_rpm_path)
 
     def process_packages(self, temp_dir):
-        self.prune_other_versions(temp_dir)
+        removed = self.prune_other_versions(temp_dir)
         print("Refreshing yum repodata...")
         if self.releaser_config.has_option(self.target, 'createrepo_command'):
             self.createrepo_command = self.releaser_config.get(self.target, 'createrepo_command')
-        os.chdir(temp_dir)
-        output = run_command(self.createrepo_command)
+            output = run_command(self.createrepo_command, cwd=temp_dir)
+        elif self.releaser_config.has_option(self.target, 'createrepo_full') \
+                and self.releaser_config.getboolean(self.target,
+                    'createrepo_full'):
+            output = run_command(self.createrepo_command, cwd=temp_dir)
+        else:
+            output = self._update_repodata(temp_dir, removed)
         debug(output)
 
+    def _update_repodata(self, temp_dir, removed):
+        """
+        Update the existing repodata instead of generating it from scratch.
+
+        createrepo_c takes the package list from the old metadata with
+        --recycle-pkglist, so only the packages we added are passed to it
+        and the ones we removed are excluded. With --update, packages whose
+        size and modification time are unchanged keep their old metadata,
+        a package we replaced under the same name is read again. Checksums
+        are kept in a cache directory between releases.
+
+        If createrepo_c is too old for that, there is no repodata yet or
+        the old metadata lists files which are gone, the list of all
+        packages in the repository is passed instead.
+        """
+        added = [name for name in self.new_files.get(temp_dir, [])
+            if name.endswith(".rpm")]
+        debug("Updating repodata, %s packages added, %s removed" % (
+            len(added), len(removed)))
+        cmd = "createrepo_c --update"
+        if not self.no_cache:
+            cachedir = "%s.createrepo-cache" % os.path.normpath(temp_dir)
+            mkdir_p(cachedir)
+            cmd = "%s --cachedir %s" % (cmd, cachedir)
+
+        if self._createrepo_recycles_pkglist() and os.path.exists(
+                os.path.join(temp_dir, "repodata", "repomd.xml")):
+            delta = "%s --recycle-pkglist%s" % (cmd, "".join(
+                " --excludes %s" % quote(path) for path in removed))
+            try:
+                return self._run_createrepo(delta, added, temp_dir)
+            except RunCommandException as e:
+                warn_out("Unable to update repodata from the old package "
+                    "list, listing all packages: %s" % e.output)
+
+        packages = []
+        for dirpath, dirnames, filenames in os.walk(temp_dir):
+            dirnames[:] = [d for d in dirnames if d != "repodata"]
+            packages.extend(os.path.relpath(os.path.join(dirpath, filename),
+                temp_dir) for filename in filenames
+                if filename.endswith(".rpm"))
+        return self._run_createrepo(cmd, packages, temp_dir)
+
+    def _createrepo_recycles_pkglist(self):
+        """ Check whether createrepo_c knows --recycle-pkglist (0.17+). """
+        (status, output) = getstatusoutput("createrepo_c --help")
+        return status == 0 and "--recycle-pkglist" in output
+
+    def _run_createrepo(self, cmd, packages, temp_dir):
+        """ Run createrepo_c in temp_dir for the given list of packages. """
+        if not packages:
+            return run_command("%s ." % cmd, cwd=temp_dir)
+        # It may not end up in the repository we sync back up:
+        pkglist_fd, pkglist = mkstemp(dir=self.build_dir,
+            prefix="%spkglist-" % self.prefix)
+        with os.fdopen(pkglist_fd, "w") as f:
+            f.write("".join("%s\n" % package for package in sorted(packages)))
+        try:
+            return run_command("%s --pkglist %s ." % (cmd, pkglist),
+                cwd=temp_dir)
+        finally:
+            os.unlink(pkglist)
+
     def prune_other_versions(self, temp_dir):
         """
         Cleanout any other version of the package we just built.
 
         Both older and newer packages will be removed (can be used
         to downgrade the contents of a yum repo).
+
+        Versions in the repository are looked up in an index kept next to
+        it, see tito.release.rpmindex. Returns the deleted file names.
         """
-        os.chdir(temp_dir)
         rpm_ts = rpm.TransactionSet()
-        self.new_rpm_dep_sets = {}
+        new_evrs = {}
         for artifact in self.builder.artifacts:
             if artifact.endswith(".rpm") and not artifact.endswith(".src.rpm"):
                 try:
                     header = self._read_rpm_header(rpm_ts, artifact)
                 except rpm.error:
                     continue
-                rpm_ds = rpm.ds(header, rpm.RPMTAG_NEVR)
-                self.new_rpm_dep_sets[header['name']] = rpm_ds
+                new_evrs[header_string(header, 'name')] = header_evr(header)
+
+        index_path = None
+        if not self.no_cache:
+            index_path = "%s.rpm-index.json" % os.path.normpath(temp_dir)
+        index = RpmIndex(temp_dir, index_path, self._read_rpm_header)
+        index.update()
 
         # Now cleanout any other version of the package we just built,
         # both older or newer. (can be used to downgrade the contents
         # of a yum repo)
-        for filename in os.listdir(temp_dir):
-            if not filename.endswith(".rpm"):
-                continue
-            full_path = os.path.join(temp_dir, filename)
-            try:
-                hdr = self._read_rpm_header(rpm_ts, full_path)
-            except rpm.error:
-                e = sys.exc_info()[1]
-                print("error reading rpm header in '%s': %s" % (full_path, e))
-                continue
-            if hdr['name'] in self.new_rpm_dep_sets:
-                dep_set = rpm.ds(header, rpm.RPMTAG_NEVR)
-                if dep_set.EVR() < self.new_rpm_dep_sets[hdr['name']].EVR():
-                    print("Deleting old package: %s" % filename)
+        removed = []
+        for name, new_evr in new_evrs.items():
+            for entry in index.lookup(name):
+                if rpm.labelCompare(entry_evr(entry), new_evr) != 0:
+                    print("Deleting other version of package: %s" %
+                        entry['file'])
                     run_command("rm %s" % os.path.join(temp_dir,
-                        filename))
+                        entry['file']))
+                    removed.append(entry['file'])
+        return removed
 
 
 class KojiReleaser(Releaser):
@@ -435,6 +606,8 @@ class KojiReleaser(Releaser):
     REQUIRED_CONFIG = ['autobuild_tags']
     NAME = "Koji"
     DEFAULT_KOJI_OPTS = "build --nowait"
+    # Submit builds with the koji Python library when it is installed:
+    KOJI_LIBRARY = True
 
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -486,12 +659,17 @@ def _koji_release(self):
         if 'KOJI_OPTIONS' in self.builder.user_config:
             koji_opts = self.builder.user_config['KOJI_OPTIONS']
 
+        # The same options for builds submitted in process:
+        build_opts = {}
+
         scratch = self.scratch or ('SCRATCH' in os.environ and os.environ['SCRATCH'] == '1')
         if scratch:
             koji_opts = ' '.join([koji_opts, '--scratch'])
+            build_opts['scratch'] = True
 
         if scratch and (self.test or self.builder.test):
             koji_opts = ' '.join([koji_opts, '--no-rebuild-srpm'])
+            build_opts['rebuild_srpm'] = False
 
         if self.profile:
             koji_opts = ' '.join(['--profile', self.profile, koji_opts])
@@ -499,6 +677,16 @@ def _koji_release(self):
         if self.conf_file:
             koji_opts = ' '.join(['--config', self.conf_file, koji_opts])
 
+        # Global options of the build command, used to query its tasks:
+        words = koji_opts.split()
+        if "build" in words:
+            words = words[:words.index("build")]
+        self.koji_client = " ".join([self.executable] + words)
+
+        # Koji tags we submit to, along with the (disttag, scl) variant of
+        # the srpm each of them needs:
+        submissions = []
+
         # TODO: need to re-do this metaphor to use release targets instead:
         for koji_tag in koji_tags:
             if self.only_tags and koji_tag not in self.only_tags:
@@ -527,17 +715,76 @@ def _koji_release(self):
                 ])
                 continue
 
-            # Getting tricky here, normally Builder's are only used to
-            # create one rpm and then exit. Here we're going to try
-            # to run multiple srpm builds:
-            builder = self.builder
-            if not self.skip_srpm:
-                if scl:
-                    builder = copy.copy(self.builder)
-                    builder.scl = scl
-                builder.srpm(dist=disttag)
+            submissions.append((koji_tag, (disttag, scl or None)))
+
+        # Getting tricky here, normally Builder's are only used to
+        # create one rpm and then exit. Here we build one srpm for each
+        # distinct disttag and scl, tags sharing them share the srpm:
+        srpms = {}
+        if not self.skip_srpm and submissions:
+            srpms = self.builder.build_srpms(
+                [variant for (koji_tag, variant) in submissions])
+
+        builds = [(koji_tag, srpms.get(variant, self.builder.srpm_location))
+            for (koji_tag, variant) in submissions]
+        session = self._koji_session() if builds else None
+        if session:
+            self._submit_builds(session, builds, build_opts)
+            return
+        for koji_tag, srpm_location in builds:
+            self._submit_build(self.executable, koji_opts, koji_tag,
+                srpm_location)
 
-            self._submit_build(self.executable, koji_opts, koji_tag, builder.srpm_location)
+    def _koji_session(self):
+        """
+        Return a session to submit all builds in process, or None if they
+        have to be submitted with the koji command.
+
+        Options given in KOJI_OPTIONS are meant for the command, so setting
+        them keeps using it.
+        """
+        if self.dry_run or not self.KOJI_LIBRARY or not kojisession.koji \
+                or 'KOJI_OPTIONS' in self.builder.user_config:
+            return None
+        uploads = None
+        if not self.no_cache:
+            uploads = kojisession.UploadRecord(os.path.join(
+                get_cache_dir(self.user_config), "koji-uploads.json"))
+        try:
+            return kojisession.KojiSession.connect(self.profile,
+                self.conf_file, uploads)
+        except Exception as e:
+            warn_out("Unable to open a %s session, using the %s command: %s" %
+                (self.NAME, self.executable, e))
+            return None
+
+    def _build_source(self, srpm_location):
+        """ Return what Koji should build for the given srpm. """
+        return srpm_location
+
+    def _submit_builds(self, session, builds, build_opts):
+        """
+        Submit (tag, srpm) builds with one Koji session, all of them in a
+        single call.
+        """
+        builds = [(tag, self._build_source(srpm_location))
+            for (tag, srpm_location) in builds]
+        for tag, source in builds:
+            print("\nSubmitting build of %s to %s" % (source, tag))
+
+        failed = []
+        for tag, task_id, error in session.submit_builds(builds, build_opts):
+            if error:
+                warn_out("Submitting build to %s failed: %s" % (tag, error))
+                failed.append(tag)
+                continue
+            print("Created task: %s" % task_id)
+            if session.task_url(task_id):
+                print("Task info: %s" % session.task_url(task_id))
+            self._task_submitted(tag, task_id, "koji", self.koji_client)
+        if failed:
+            error_out("Unable to submit builds to %s: %s" % (self.NAME,
+                " ".join(failed)))
 
     def __is_whitelisted(self, koji_tag, scl):
         """ Return true if package is whitelisted in tito.props"""
@@ -553,7 +800,8 @@ def __is_blacklisted(self, koji_tag, scl):
 
     def _submit_build(self, executable, koji_opts, tag, srpm_location):
         """ Submit srpm to brew/koji. """
-        cmd = "%s %s %s %s" % (executable, koji_opts, tag, srpm_location)
+        cmd = "%s %s %s %s" % (executable, koji_opts, tag,
+            self._build_source(srpm_location))
         print("\nSubmitting build with: %s" % cmd)
 
         if self.dry_run:
@@ -562,6 +810,8 @@ def _submit_build(self, executable, koji_opts, tag, srpm_location):
 
         output = run_command(cmd)
         print(output)
+        for task_id in extract_task_ids(output):
+            self._task_submitted(tag, task_id, "koji", self.koji_client)
 
 
 class KojiGitReleaser(KojiReleaser):
@@ -576,22 +826,11 @@ def _koji_release(self):
         self.skip_srpm = True
         KojiReleaser._koji_release(self)
 
-    def _submit_build(self, executable, koji_opts, tag, srpm_location):
+    def _build_source(self, srpm_location):
         """
-        Submit build to koji using the git URL from config. We will ignore
-        srpm_location here.
+        Build from the git URL in config, we will ignore srpm_location here.
 
-        NOTE: overrides KojiReleaser._submit_build.
+        NOTE: overrides KojiReleaser._build_source.
         """
-        cmd = "%s %s %s %s/#%s" % \
-                (executable, koji_opts, tag,
-                        self.releaser_config.get(self.target, 'git_url'),
-                        self.builder.build_tag)
-        print("\nSubmitting build with: %s" % cmd)
-
-        if self.dry_run:
-            self.print_dry_run_warning(cmd)
-            return
-
-        output = run_command(cmd)
-        print(output)
+        return "%s/#%s" % (self.releaser_config.get(self.target, 'git_url'),
+            self.builder.build_tag)
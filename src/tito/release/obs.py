@@ -12,11 +12,14 @@
 # in this software or its documentation.
 
 import os
+import shutil
 import tempfile
 import subprocess
 import sys
 
-from tito.common import run_command, debug
+from tito.common import run_command, debug, copy_file, file_lock, \
+    get_cache_dir, info_out, warn_out
+from tito.exception import RunCommandException
 from tito.compat import getoutput, write, getstatusoutput
 from tito.release.distgit import FedoraGitReleaser
 from tito.bugtracker import BugzillaExtractor
@@ -32,8 +35,9 @@ def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
             target=None, releaser_config=None, no_cleanup=False,
             test=False, auto_accept=False, **kwargs):
-        FedoraGitReleaser.__init__(self, name, tag, build_dir,
-                user_config, target, releaser_config, no_cleanup, test, auto_accept)
+        FedoraGitReleaser.__init__(self, name, tag, build_dir, config,
+                user_config, target, releaser_config, no_cleanup, test,
+                auto_accept, **kwargs)
 
         self.obs_project_name = \
             self.releaser_config.get(self.target, "project_name")
@@ -51,10 +55,7 @@ def release(self, dry_run=False, no_build=False, scratch=False):
         self.no_build = no_build
 
         getoutput("mkdir -p %s" % self.working_dir)
-        os.chdir(self.working_dir)
-        run_command("%s co %s %s" % (self.cli_tool, self.obs_project_name, self.obs_package_name))
-
-        os.chdir(self.package_workdir)
+        self._checkout()
 
         self.builder.tgz()
         if self.test:
@@ -63,6 +64,47 @@ def release(self, dry_run=False, no_build=False, scratch=False):
         self._obs_sync_files(self.package_workdir)
         self._obs_user_confirm_commit(self.package_workdir)
 
+    def _checkout(self):
+        """
+        Check the package out into package_workdir.
+
+        A checkout of the package is kept in the cache directory between
+        releases. Releases bring it up to date with osc up and work on a
+        copy of it, so a failed release never leaves changes behind in it.
+        Package files are hardlinked into the copy, _sync_files() replaces
+        rather than rewrites the ones which changed.
+        """
+        co_cmd = "%s co %s %s" % (self.cli_tool, self.obs_project_name,
+            self.obs_package_name)
+        if self.no_cache:
+            run_command(co_cmd, cwd=self.working_dir)
+            return
+
+        cache_dir = os.path.join(get_cache_dir(self.user_config), "obs")
+        cached = os.path.join(cache_dir, self.obs_project_name,
+            self.obs_package_name)
+        with file_lock(os.path.join(cache_dir, "%s.lock" %
+                self.obs_project_name)):
+            updated = False
+            if os.path.isdir(cached):
+                info_out("Updating checkout: %s" % cached)
+                try:
+                    run_command("%s up" % self.cli_tool, cwd=cached)
+                    updated = True
+                except RunCommandException as e:
+                    warn_out("Unable to update %s, checking out again: %s" %
+                        (cached, e.output))
+                    shutil.rmtree(cached, ignore_errors=True)
+            if not updated:
+                run_command(co_cmd, cwd=cache_dir)
+
+            project_dir = os.path.dirname(self.package_workdir)
+            if os.path.isdir(os.path.join(os.path.dirname(cached), ".osc")):
+                shutil.copytree(os.path.join(os.path.dirname(cached), ".osc"),
+                    os.path.join(project_dir, ".osc"), symlinks=True)
+            shutil.copytree(cached, self.package_workdir, symlinks=True,
+                copy_function=_link_package_file)
+
     def _confirm_commit_msg(self, diff_output):
         """
         Generates a commit message in a temporary file, gives the user a
@@ -109,9 +151,8 @@ def _obs_user_confirm_commit(self, project_checkout):
         print("#" * len(text))
         print("")
 
-        os.chdir(project_checkout)
-
-        (status, diff_output) = getstatusoutput("%s diff" % self.cli_tool)
+        (status, diff_output) = getstatusoutput("%s diff" % self.cli_tool,
+            cwd=project_checkout)
 
         if diff_output.strip() == "":
             print("No changes in main branch, skipping commit.")
@@ -134,8 +175,7 @@ def _obs_user_confirm_commit(self, project_checkout):
                 self.print_dry_run_warning(cmd)
             else:
                 print("Proceeding with commit.")
-                os.chdir(self.package_workdir)
-                print(run_command(cmd))
+                print(run_command(cmd, cwd=self.package_workdir))
 
             os.unlink(commit_msg_file)
 
@@ -157,11 +197,17 @@ def _obs_sync_files(self, project_checkout):
         debug("Searching for files to copy to build system osc checkout:")
         files_to_copy = self._list_files_to_copy()
 
-        os.chdir(project_checkout)
-
         self._sync_files(files_to_copy, project_checkout)
 
-        os.chdir(project_checkout)
-
         # Add/remove everything:
-        run_command("%s addremove" % (self.cli_tool))
+        run_command("%s addremove" % (self.cli_tool), cwd=project_checkout)
+
+
+def _link_package_file(src, dst):
+    """
+    Hardlink a file of a cached osc checkout, copying it if it is osc
+    metadata, which osc may change in place, or can not be linked.
+    """
+    copy_file(src, dst, allow_link=".osc" not in src.split(os.sep),
+        preserve=True)
+    return dst
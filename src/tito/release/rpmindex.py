@@ -0,0 +1,164 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Index of the RPMs in a yum repository, so releases do not have to read every
+header in it to find the other versions of the packages they add.
+"""
+
+import json
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import rpm
+
+from tito.common import debug, mkdir_p
+
+# Bumped whenever the format of the index file changes:
+INDEX_VERSION = 1
+
+
+def read_rpm_header(ts, path):
+    """ Read the header of the RPM at path. """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return ts.hdrFromFdno(fd)
+    finally:
+        os.close(fd)
+
+
+def header_string(header, tag):
+    """ Return a string tag of an RPM header, older bindings give bytes. """
+    value = header[tag]
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    return value
+
+
+def header_evr(header):
+    """ Return the (epoch, version, release) of an RPM header. """
+    return (str(header['epoch'] or 0), header_string(header, 'version'),
+        header_string(header, 'release'))
+
+
+def entry_evr(entry):
+    """ Return the (epoch, version, release) of an index entry. """
+    return (entry['epoch'], entry['version'], entry['release'])
+
+
+class RpmIndex(object):
+    """
+    Name, epoch, version and release of every RPM in a directory, grouped by
+    package name and kept in a JSON file between releases.
+
+    An entry stays valid as long as the size and modification time of its
+    file do not change. Headers of new or changed files are read again, in
+    parallel, each thread with a transaction set of its own.
+    """
+
+    def __init__(self, repo_dir, path=None, read_header=read_rpm_header):
+        self.repo_dir = repo_dir
+        # Without a path the index only lives in memory:
+        self.path = path
+        self.read_header = read_header
+        # Maps package names to a list of entries, see _read_entry():
+        self.packages = {}
+        self._local = threading.local()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            debug("Ignoring unreadable RPM index: %s" % self.path)
+            return {}
+        if data.get('version') != INDEX_VERSION:
+            return {}
+        return data.get('packages', {})
+
+    def save(self):
+        if not self.path:
+            return
+        mkdir_p(os.path.dirname(self.path))
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, "w") as f:
+            json.dump({'version': INDEX_VERSION, 'packages': self.packages},
+                f)
+        os.rename(tmp_path, self.path)
+
+    def _read_entry(self, filename, stat):
+        """
+        Read the header of one RPM, returning its index entry or None if it
+        can not be read.
+        """
+        if not hasattr(self._local, "ts"):
+            self._local.ts = rpm.TransactionSet()
+        full_path = os.path.join(self.repo_dir, filename)
+        try:
+            header = self.read_header(self._local.ts, full_path)
+        except rpm.error as e:
+            print("error reading rpm header in '%s': %s" % (full_path, e))
+            return None
+        epoch, version, release = header_evr(header)
+        return {
+            'file': filename,
+            'name': header_string(header, 'name'),
+            'epoch': epoch,
+            'version': version,
+            'release': release,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+        }
+
+    def update(self):
+        """
+        Bring the index in line with the RPMs currently in the directory and
+        save it.
+        """
+        known = {}
+        for entries in self._load().values():
+            for entry in entries:
+                known[entry['file']] = entry
+
+        entries = []
+        stale = []
+        for filename in sorted(os.listdir(self.repo_dir)):
+            if not filename.endswith(".rpm"):
+                continue
+            stat = os.stat(os.path.join(self.repo_dir, filename))
+            entry = known.get(filename)
+            if entry and entry['size'] == stat.st_size and \
+                    entry['mtime'] == stat.st_mtime_ns:
+                entries.append(entry)
+            else:
+                stale.append((filename, stat))
+
+        if stale:
+            debug("Reading %s RPM headers in %s" % (len(stale), self.repo_dir))
+            workers = min(len(stale), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                read = executor.map(lambda args: self._read_entry(*args),
+                    stale)
+                entries.extend(entry for entry in read if entry)
+
+        self.packages = {}
+        for entry in entries:
+            self.packages.setdefault(entry['name'], []).append(entry)
+        self.save()
+
+    def lookup(self, name):
+        """ Return the entries of all RPMs of the named package. """
+        return self.packages.get(name, [])
@@ -0,0 +1,197 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Code for following build system tasks submitted during a release until they
+finish.
+"""
+
+import asyncio
+import re
+import sys
+
+from asyncio.subprocess import PIPE, STDOUT
+
+from tito.common import debug, info_out
+
+TASK_ID_RE = re.compile(r'Created task:?\s+(\d+)')
+
+TASK_STATE_RE = re.compile(r'^State:\s*(\S+)', re.MULTILINE)
+
+COPR_BUILD_IDS_RE = re.compile(r'Created builds?:\s*([\d ]+)')
+
+# Upper bound for the number of concurrent state queries:
+MAX_QUERIES = 8
+
+# Give up on a task after this many queries in a row failed:
+MAX_FAILED_QUERIES = 5
+
+
+def extract_task_ids(output):
+    """ Extracts the IDs of all tasks created in koji/brew build output. """
+    return [int(task_id) for task_id in TASK_ID_RE.findall(output)]
+
+
+def extract_copr_build_ids(output):
+    """ Extracts the IDs of all builds created in copr-cli build output. """
+    return [int(build_id) for match in COPR_BUILD_IDS_RE.findall(output)
+        for build_id in match.split()]
+
+
+class KojiTasks(object):
+    """ Queries the state of koji (or brew) tasks. """
+
+    kind = "koji"
+    SUCCEEDED = ("closed",)
+    FINISHED = ("closed", "failed", "canceled")
+
+    def __init__(self, cli="koji"):
+        self.cli = cli
+
+    def command(self, task_id):
+        return "%s taskinfo %s" % (self.cli, task_id)
+
+    def parse_state(self, output):
+        match = TASK_STATE_RE.search(output)
+        if not match:
+            return None
+        return match.group(1).lower()
+
+
+class CoprBuilds(object):
+    """ Queries the state of Copr builds. """
+
+    kind = "copr"
+    SUCCEEDED = ("succeeded", "skipped")
+    FINISHED = ("succeeded", "skipped", "failed", "canceled")
+
+    def __init__(self, cli="copr-cli"):
+        self.cli = cli
+
+    def command(self, task_id):
+        return "%s status %s" % (self.cli, task_id)
+
+    def parse_state(self, output):
+        lines = output.strip().splitlines()
+        if not lines:
+            return None
+        return lines[-1].strip().lower()
+
+
+# Maps the kind of a task to the class querying it:
+TASK_SERVICES = {
+    KojiTasks.kind: KojiTasks,
+    CoprBuilds.kind: CoprBuilds,
+}
+
+
+def task_service(kind, cli):
+    """ Return the object querying tasks of the given kind with cli. """
+    return TASK_SERVICES[kind](cli)
+
+
+class TaskWatcher(object):
+    """
+    Polls the state of koji, brew or Copr tasks until all of them finished.
+
+    Tasks are added with a label, such as the branch they build, which is
+    used to report on them. Every task is followed by a coroutine of its
+    own, querying the service with its command line client. The time
+    between queries of a task starts at poll_interval and doubles after
+    each of them, up to max_interval.
+    """
+
+    def __init__(self, koji_cli="koji", poll_interval=10, max_interval=300):
+        self.koji_cli = koji_cli
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        # List of (label, task ID, service) in the order they were added:
+        self.tasks = []
+        # Maps indexes into self.tasks to the last known state:
+        self.states = {}
+
+    def add(self, label, task_id, service=None):
+        """ Follow a task, a koji task of koji_cli unless service is given. """
+        self.tasks.append((label, task_id, service or KojiTasks(self.koji_cli)))
+
+    async def _query(self, service, task_id, queries):
+        async with queries:
+            process = await asyncio.create_subprocess_shell(
+                service.command(task_id), stdout=PIPE, stderr=STDOUT)
+            output = (await process.communicate())[0].decode("utf-8",
+                "replace")
+        if process.returncode:
+            debug("Unable to query task %s: %s" % (task_id, output))
+            return None
+        return service.parse_state(output)
+
+    async def _follow(self, index, queries):
+        label, task_id, service = self.tasks[index]
+        interval = self.poll_interval
+        failed_queries = 0
+        while True:
+            state = await self._query(service, task_id, queries)
+            if state is None:
+                failed_queries += 1
+                if failed_queries >= MAX_FAILED_QUERIES:
+                    print("%s: unable to query task %s, giving up" % (label,
+                        task_id))
+                    return
+            else:
+                failed_queries = 0
+            if state and state != self.states.get(index):
+                print("%s: task %s is %s" % (label, task_id, state))
+                sys.stdout.flush()
+                self.states[index] = state
+            if state in service.FINISHED:
+                return
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_interval)
+
+    async def _follow_all(self):
+        queries = asyncio.Semaphore(MAX_QUERIES)
+        await asyncio.gather(*[self._follow(index, queries)
+            for index in range(len(self.tasks))])
+
+    def wait(self):
+        """
+        Poll until every task finished, reporting state changes as they
+        happen. Returns a dictionary mapping task IDs to their final state.
+        """
+        if self.tasks:
+            info_out("Waiting for %s tasks to finish..." % len(self.tasks))
+            loop = asyncio.new_event_loop()
+            # Subprocesses need the loop set for the current thread on
+            # older Python versions:
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self._follow_all())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+        return dict((task_id, self.states.get(index))
+            for index, (_label, task_id, _service) in enumerate(self.tasks))
+
+    def failed(self):
+        """ Return the labels of all tasks which did not succeed. """
+        return [label for index, (label, task_id, service)
+            in enumerate(self.tasks)
+            if self.states.get(index) not in service.SUCCEEDED]
+
+    def print_summary(self):
+        """ Print one table with the state of all tasks. """
+        print("")
+        print("%-24s %-12s %s" % ("BUILD", "TASK", "STATE"))
+        for index, (label, task_id, _service) in enumerate(self.tasks):
+            print("%-24s %-12s %s" % (label, task_id,
+                self.states.get(index, "unknown")))
+        print("")
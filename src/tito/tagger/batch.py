@@ -0,0 +1,139 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Tagging all packages changed since their last tag at once, with one commit
+for all of them followed by their tags.
+"""
+
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from tito.common import debug, git_stage, run_command
+from tito.compat import getstatusoutput
+from tito.exception import TitoException
+
+# Upper bound for the number of packages looked at or tagged at the same time:
+MAX_WORKERS = 8
+
+
+def read_package_metadata(rel_eng_dir):
+    """
+    Return (package name, relative dir) for every package with metadata in
+    .tito/packages/, sorted by name.
+    """
+    packages = []
+    metadata_dir = os.path.join(rel_eng_dir, "packages")
+    for name in sorted(os.listdir(metadata_dir)):
+        path = os.path.join(metadata_dir, name)
+        if name.startswith(".") or os.path.isdir(path):
+            continue
+        with open(path) as f:
+            relative_dir = f.readline().strip().split(" ")[1]
+        # Single project git repos:
+        if relative_dir in ["/", "./"]:
+            relative_dir = ""
+        packages.append((name, relative_dir))
+    return packages
+
+
+def _git_output(command, git_root):
+    status, output = getstatusoutput(command, cwd=git_root)
+    if status != 0:
+        debug("Command failed: %s\n%s" % (command, output))
+        return ""
+    return output.strip()
+
+
+def package_changed(git_root, rel_eng_dir, name, relative_dir):
+    """
+    Check whether anything changed in the package's directory after the
+    commit which last updated its metadata, the commit of its last tag.
+    """
+    if not os.path.isdir(os.path.join(git_root, relative_dir)):
+        debug("Skipping %s, %s no longer exists" % (name, relative_dir))
+        return False
+    metadata_file = os.path.relpath(os.path.join(rel_eng_dir, "packages",
+        name), git_root)
+    last_tagged = _git_output("git log -1 --format=%%H -- %s" %
+        quote(metadata_file), git_root)
+    if not last_tagged:
+        debug("Skipping %s, its metadata is not committed" % name)
+        return False
+    return bool(_git_output("git log -1 --format=%%H %s..HEAD -- %s" % (
+        last_tagged, quote(relative_dir or ".")), git_root))
+
+
+def find_changed_packages(git_root, rel_eng_dir):
+    """
+    Return (package name, relative dir) for every package with changes
+    since it was last tagged, checking all packages in parallel.
+    """
+    packages = read_package_metadata(rel_eng_dir)
+
+    def changed(package):
+        return package_changed(git_root, rel_eng_dir, *package)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(changed, packages))
+    return [package for package, result in zip(packages, results) if result]
+
+
+def tag_packages(create_tagger, packages, options, git_root,
+        max_workers=MAX_WORKERS):
+    """
+    Tag a new version of all packages in one commit.
+
+    create_tagger is called with the name and full directory of each
+    package and returns its tagger. The taggers update spec files and
+    changelogs in parallel, then all their files are staged and committed
+    together and finally each package is tagged.
+
+    Returns the list of new tags.
+    """
+    def tag(package):
+        name, relative_dir = package
+        tagger = create_tagger(name, os.path.normpath(os.path.join(
+            git_root, relative_dir)))
+        tagger.defer_commit = True
+        tagger.run(options)
+        if getattr(tagger, "new_version", None) is None:
+            raise TitoException("%s can not tag %s along with other "
+                "packages" % (tagger.__class__.__name__, name))
+        return tagger
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        taggers = list(executor.map(tag, packages))
+
+    add, remove = [], []
+    for tagger in taggers:
+        add.extend(path for path in tagger._files_to_add if path not in add)
+        remove.extend(path for path in tagger._files_to_remove
+            if path not in remove)
+    git_stage(add=add, remove=remove)
+
+    messages = [tagger._commit_message(tagger.new_version)
+        for tagger in taggers]
+    if len(messages) > 1:
+        messages.insert(0, "Automatic commit of %s packages." % len(messages))
+    messages.extend(["Created by command:", " ".join(sys.argv[:])])
+    run_command("git commit %s" % " ".join("-m %s" % quote(message)
+        for message in messages), cwd=git_root)
+
+    return [tagger._create_tag(tagger.new_version) for tagger in taggers]
@@ -1,7 +1,7 @@
 import re
 import os
 
-from tito.common import debug, run_command
+from tito.common import debug, git_stage
 
 
 class CargoBump:
@@ -14,10 +14,13 @@ class CargoBump:
     """
 
     @staticmethod
-    def tag_new_version(project_path, new_version_release):
+    def tag_new_version(project_path, new_version_release, staged=None):
         """
         Find the line with version number  and change
         it to contain the new version.
+
+        The updated file is appended to the staged list if given, for the
+        caller to git add with its other files, otherwise it is added now.
         """
         file_name = "Cargo.toml"
         config_file = os.path.join(project_path, file_name)
@@ -41,7 +44,10 @@ def tag_new_version(project_path, new_version_release):
             cfgfile.writelines(map(lambda x: x + "\n", file_buffer))
 
         # Add Cargo.toml into git index
-        run_command("git add %s" % file_name)
+        if staged is not None:
+            staged.append(config_file)
+        else:
+            git_stage(add=[config_file])
 
     @staticmethod
     def process_cargo_toml(input_string, new_version):
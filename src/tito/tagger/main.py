@@ -38,7 +38,7 @@
         tag_exists_locally, tag_exists_remotely, head_points_to_tag, undo_tag,
         increase_version, reset_release, increase_zstream, warn_out,
         BUILDCONFIG_SECTION, get_relative_project_dir_cwd, info_out,
-        get_git_user_info)
+        get_git_user_info, git_stage)
 from tito.compat import write, StringIO, getstatusoutput
 from tito.exception import TitoException
 from tito.config_object import ConfigObject
@@ -54,16 +54,18 @@ class VersionTagger(ConfigObject):
     and the actual RPM "release" will always be set to 1.
     """
 
-    def __init__(self, config=None, keep_version=False, offline=False, user_config=None):
+    def __init__(self, config=None, keep_version=False, offline=False, user_config=None,
+            project_dir=None):
         ConfigObject.__init__(self, config=config)
         self.user_config = user_config
 
-        self.full_project_dir = os.getcwd()
-        self.spec_file_name = find_spec_like_file()
-        self.project_name = get_project_name(tag=None)
+        self.full_project_dir = project_dir or os.getcwd()
+        self.spec_file_name = find_spec_like_file(self.full_project_dir)
+        self.project_name = get_project_name(tag=None,
+            in_dir=self.full_project_dir)
 
         self.relative_project_dir = get_relative_project_dir_cwd(
-            self.git_root)  # i.e. java/
+            self.git_root, self.full_project_dir)  # i.e. java/
 
         self.spec_file = os.path.join(self.full_project_dir,
                 self.spec_file_name)
@@ -83,6 +85,15 @@ def __init__(self, config=None, keep_version=False, offline=False, user_config=N
         self._changelog = None
         self.offline = offline
 
+        # Files to git add and git rm, staged all at once for the commit:
+        self._files_to_add = []
+        self._files_to_remove = []
+
+        # Set when tagging many packages at once, which commits the files
+        # of all of them together and then creates the tags:
+        self.defer_commit = False
+        self.new_version = None
+
     def run(self, options):
         """
         Perform the actions requested of the tagger.
@@ -136,7 +147,8 @@ def _tag_release(self):
         new_version = self._bump_version()
         self._check_tag_does_not_exist(self._get_new_tag(new_version))
         self._update_changelog(new_version)
-        CargoBump.tag_new_version(self.full_project_dir, new_version)
+        CargoBump.tag_new_version(self.full_project_dir, new_version,
+            self._files_to_add)
         self._update_setup_py(new_version)
         self._update_pom_xml(new_version)
         self._update_package_metadata(new_version)
@@ -217,7 +229,7 @@ def _generate_default_changelog(self, last_tag):
             patch_command += " --no-merges"
         patch_command += " --pretty='format:%s' --relative %s..%s -- %s" % (
             self._changelog_format(), last_tag, "HEAD", ".")
-        output = run_command(patch_command)
+        output = run_command(patch_command, cwd=self.full_project_dir)
         result = []
         for line in output.split('\n'):
             line = line.replace('%', '%%')
@@ -356,7 +368,7 @@ def _update_setup_py(self, new_version):
         f.close()
         buf.close()
 
-        run_command("git add %s" % setup_file)
+        self._files_to_add.append(setup_file)
 
     def _update_pom_xml(self, new_version):
         """
@@ -378,8 +390,8 @@ def _update_pom_xml(self, new_version):
 
         run_command("mvn %s versions:set -DnewVersion=%s -DgenerateBackupPoms=false" % (
             " ".join(maven_args),
-            mvn_new_version))
-        run_command("git add %s" % pom_file)
+            mvn_new_version), cwd=self.full_project_dir)
+        self._files_to_add.append(pom_file)
 
     def _bump_version(self, release=False, zstream=False):
         """
@@ -455,6 +467,8 @@ def _update_package_metadata(self, new_version):
         file here stores the latest package version (for the git branch you
         are on) as well as the relative path to the project's code. (from the
         git root)
+
+        Then commits and tags the new version, unless defer_commit is set.
         """
         self._clear_package_metadata()
 
@@ -462,22 +476,49 @@ def _update_package_metadata(self, new_version):
         # Write out our package metadata:
         metadata_file = os.path.join(self.rel_eng_dir, "packages",
                 self.project_name)
-
-        with open(metadata_file, 'w') as f:
-            f.write("%s %s\n" % (new_version_w_suffix, self.relative_project_dir))
+        self._write_package_metadata(metadata_file, new_version_w_suffix)
 
         # Git add it (in case it's a new file):
-        run_command("git add %s" % metadata_file)
-        run_command("git add %s" % os.path.join(self.full_project_dir,
+        self._files_to_add.append(metadata_file)
+        self._files_to_add.append(os.path.join(self.full_project_dir,
             self.spec_file_name))
 
+        self.new_version = new_version
+        if self.defer_commit:
+            return
+        self._stage_files()
+
+        run_command('git commit -m {0} -m {1} -m {2}'.format(
+            quote(self._commit_message(new_version)),
+            quote("Created by command:"), quote(" ".join(sys.argv[:]))))
+
+        new_tag = self._create_tag(new_version)
+        print
+        info_out("Created tag: %s" % new_tag)
+        print("   View: git show HEAD")
+        print("   Undo: tito tag -u")
+        print("   Push: git push --follow-tags origin")
+
+    def _write_package_metadata(self, metadata_file, version):
+        """
+        Replace the metadata file in one step, other packages tagged at
+        the same time read it.
+        """
+        tmp_file = os.path.join(os.path.dirname(metadata_file),
+            ".%s.tmp" % os.path.basename(metadata_file))
+        with open(tmp_file, 'w') as f:
+            f.write("%s %s\n" % (version, self.relative_project_dir))
+        os.rename(tmp_file, metadata_file)
+
+    def _commit_message(self, new_version):
+        """ Return the message for the commit of a new version. """
         fmt = ('Automatic commit of package '
                '[%(name)s] %(release_type)s [%(version)s].')
         if self.config.has_option(BUILDCONFIG_SECTION, "tag_commit_message_format"):
             fmt = self.config.get(BUILDCONFIG_SECTION, "tag_commit_message_format")
         new_version_w_suffix = self._get_suffixed_version(new_version)
         try:
-            msg = fmt % {
+            return fmt % {
                 'name': self.project_name,
                 'release_type': self.release_type(),
                 'version': new_version_w_suffix,
@@ -487,9 +528,8 @@ def _update_package_metadata(self, new_version):
             raise TitoException('Unknown placeholder %s in tag_commit_message_format'
                                 % exc)
 
-        run_command('git commit -m {0} -m {1} -m {2}'.format(
-            quote(msg), quote("Created by command:"), quote(" ".join(sys.argv[:]))))
-
+    def _create_tag(self, new_version):
+        """ Tag the new version at HEAD, returns the new tag. """
         new_tag = self._get_new_tag(new_version)
         tag_msg = "Tagging package [%s] version [%s] in directory [%s]." % \
                 (self.project_name, new_tag,
@@ -502,11 +542,7 @@ def _update_package_metadata(self, new_version):
                 sign_tag = "-s "
 
         run_command('git tag %s -m "%s" %s' % (sign_tag, tag_msg, new_tag))
-        print
-        info_out("Created tag: %s" % new_tag)
-        print("   View: git show HEAD")
-        print("   Undo: tito tag -u")
-        print("   Push: git push --follow-tags origin")
+        return new_tag
 
     def _check_tag_does_not_exist(self, new_tag):
         status, output = getstatusoutput(
@@ -545,7 +581,16 @@ def _clear_package_metadata(self):
                 else:
                     warn_out("%s also references %s" % (filename, self.relative_project_dir))
                     print("Assuming package has been renamed and removing it.")
-                    run_command("git rm %s" % metadata_file)
+                    self._files_to_remove.append(metadata_file)
+
+    def _stage_files(self):
+        """
+        Stage all files added and removed while tagging in the git index,
+        with one git add and one git rm.
+        """
+        git_stage(add=self._files_to_add, remove=self._files_to_remove)
+        self._files_to_add = []
+        self._files_to_remove = []
 
     def _get_new_tag(self, version_and_release):
         """ Returns the actual tag we'll be creating. """
@@ -607,7 +652,7 @@ def _update_version_file(self, new_version):
             release=new_rel))
         f.close()
 
-        run_command("git add %s" % version_file)
+        self._files_to_add.append(version_file)
 
     def _version_file_template(self):
         """
@@ -633,9 +678,12 @@ def _version_file_path(self):
         provide a version file to write in tito.props, like
             [version_template]
             destination_file = ./foo.rb
+
+        relative to the project directory, not wherever tito was run from.
         """
         if self.config.has_option("version_template", "destination_file"):
-            return self.config.get("version_template", "destination_file")
+            return os.path.join(self.full_project_dir,
+                self.config.get("version_template", "destination_file"))
         return None
 
 
@@ -29,7 +29,7 @@ def _generate_default_changelog(self, last_tag):
         """
         patch_command = "git log --pretty='format:%%s%s'" \
                          " --relative %s..%s -- %s" % (self._changelog_format(), last_tag, "HEAD", ".")
-        output = run_command(patch_command)
+        output = run_command(patch_command, cwd=self.full_project_dir)
         BZ = {}
         result = None
         for line in reversed(output.split('\n')):
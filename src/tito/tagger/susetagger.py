@@ -33,9 +33,11 @@ class SUSETagger(VersionTagger):
     tagger = tito.susetagger.SUSETagger
     """
 
-    def __init__(self, config=None, keep_version=False, offline=False, user_config=None):
+    def __init__(self, config=None, keep_version=False, offline=False, user_config=None,
+            project_dir=None):
         VersionTagger.__init__(self, config=config, keep_version=keep_version,
-                               offline=offline, user_config=user_config)
+                               offline=offline, user_config=user_config,
+                               project_dir=project_dir)
         self.today = strftime("%a %b %d %T %Z %Y")
         self.changes_file_name = self.spec_file_name.replace('.spec', '.changes')
         self.changes_file = os.path.join(self.full_project_dir,
@@ -163,40 +165,52 @@ def _update_package_metadata(self, new_version):
         """
         self._clear_package_metadata()
 
-        suffix = ""
-        # If global config specifies a tag suffix, use it:
-        if self.config.has_option("globalconfig", "tag_suffix"):
-            suffix = self.config.get("globalconfig", "tag_suffix")
-
-        new_version_w_suffix = "%s%s" % (new_version, suffix)
+        new_version_w_suffix = self._suffixed_version(new_version)
         # Write out our package metadata:
         metadata_file = os.path.join(self.rel_eng_dir, "packages",
                 self.project_name)
-        f = open(metadata_file, 'w')
-        f.write("%s %s\n" % (new_version_w_suffix, self.relative_project_dir))
-        f.close()
+        self._write_package_metadata(metadata_file, new_version_w_suffix)
 
         # Git add it (in case it's a new file):
-        run_command("git add %s" % metadata_file)
-        run_command("git add %s" % os.path.join(self.full_project_dir,
+        self._files_to_add.append(metadata_file)
+        self._files_to_add.append(os.path.join(self.full_project_dir,
             self.spec_file_name))
         if not self._no_auto_changelog:
-            run_command("git add %s" % os.path.join(self.full_project_dir,
+            self._files_to_add.append(os.path.join(self.full_project_dir,
                 self.changes_file_name))
 
-        run_command('git commit -m "Automatic commit of package ' +
-                '[%s] %s [%s]."' % (self.project_name, self.release_type(),
-                    new_version_w_suffix))
+        self.new_version = new_version
+        if self.defer_commit:
+            return
+        self._stage_files()
 
-        tag_msg = "Tagging package [%s] version [%s] in directory [%s]." % \
-                (self.project_name, new_version_w_suffix,
-                        self.relative_project_dir)
+        run_command('git commit -m "%s"' % self._commit_message(new_version))
 
-        new_tag = self._get_new_tag(new_version)
-        run_command('git tag -m "%s" %s' % (tag_msg, new_tag))
+        new_tag = self._create_tag(new_version)
         print
         print("Created tag: %s" % new_tag)
         print("   View: git show HEAD")
         print("   Undo: tito tag -u")
         print("   Push: git push origin HEAD && git push origin %s" % new_tag)
         print("or Push: git push origin HEAD && git push origin --tags")
+
+    def _suffixed_version(self, new_version):
+        suffix = ""
+        # If global config specifies a tag suffix, use it:
+        if self.config.has_option("globalconfig", "tag_suffix"):
+            suffix = self.config.get("globalconfig", "tag_suffix")
+        return "%s%s" % (new_version, suffix)
+
+    def _commit_message(self, new_version):
+        return "Automatic commit of package [%s] %s [%s]." % (
+            self.project_name, self.release_type(),
+            self._suffixed_version(new_version))
+
+    def _create_tag(self, new_version):
+        tag_msg = "Tagging package [%s] version [%s] in directory [%s]." % \
+                (self.project_name, self._suffixed_version(new_version),
+                        self.relative_project_dir)
+
+        new_tag = self._get_new_tag(new_version)
+        run_command('git tag -m "%s" %s' % (tag_msg, new_tag))
+        return new_tag
@@ -160,6 +160,9 @@ def setUp(self):
         print("Testing in: %s" % self.repo_dir)
         print
 
+        # Keep build results of one test from being reused by another:
+        os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp("-titocache")
+
         # Initialize the repo:
         os.chdir(self.repo_dir)
         run_command('git init')
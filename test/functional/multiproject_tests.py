@@ -143,6 +143,44 @@ def test_release_tagger_use_version(self):
         self.assertFalse(release_bumped(start_ver, new_ver))
         self.assertEqual(new_ver, "1.3.37-1")
 
+    def test_tag_changed(self):
+        # pkg2 changed with its tito.props, change pkg3 too:
+        self.write_file(join(self.repo_dir, 'pkg3', 'b.txt'), "BLERG\n")
+        run_command('git add pkg3/b.txt')
+        run_command("git commit -m 'add b.txt to pkg3'")
+        commits = int(run_command('git rev-list --count HEAD'))
+
+        tito('tag --debug --changed --accept-auto-changelog')
+        self.assertEqual(commits + 1, int(run_command('git rev-list --count HEAD')))
+        self.assertEqual("0.0.1-1", get_latest_tagged_version(TEST_PKG_1))
+        for tag in ["%s-0.0.1-2" % TEST_PKG_2, "%s-0.0.2-1" % TEST_PKG_3]:
+            self.assertTrue(tag_exists_locally(tag))
+            self.assertEqual(run_command('git rev-parse HEAD'),
+                run_command('git rev-list -n 1 %s' % tag))
+
+        # Nothing changed since:
+        tito('tag --debug --changed --accept-auto-changelog')
+        self.assertEqual(commits + 1, int(run_command('git rev-list --count HEAD')))
+
+    def test_tag_changed_version_template(self):
+        self.write_file(join(self.repo_dir, 'pkg3', "tito.props"),
+            TEMPLATE_TAGGER_TITO_PROPS)
+        run_command('mkdir -p %s' % join(self.repo_dir, '.tito/templates'))
+        self.write_file(join(self.repo_dir,
+            '.tito/templates/version.rb'), VERSION_TEMPLATE_FILE)
+        run_command('git add pkg3/tito.props .tito/templates/version.rb')
+        run_command("git commit -m 'add tito.props for pkg3'")
+
+        # Tagged from the git root, the file still belongs in pkg3:
+        tito('tag --debug --changed --accept-auto-changelog')
+        self.assertTrue(tag_exists_locally("%s-0.0.2-1" % TEST_PKG_3))
+        self.assertFalse(os.path.exists(join(self.repo_dir, "version.txt")))
+        dest_file = join(self.repo_dir, 'pkg3', "version.txt")
+        with open(dest_file) as f:
+            self.assertTrue("VERSION = \"0.0.2-1\"" in f.read())
+        self.assertEqual("pkg3/version.txt", run_command(
+            'git ls-files pkg3/version.txt'))
+
     def test_build_tgz(self):
         os.chdir(os.path.join(self.repo_dir, 'pkg1'))
         artifacts = tito('build --tgz')
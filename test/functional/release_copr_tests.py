@@ -64,7 +64,8 @@ def test_with_releaser(self):
             self.config, {}, 'test', self.releaser_config, False,
             False, False, **{'offline': True})
         releaser.release(dry_run=True)
-        self.assertTrue(releaser.srpm_submitted is not None)
+        # Nothing is uploaded in a dry run:
+        self.assertEqual(set(), releaser.srpms_uploaded)
 
     def test_with_remote_defined_in_user_conf(self):
         self.releaser_config.remove_option("test", "remote_location")
@@ -73,7 +74,8 @@ def test_with_remote_defined_in_user_conf(self):
             self.config, user_config, 'test', self.releaser_config, False,
             False, False, **{'offline': True})
         releaser.release(dry_run=True)
-        self.assertTrue(releaser.srpm_submitted is not None)
+        # Nothing is uploaded in a dry run:
+        self.assertEqual(set(), releaser.srpms_uploaded)
 
     @mock.patch("tito.release.CoprReleaser._submit")
     @mock.patch("tito.release.CoprReleaser._upload")
@@ -87,8 +89,11 @@ def test_no_remote_defined(self, upload, submit):
         self.assertFalse(upload.called)
         self.assertTrue(submit.called)
 
+    # Never talk to a real Copr, even if copr-cli is configured:
+    @mock.patch("tito.release.CoprReleaser._koji_session", return_value=None)
     @mock.patch("tito.release.CoprReleaser._run_command")
-    def test_multiple_project_names(self, run_command):
+    def test_multiple_project_names(self, run_command, koji_session):
+        run_command.return_value = ""
         self.releaser_config.remove_option("test", "remote_location")
         self.releaser_config.set('test', 'project_name', "%s %s" % (PKG_NAME,
             PKG_NAME))
@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Functional Tests for the KojiReleaser.
+"""
+
+import os
+import shutil
+import tempfile
+
+from unittest import mock
+
+from functional.fixture import TitoGitTestFixture
+
+from tito.compat import RawConfigParser
+from tito.release import KojiReleaser
+
+PKG_NAME = "releaseme"
+
+
+class KojiReleaserTests(TitoGitTestFixture):
+
+    def setUp(self):
+        TitoGitTestFixture.setUp(self)
+        self.create_project(PKG_NAME)
+
+        self.config = RawConfigParser()
+        self.config.add_section("buildconfig")
+        self.config.set("buildconfig", "builder", "tito.builder.Builder")
+        self.config.set("buildconfig", "offline", "true")
+        for koji_tag, disttag in [("f40-candidate", ".fc40"),
+                ("f40-updates", ".fc40"), ("epel9-candidate", ".el9")]:
+            self.config.add_section(koji_tag)
+            self.config.set(koji_tag, "disttag", disttag)
+
+        self.releaser_config = RawConfigParser()
+        self.releaser_config.add_section('test')
+        self.releaser_config.set('test', 'releaser',
+            'tito.release.KojiReleaser')
+        self.releaser_config.set('test', 'autobuild_tags',
+            'f40-candidate f40-updates epel9-candidate')
+
+        self.output_dir = tempfile.mkdtemp("-titotestoutput")
+
+    def tearDown(self):
+        TitoGitTestFixture.tearDown(self)
+        shutil.rmtree(self.output_dir)
+
+    @mock.patch("tito.release.KojiReleaser._submit_build")
+    def test_srpm_built_once_per_disttag(self, submit_build):
+        releaser = KojiReleaser(PKG_NAME, None, self.output_dir,
+            self.config, {}, 'test', self.releaser_config, False,
+            False, False, **{'offline': True})
+        releaser.release(dry_run=True)
+
+        srpms = dict((c[0][2], c[0][3]) for c in submit_build.call_args_list)
+        self.assertEqual(["epel9-candidate", "f40-candidate", "f40-updates"],
+            sorted(srpms.keys()))
+        self.assertEqual(srpms["f40-candidate"], srpms["f40-updates"])
+        self.assertTrue(srpms["f40-candidate"].endswith(".fc40.src.rpm"))
+        self.assertTrue(srpms["epel9-candidate"].endswith(".el9.src.rpm"))
+        for srpm in srpms.values():
+            self.assertTrue(os.path.exists(srpm))
+            self.assertEqual(self.output_dir, os.path.dirname(srpm))
+        releaser.cleanup()
@@ -0,0 +1,171 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for the manifest of completed build stages. """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from tito.builder import Builder
+from tito.builder.main import BuilderBase
+from tito.buildstate import BuildState
+
+
+class BuildStateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, ".tito-state", "foo.json")
+        self.tgz = self.write("foo-1.0.tar.gz", "tarball")
+        self.srpm = self.write("foo-1.0-1.src.rpm", "srpm")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, contents):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def test_record_and_verify(self):
+        state = BuildState.load(self.path, "key")
+        state.record("sources", [self.tgz], spec_file_name="foo.spec")
+        state.record("srpm", [self.srpm])
+
+        state = BuildState.load(self.path, "key")
+        self.assertEqual("foo.spec",
+            state.verified("sources")['spec_file_name'])
+        self.assertEqual(self.srpm,
+            state.verified("srpm")['files'][0]['path'])
+        self.assertEqual(None, state.verified("rpm"))
+
+    def test_modified_output_is_not_verified(self):
+        state = BuildState.load(self.path, "key")
+        state.record("srpm", [self.srpm])
+        self.write("foo-1.0-1.src.rpm", "other srpm")
+        self.assertEqual(None, state.verified("srpm"))
+        os.remove(self.srpm)
+        self.assertEqual(None, state.verified("srpm"))
+
+    def test_record_invalidates_later_stages(self):
+        state = BuildState.load(self.path, "key")
+        state.record("srpm", [self.srpm])
+        state.record("sources", [self.tgz])
+        self.assertEqual(None, state.verified("srpm"))
+
+    def test_other_inputs_start_over(self):
+        BuildState.load(self.path, "key").record("sources", [self.tgz])
+        self.assertEqual(None,
+            BuildState.load(self.path, "other").verified("sources"))
+
+    def test_file_path(self):
+        state = BuildState(self.path, "key")
+        self.assertEqual(os.path.join(self.tmp_dir, ".tito-state",
+            "foo-foo.spec"), state.file_path("foo.spec"))
+
+
+class ParallelSrpmStateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Bypass the constructor, it needs a whole tito project:
+        self.builder = Builder.__new__(Builder)
+        self.builder.dist = None
+        self.builder.scl = ""
+        self.builder.artifacts = []
+        self.builder.rpmbuild_dir = self.tmp_dir
+        self.builder.rpmbuild_basedir = self.tmp_dir
+        self.builder.build_state = BuildState.load(os.path.join(
+            self.tmp_dir, ".tito-state", "foo.json"), "key")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parallel_builds_leave_state_alone(self):
+        def rpmbuild_srpm(builder, dist):
+            builder.srpm_location = os.path.join(builder.rpmbuild_basedir,
+                "foo-1.0-1%s.src.rpm" % dist)
+            with open(builder.srpm_location, "w") as f:
+                f.write("srpm")
+            builder._record_stage("srpm", [builder.srpm_location])
+
+        with patch.object(Builder, "_prepare_srpm"), \
+                patch.object(Builder, "_rpmbuild_srpm", rpmbuild_srpm):
+            srpms = self.builder.build_srpms([(".el9", None),
+                (".fc40", None)])
+
+        self.assertEqual(os.path.join(self.tmp_dir, "foo-1.0-1.fc40.src.rpm"),
+            srpms[(".fc40", None)])
+        self.assertEqual({}, self.builder.build_state.stages)
+        self.assertFalse(os.path.exists(self.builder.build_state.path))
+
+
+class RpmStagesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.builder = Builder.__new__(Builder)
+        self.builder.spec_file = "foo.spec"
+        self.builder.dist = None
+        self.builder.test = False
+        self.builder.ran_tgz = True
+        self.builder.artifacts = []
+        self.builder.build_state = None
+        self.srpm = os.path.join(self.tmp_dir, "foo-1.0-1.src.rpm")
+        self.rpm = os.path.join(self.tmp_dir, "foo-1.0-1.noarch.rpm")
+        for path in (self.srpm, self.rpm):
+            with open(path, "w") as f:
+                f.write(path)
+        self.rpmbuild_calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_rpmbuild(self, build_args):
+        self.rpmbuild_calls.append(build_args)
+        if build_args.startswith("--nodeps -bs"):
+            return "Wrote: %s\n" % self.srpm
+        if build_args.startswith("-bb"):
+            return "Wrote: %s\n" % self.rpm
+        return "Wrote: %s\nWrote: %s\n" % (self.srpm, self.rpm)
+
+    def build(self):
+        with patch.object(Builder, "_create_build_dirs"), \
+                patch.object(Builder, "copy_extra_sources"), \
+                patch.object(Builder, "_cache_key", return_value=None), \
+                patch.object(Builder, "_run_rpmbuild",
+                    side_effect=self.run_rpmbuild):
+            BuilderBase.rpm(self.builder)
+
+    def test_single_rpmbuild_without_resume(self):
+        self.build()
+        self.assertEqual(["-ba foo.spec"], self.rpmbuild_calls)
+        self.assertEqual(self.srpm, self.builder.srpm_location)
+        self.assertEqual([self.srpm, self.rpm], self.builder.artifacts)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir,
+            ".tito-state")))
+
+    def test_stages_recorded_with_resume(self):
+        self.builder.build_state = BuildState.load(os.path.join(
+            self.tmp_dir, ".tito-state", "foo.json"), "key")
+        with patch.object(Builder, "_record_sources"):
+            self.build()
+        self.assertEqual(["--nodeps -bs foo.spec", "-bb foo.spec"],
+            self.rpmbuild_calls)
+        self.assertEqual([self.srpm, self.rpm], [recorded['path'] for
+            recorded in self.builder.build_state.verified("rpm")['files']])
@@ -0,0 +1,241 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for the artifact cache. """
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from unittest.mock import patch
+
+from tito.builder import Builder
+from tito.cache import ArtifactBroker, ArtifactCache, parse_size
+from tito.common import get_cache_dir
+
+
+class ArtifactCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp_dir, "output")
+        os.makedirs(os.path.join(self.output_dir, "noarch"))
+        self.cache = ArtifactCache(os.path.join(self.tmp_dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_artifact(self, rel_path, contents="rpm"):
+        path = os.path.join(self.output_dir, rel_path)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def test_make_key_is_stable(self):
+        key1 = ArtifactCache.make_key(tree="abc", args={"b": ["1"], "a": ["2"]})
+        key2 = ArtifactCache.make_key(args={"a": ["2"], "b": ["1"]}, tree="abc")
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, ArtifactCache.make_key(tree="abd",
+            args={"a": ["2"], "b": ["1"]}))
+
+    def test_miss(self):
+        self.assertEqual(None, self.cache.restore("nokey", self.output_dir))
+
+    def test_store_and_restore(self):
+        srpm = self._write_artifact("foo-1.0-1.src.rpm", "srpm")
+        rpm = self._write_artifact("noarch/foo-1.0-1.noarch.rpm", "rpm")
+        self.assertTrue(self.cache.store("key", self.output_dir, [srpm, rpm]))
+
+        shutil.rmtree(self.output_dir)
+        restored = self.cache.restore("key", self.output_dir)
+        self.assertEqual([srpm, rpm], restored)
+        with open(rpm) as f:
+            self.assertEqual("rpm", f.read())
+
+    def test_artifacts_outside_base_dir_not_stored(self):
+        outside = os.path.join(self.tmp_dir, "foo-1.0-1.src.rpm")
+        with open(outside, "w") as f:
+            f.write("srpm")
+        self.assertFalse(self.cache.store("key", self.output_dir, [outside]))
+        self.assertEqual(None, self.cache.lookup("key"))
+
+    def test_incomplete_entry_is_a_miss(self):
+        srpm = self._write_artifact("foo-1.0-1.src.rpm")
+        self.cache.store("key", self.output_dir, [srpm])
+        os.unlink(os.path.join(self.cache.cache_dir, "key", "files",
+            "foo-1.0-1.src.rpm"))
+        self.assertEqual(None, self.cache.lookup("key"))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_size = 2500
+        old = self._write_artifact("old.src.rpm", "x" * 1000)
+        self.cache.store("old", self.output_dir, [old])
+        used = self._write_artifact("used.src.rpm", "x" * 1000)
+        self.cache.store("used", self.output_dir, [used])
+
+        # Make "old" the least recently used entry:
+        manifest = os.path.join(self.cache.cache_dir, "old", "manifest.json")
+        past = time.time() - 3600
+        os.utime(manifest, (past, past))
+
+        new = self._write_artifact("new.src.rpm", "x" * 1000)
+        self.cache.store("new", self.output_dir, [new])
+
+        self.assertEqual(None, self.cache.lookup("old"))
+        self.assertNotEqual(None, self.cache.lookup("used"))
+        self.assertNotEqual(None, self.cache.lookup("new"))
+
+    def test_zero_size_disables_cache(self):
+        self.cache.max_size = 0
+        srpm = self._write_artifact("foo-1.0-1.src.rpm")
+        self.assertFalse(self.cache.store("key", self.output_dir, [srpm]))
+
+    def test_parse_size(self):
+        self.assertEqual(100, parse_size("100"))
+        self.assertEqual(512 * 1024, parse_size("512K"))
+        self.assertEqual(2 * 1024 ** 3, parse_size("2G"))
+        self.assertEqual(int(1.5 * 1024 ** 2), parse_size("1.5mb"))
+        self.assertRaises(ValueError, parse_size, "lots")
+
+    def test_cache_dir_from_user_config(self):
+        self.assertEqual("/srv/tito-cache",
+            get_cache_dir({'CACHE_DIR': '/srv/tito-cache'}))
+        cache = ArtifactCache.from_user_config({'CACHE_DIR': self.tmp_dir,
+            'CACHE_MAX_SIZE': '1M'})
+        self.assertEqual(1024 ** 2, cache.max_size)
+        self.assertEqual(os.path.join(self.tmp_dir, "artifacts"),
+            cache.cache_dir)
+
+
+class BuilderCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Bypass the constructor, it needs a whole tito project:
+        self.builder = Builder.__new__(Builder)
+        self.builder.artifact_cache = ArtifactCache(
+            os.path.join(self.tmp_dir, "cache"))
+        self.builder.rpmbuild_basedir = os.path.join(self.tmp_dir, "output")
+        self.builder.git_root = self.tmp_dir
+        self.builder.git_commit_id = "0123456789abcdef"
+        self.builder.relative_project_dir = "/"
+        self.builder.tgz_filename = "foo-1.0.tar.gz"
+        self.builder.test = False
+        self.builder.dist = ".fc40"
+        self.builder.rpmbuild_options = ""
+        self.builder.scl = ""
+        self.builder.args = {}
+        self.builder.incremental = False
+        self.builder.resume = False
+        self.builder.ran_tgz = False
+        self.builder.artifacts = []
+        self.buildroot = "cookie"
+
+        os.makedirs(self.builder.rpmbuild_basedir)
+        self.srpm = os.path.join(self.builder.rpmbuild_basedir,
+            "foo-1.0-1.fc40.src.rpm")
+        with open(self.srpm, "w") as f:
+            f.write("srpm")
+
+        self.patches = [
+            patch("tito.builder.main.run_command", return_value="tree"),
+            patch.object(Builder, "_buildroot_fingerprint",
+                side_effect=lambda: self.buildroot),
+            patch.object(Builder, "tgz"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _cache(self, stage):
+        self.builder.artifact_cache.store(self.builder._cache_key(stage,
+            self.builder.dist), self.builder.rpmbuild_basedir, [self.srpm])
+
+    def test_rpm_hit_skips_tarball(self):
+        self._cache("rpm")
+        self.builder.rpm()
+        self.assertFalse(Builder.tgz.called)
+        self.assertEqual([self.srpm], self.builder.artifacts)
+
+    def test_srpm_hit_skips_tarball(self):
+        self._cache("srpm")
+        self.builder.srpm()
+        self.assertFalse(Builder.tgz.called)
+        self.assertEqual(self.srpm, self.builder.srpm_location)
+
+    def test_buildroot_is_part_of_key(self):
+        key = self.builder._cache_key("rpm", ".fc40")
+        self.buildroot = "other cookie"
+        self.assertNotEqual(key, self.builder._cache_key("rpm", ".fc40"))
+
+    def test_no_key_without_buildroot(self):
+        self.buildroot = None
+        self.assertEqual(None, self.builder._cache_key("rpm", ".fc40"))
+
+
+class ArtifactBrokerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.broker = ArtifactBroker.create(self.tmp_dir)
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _builder(self, dest_dir):
+        def build():
+            self.builds += 1
+            os.makedirs(dest_dir)
+            path = os.path.join(dest_dir, "foo-1.0.tar.gz")
+            with open(path, "w") as f:
+                f.write("tarball")
+            return [path]
+        return build
+
+    def test_built_once(self):
+        first = os.path.join(self.tmp_dir, "first")
+        second = os.path.join(self.tmp_dir, "second")
+        paths, built = self.broker.obtain("key", first, self._builder(first))
+        self.assertTrue(built)
+        self.assertEqual([os.path.join(first, "foo-1.0.tar.gz")], paths)
+
+        paths, built = self.broker.obtain("key", second, self._builder(second))
+        self.assertFalse(built)
+        self.assertEqual(1, self.builds)
+        self.assertEqual([os.path.join(second, "foo-1.0.tar.gz")], paths)
+        with open(paths[0]) as f:
+            self.assertEqual("tarball", f.read())
+
+    def test_failed_build_is_retried(self):
+        def fail():
+            raise Exception("build failed")
+        self.assertRaises(Exception, self.broker.obtain, "key", self.tmp_dir,
+            fail)
+
+        dest = os.path.join(self.tmp_dir, "dest")
+        paths, built = self.broker.obtain("key", dest, self._builder(dest))
+        self.assertTrue(built)
+
+    def test_cleanup(self):
+        dest = os.path.join(self.tmp_dir, "dest")
+        self.broker.obtain("key", dest, self._builder(dest))
+        self.broker.cleanup()
+        self.assertFalse(os.path.exists(self.broker.broker_dir))
+        self.assertTrue(os.path.exists(os.path.join(dest, "foo-1.0.tar.gz")))
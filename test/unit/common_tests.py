@@ -13,8 +13,11 @@
 
 """ Pure unit tests for tito's common module. """
 
+import errno
 import os
 import re
+import shutil
+import tempfile
 import unittest
 
 from unittest.mock import patch, call
@@ -28,10 +31,11 @@
     search_for, compare_version, run_command_print, find_wrote_in_rpmbuild_output,
     render_cheetah, increase_zstream, reset_release, find_file_with_extension,
     normalize_class_name, extract_sha1, munge_specfile,
-    munge_setup_macro, get_project_name,
+    munge_setup_macro, get_project_name, copy_file, git_stage,
     _out)
 
-from tito.compat import StringIO
+from tito.compat import StringIO, getoutput
+from tito.exception import RunCommandException
 from tito.tagger import CargoBump
 
 
@@ -513,3 +517,116 @@ def test_autosetup(self):
         line = "%autosetup -n tito-%{version}"
         self.assertEqual("%autosetup -n " + self.SOURCE + " -p1",
                          munge_setup_macro(self.SOURCE, line))
+
+
+class CopyFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp_dir, "foo-1.0.tar.gz")
+        with open(self.src, "wb") as f:
+            f.write(b"x" * 100000)
+        os.chmod(self.src, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_copy_into_directory(self):
+        dest_dir = os.path.join(self.tmp_dir, "SOURCES")
+        os.mkdir(dest_dir)
+        copied = copy_file(self.src, dest_dir)
+        dst = os.path.join(dest_dir, "foo-1.0.tar.gz")
+        self.assertEqual(self._read(self.src), self._read(dst))
+        # Nothing is copied for a reflink:
+        self.assertTrue(copied in (0, 100000))
+        self.assertEqual(0o640, os.stat(dst).st_mode & 0o777)
+        self.assertFalse(os.path.samefile(self.src, dst))
+
+    def test_plain_copy_fallback(self):
+        dst = os.path.join(self.tmp_dir, "copy.tar.gz")
+        unsupported = OSError(errno.EOPNOTSUPP, "Operation not supported")
+        with patch("tito.common.fcntl.ioctl", side_effect=unsupported), \
+                patch("tito.common.os.copy_file_range", create=True,
+                    side_effect=unsupported):
+            self.assertEqual(100000, copy_file(self.src, dst, preserve=True))
+        self.assertEqual(self._read(self.src), self._read(dst))
+        self.assertEqual(os.stat(self.src).st_mtime, os.stat(dst).st_mtime)
+
+    @patch("tito.common.fcntl.ioctl",
+        side_effect=OSError(errno.EOPNOTSUPP, "Operation not supported"))
+    def test_hardlink_replaces_destination(self, ioctl):
+        dst = os.path.join(self.tmp_dir, "link.tar.gz")
+        other = os.path.join(self.tmp_dir, "other.tar.gz")
+        with open(other, "w") as f:
+            f.write("previous build")
+        os.link(other, dst)
+
+        self.assertEqual(0, copy_file(self.src, dst, allow_link=True))
+        self.assertTrue(ioctl.called)
+        self.assertTrue(os.path.samefile(self.src, dst))
+        self.assertEqual(0, copy_file(self.src, dst, allow_link=True))
+        # The file dst was linked to before is left alone:
+        self.assertEqual(b"previous build", self._read(other))
+
+    @patch("tito.common.os.link")
+    @patch("tito.common.fcntl.ioctl")
+    def test_reflink_before_hardlink(self, ioctl, link):
+        dst = os.path.join(self.tmp_dir, "reflink.tar.gz")
+        self.assertEqual(0, copy_file(self.src, dst, allow_link=True))
+        self.assertTrue(ioctl.called)
+        self.assertFalse(link.called)
+        self.assertFalse(os.path.samefile(self.src, dst))
+
+    @patch("tito.common.os.link")
+    def test_no_hardlink_unless_allowed(self, link):
+        unsupported = OSError(errno.EOPNOTSUPP, "Operation not supported")
+        dst = os.path.join(self.tmp_dir, "copy.tar.gz")
+        with patch("tito.common.fcntl.ioctl", side_effect=unsupported):
+            self.assertEqual(100000, copy_file(self.src, dst))
+        self.assertFalse(link.called)
+        self.assertEqual(self._read(self.src), self._read(dst))
+
+
+class GitStageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        getoutput("git init -q %s" % self.repo)
+        for name in ["foo.spec", "foo*.patch", "foo-1.patch", "old.patch"]:
+            with open(os.path.join(self.repo, name), "w") as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def _index(self):
+        return sorted(getoutput("cd %s && git ls-files" % self.repo)
+            .splitlines())
+
+    def test_add_and_remove(self):
+        git_stage(add=["old.patch"], cwd=self.repo)
+        getoutput("cd %s && git -c user.name=Tito -c user.email=tito@example.com "
+            "commit -q -m old" % self.repo)
+        # A name with glob characters must not match foo-1.patch too:
+        git_stage(add=["foo.spec", "foo*.patch"], remove=["old.patch"],
+            cwd=self.repo)
+        self.assertEqual(["foo*.patch", "foo.spec"], self._index())
+        self.assertFalse(os.path.exists(os.path.join(self.repo, "old.patch")))
+
+    def test_absolute_paths(self):
+        git_stage(add=[os.path.join(self.repo, "foo.spec")], cwd=self.repo)
+        self.assertEqual(["foo.spec"], self._index())
+
+    def test_nothing_to_stage(self):
+        git_stage(add=[], remove=None, cwd=self.repo)
+        self.assertEqual([], self._index())
+
+    @patch("tito.common.error_out")
+    def test_failure(self, error_out):
+        self.assertRaises(RunCommandException, git_stage,
+            remove=["not-in-git.patch"], cwd=self.repo)
+        self.assertTrue(error_out.called)
@@ -0,0 +1,295 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for submitting builds to Copr in process. """
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest.mock import Mock, call, patch
+
+from tito.exception import TitoException
+from tito.release import CoprReleaser
+from tito.release.coprclient import CoprClient, parse_copr_options, requests
+
+
+class FakeCoprFrontend(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the Copr API, recording the builds it gets along
+    with the client port each came from.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.builds = []
+        self.lock = threading.Lock()
+        # Whether uploaded SRPMs get imported and served from a URL:
+        self.import_srpms = True
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FakeCoprHandler)
+        self.url = "http://127.0.0.1:%s" % self.server_address[1]
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeCoprHandler(BaseHTTPRequestHandler):
+
+    # Keep connections open, like the real frontend:
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        build_id = int(self.path.rsplit("/", 1)[-1])
+        with self.server.lock:
+            data = self.server.builds[build_id - 1][1]
+        build = {'id': build_id, 'state': "pending", 'source_package': {
+            'name': None, 'url': None}}
+        if not isinstance(data['pkgs'], bytes):
+            build['source_package']['url'] = data['pkgs']
+        elif self.server.import_srpms:
+            build['source_package']['url'] = "%s/results/%s/a.src.rpm" % (
+                self.server.url, build_id)
+        else:
+            build['state'] = "failed"
+        self._reply(200, build)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        auth = "Basic %s" % base64.b64encode(b"me:secret").decode("ascii")
+        if self.headers.get('Authorization') != auth:
+            return self._reply(401, {'error': "Login invalid/expired"})
+
+        if self.path == "/api_3/build/create/url":
+            data = json.loads(body.decode("utf-8"))
+        elif self.path == "/api_3/build/create/upload":
+            # Good enough for the fake, the JSON part is on a line of its own:
+            data = [json.loads(line) for line in body.decode("utf-8",
+                "replace").splitlines() if line.startswith("{")][0]
+            data['pkgs'] = body
+        else:
+            return self._reply(404, {'error': "No such endpoint"})
+
+        if data['projectname'] == "missing":
+            return self._reply(404, {'error': "Project missing not found"})
+        with self.server.lock:
+            self.server.builds.append((self.client_address[1], data))
+            build_id = len(self.server.builds)
+        self._reply(200, {'id': build_id, 'state': "pending"})
+
+
+@unittest.skipIf(requests is None, "requests library is not installed")
+class CoprClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.frontend = FakeCoprFrontend()
+        self.client = CoprClient(self.frontend.url, "me", "secret", "someone")
+
+    def tearDown(self):
+        self.frontend.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build_from_url_in_all_projects(self):
+        results = self.client.submit_builds([
+            ("tito", "https://example.com/tito-1.0-1.src.rpm"),
+            ("@group/tito", "https://example.com/tito-1.0-1.src.rpm"),
+            ("other/tito-testing", "https://example.com/tito-1.0-1.src.rpm"),
+        ], {'chroots': ["fedora-40-x86_64"]})
+
+        self.assertEqual(["tito", "@group/tito", "other/tito-testing"],
+            [project for (project, _ids, _error) in results])
+        self.assertEqual([None, None, None],
+            [error for (_project, _ids, error) in results])
+        self.assertEqual([1, 2, 3], sorted(build_id
+            for (_project, ids, _error) in results for build_id in ids))
+        builds = sorted((data['ownername'], data['projectname'],
+            data['pkgs'], data['chroots'])
+            for (_port, data) in self.frontend.builds)
+        self.assertEqual([
+            ("@group", "tito", "https://example.com/tito-1.0-1.src.rpm",
+                ["fedora-40-x86_64"]),
+            ("other", "tito-testing", "https://example.com/tito-1.0-1.src.rpm",
+                ["fedora-40-x86_64"]),
+            ("someone", "tito", "https://example.com/tito-1.0-1.src.rpm",
+                ["fedora-40-x86_64"]),
+        ], builds)
+
+    def test_connections_are_reused(self):
+        for _i in range(3):
+            self.client.build_from_url("tito", "https://example.com/a.src.rpm")
+        self.assertEqual(1, len(set(port
+            for (port, _data) in self.frontend.builds)))
+
+    def test_build_from_file(self):
+        srpm = os.path.join(self.tmp_dir, "tito-1.0-1.src.rpm")
+        with open(srpm, "w") as f:
+            f.write("not really an srpm")
+        self.assertEqual([1], self.client.build_from_file("tito", srpm))
+        data = self.frontend.builds[0][1]
+        self.assertEqual("someone", data['ownername'])
+        self.assertTrue(b"not really an srpm" in data['pkgs'])
+        self.assertTrue(b'filename="tito-1.0-1.src.rpm"' in data['pkgs'])
+
+    def _srpm(self):
+        srpm = os.path.join(self.tmp_dir, "a.src.rpm")
+        with open(srpm, "w") as f:
+            f.write("not really an srpm")
+        return srpm
+
+    def test_srpm_uploaded_once(self):
+        srpm = self._srpm()
+        results = self.client.submit_builds([("tito", srpm),
+            ("@group/tito", srpm), ("other/tito", srpm)])
+        self.assertEqual(["tito", "@group/tito", "other/tito"],
+            [project for (project, _ids, _error) in results])
+        self.assertEqual(("tito", [1], None), results[0])
+        self.assertEqual([None, None], [error
+            for (_project, _ids, error) in results[1:]])
+        pkgs = [data['pkgs'] for (_port, data) in self.frontend.builds]
+        self.assertTrue(b"not really an srpm" in pkgs[0])
+        self.assertEqual(["%s/results/1/a.src.rpm" % self.frontend.url] * 2,
+            pkgs[1:])
+
+    def test_srpm_uploaded_again_if_not_imported(self):
+        self.frontend.import_srpms = False
+        srpm = self._srpm()
+        self.client.submit_builds([("tito", srpm), ("@group/tito", srpm)])
+        self.assertEqual(2, len([data for (_port, data) in
+            self.frontend.builds if b"not really an srpm" in data['pkgs']]))
+
+    def test_errors(self):
+        results = self.client.submit_builds([
+            ("tito", "https://example.com/a.src.rpm"),
+            ("missing", "https://example.com/a.src.rpm")])
+        self.assertEqual(("tito", [1], None), results[0])
+        self.assertEqual("missing", results[1][0])
+        self.assertTrue(isinstance(results[1][2], TitoException))
+        self.assertTrue("not found" in str(results[1][2]))
+
+        client = CoprClient(self.frontend.url, "me", "wrong", "someone")
+        self.assertRaises(TitoException, client.build_from_url, "tito",
+            "https://example.com/a.src.rpm")
+
+
+class CoprOptionsTests(unittest.TestCase):
+
+    def test_parse_copr_options(self):
+        self.assertEqual({}, parse_copr_options("--nowait"))
+        self.assertEqual({'chroots': ["fedora-40-x86_64", "epel-9-x86_64"],
+            'timeout': 3600, 'enable_net': True, 'background': True},
+            parse_copr_options("--nowait -r fedora-40-x86_64 "
+                "--chroot=epel-9-x86_64 --timeout 3600 --enable-net on "
+                "--background"))
+
+    def test_options_only_copr_cli_knows(self):
+        # Without --nowait, copr-cli waits for the builds:
+        self.assertEqual(None, parse_copr_options("--chroot fedora-40-x86_64"))
+        self.assertEqual(None, parse_copr_options("--nowait --after-build-id 5"))
+        self.assertEqual(None, parse_copr_options("--nowait --chroot"))
+
+    @unittest.skipIf(requests is None, "requests library is not installed")
+    def test_client_from_config(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "copr")
+        with open(path, "w") as f:
+            f.write("[copr-cli]\nlogin = me\nusername = someone\n"
+                "copr_url = https://copr.example.com/\n")
+        self.assertEqual(None, CoprClient.from_config(path))
+
+        with open(path, "a") as f:
+            f.write("token = secret\n")
+        client = CoprClient.from_config(path)
+        self.assertEqual("https://copr.example.com", client.copr_url)
+        self.assertEqual(("someone", "tito"), client._project("tito"))
+        self.assertEqual(("me", "secret"), client.session.auth)
+
+
+class CoprReleaserSubmitTests(unittest.TestCase):
+
+    def setUp(self):
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = CoprReleaser.__new__(CoprReleaser)
+        self.releaser.remote_location = None
+        self.releaser.copr_build_options = {}
+        self.releaser.tasks = []
+
+    def test_builds_recorded(self):
+        session = Mock()
+        session.submit_builds.return_value = [("tito", [7], None),
+            ("@group/tito", [8], None)]
+        self.releaser._submit_builds(session, [("tito", "/tmp/a.src.rpm"),
+            ("@group/tito", "/tmp/a.src.rpm")], {})
+        session.submit_builds.assert_called_once_with([
+            ("tito", "/tmp/a.src.rpm"), ("@group/tito", "/tmp/a.src.rpm")], {})
+        self.assertEqual([("tito", "copr", "copr-cli", 7),
+            ("@group/tito", "copr", "copr-cli", 8)], self.releaser.tasks)
+
+    def test_builds_from_remote_location(self):
+        self.releaser.remote_location = "https://example.com/srpms/"
+        session = Mock()
+        session.submit_builds.return_value = []
+        with patch.object(CoprReleaser, "_upload") as upload:
+            self.releaser._submit_builds(session, [("a", "/tmp/a.src.rpm"),
+                ("b", "/tmp/a.src.rpm"), ("c", "/tmp/a.el9.src.rpm")], {})
+        self.assertEqual([("a", "https://example.com/srpms/a.src.rpm"),
+            ("b", "https://example.com/srpms/a.src.rpm"),
+            ("c", "https://example.com/srpms/a.el9.src.rpm")],
+            session.submit_builds.call_args[0][0])
+        self.assertEqual([call("/tmp/a.el9.src.rpm"), call("/tmp/a.src.rpm")],
+            upload.call_args_list)
+
+    def test_upload_once_per_srpm(self):
+        self.releaser.dry_run = False
+        self.releaser.target = "copr"
+        self.releaser.releaser_config = Mock()
+        self.releaser.releaser_config.get.return_value = "cp %(srpm)s /srv/"
+        self.releaser.srpms_uploaded = set()
+        with patch("tito.release.copr.run_command") as run_command:
+            for srpm in ["/tmp/a.src.rpm", "/tmp/a.el9.src.rpm",
+                    "/tmp/a.src.rpm"]:
+                self.releaser._upload(srpm)
+        self.assertEqual([call("cp /tmp/a.src.rpm /srv/"),
+            call("cp /tmp/a.el9.src.rpm /srv/")], run_command.call_args_list)
+
+    def test_failed_submissions(self):
+        session = Mock()
+        session.submit_builds.return_value = [("tito", [], TitoException(
+            "Copr API error 404: Project tito not found"))]
+        with patch("tito.release.copr.error_out") as error_out:
+            self.releaser._submit_builds(session, [("tito", "/tmp/a.src.rpm")],
+                {})
+        error_out.assert_called_once_with(
+            "Unable to submit builds into Copr: tito")
@@ -0,0 +1,284 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for updating and building all DistGit branches at once. """
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from tito.release import FedoraGitReleaser
+from tito.release.tasks import TaskWatcher, extract_task_ids
+
+# Stand-in for fedpkg, builds whatever branch is checked out. The task ID is
+# the number in the branch name:
+FAKE_FEDPKG = """#!/bin/sh
+if [ "$1" = "clone" ]; then
+    echo "clone" >> "%(log)s"
+    exec git clone -q "%(origin)s" "$2"
+fi
+if [ "$1" = "switch-branch" ]; then
+    exec git checkout -q "$2"
+fi
+branch=$(git rev-parse --abbrev-ref HEAD)
+echo "$branch" >> "%(log)s"
+echo "Created task: ${branch#f}"
+echo "Task info: https://koji.example.com/koji/taskinfo?taskID=${branch#f}"
+"""
+
+# Stand-in for koji, task 39 fails and all others succeed:
+FAKE_KOJI = """#!/bin/sh
+echo "Task: $2"
+echo "Type: build"
+if [ "$2" = "39" ]; then
+    echo "State: failed"
+else
+    echo "State: closed"
+fi
+"""
+
+
+def write_script(path, contents):
+    with open(path, "w") as f:
+        f.write(contents)
+    os.chmod(path, 0o755)
+
+
+def git(cwd, *args):
+    return subprocess.check_output(["git", "-c", "user.name=Tito", "-c",
+        "user.email=tito@example.com"] + list(args), cwd=cwd,
+        universal_newlines=True).strip()
+
+
+def create_origin(tmp_dir):
+    """
+    Create a bare dist-git repository where f40 is behind rawhide and f39
+    has a commit of its own. Returns it and a checkout to push from.
+    """
+    origin = os.path.join(tmp_dir, "origin.git")
+    seed = os.path.join(tmp_dir, "seed")
+    os.makedirs(seed)
+    git(tmp_dir, "init", "-q", "--bare", origin)
+    git(seed, "init", "-q", "-b", "rawhide")
+    git(seed, "commit", "-q", "--allow-empty", "-m", "init")
+    git(seed, "branch", "f40")
+    git(seed, "checkout", "-q", "-b", "f39")
+    with open(os.path.join(seed, "f39-only"), "w") as f:
+        f.write("f39\n")
+    git(seed, "add", "f39-only")
+    git(seed, "commit", "-q", "-m", "f39 fix")
+    git(seed, "push", "-q", origin, "rawhide", "f40", "f39")
+    git(origin, "symbolic-ref", "HEAD", "refs/heads/rawhide")
+    return origin, seed
+
+
+class DistGitBuildTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, "builds.log")
+        self.fedpkg = os.path.join(self.tmp_dir, "fedpkg")
+        self.koji = os.path.join(self.tmp_dir, "koji")
+        write_script(self.fedpkg, FAKE_FEDPKG % {'log': self.log,
+            'origin': os.devnull})
+        write_script(self.koji, FAKE_KOJI)
+
+        self.checkout = os.path.join(self.tmp_dir, "checkout")
+        os.makedirs(self.checkout)
+        for cmd in [["init", "-q", "-b", "rawhide"],
+                ["-c", "user.name=Tito", "-c", "user.email=tito@example.com",
+                    "commit", "-q", "--allow-empty", "-m", "init"],
+                ["branch", "f40"], ["branch", "f39"],
+                ["checkout", "-q", "f39"]]:
+            subprocess.check_call(["git"] + cmd, cwd=self.checkout)
+
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = FedoraGitReleaser.__new__(FedoraGitReleaser)
+        self.releaser.cli_tool = self.fedpkg
+        self.releaser.KOJI_CLI = self.koji
+        self.releaser.working_dir = self.tmp_dir
+        self.releaser.package_workdir = self.checkout
+        self.releaser.build_targets = {}
+        self.releaser.dry_run = False
+        self.releaser.scratch = False
+        self.releaser.wait = False
+        self.releaser.tasks = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_every_branch_builds_from_its_own_checkout(self):
+        self.releaser._build_branches(["rawhide", "f40", "f39"],
+            self.checkout)
+        with open(self.log) as f:
+            self.assertEqual(["f39", "f40", "rawhide"],
+                sorted(f.read().split()))
+
+    def test_wait_reports_failed_builds(self):
+        self.releaser.wait = True
+        self.assertRaises(SystemExit, self.releaser._build_branches,
+            ["f40", "f39"], self.checkout)
+
+    def test_tasks_recorded_for_watch(self):
+        self.releaser._build_branches(["f40", "f39"], self.checkout)
+        self.assertEqual([("f40", "koji", self.koji, 40),
+            ("f39", "koji", self.koji, 39)], self.releaser.tasks)
+
+    def test_wait_for_successful_builds(self):
+        self.releaser.wait = True
+        self.releaser._build_branches(["f40"], self.checkout)
+
+    def test_task_watcher(self):
+        watcher = TaskWatcher(self.koji, poll_interval=0)
+        watcher.add("f40", 40)
+        watcher.add("f39", 39)
+        self.assertEqual({40: "closed", 39: "failed"}, watcher.wait())
+        self.assertEqual(["f39"], watcher.failed())
+
+    def test_extract_task_ids(self):
+        self.assertEqual([1234, 1235], extract_task_ids(
+            "Created task: 1234\nTask info: https://koji/taskinfo?taskID=1234\n"
+            "Created task 1235\n"))
+
+
+class PropagateBranchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fedpkg = os.path.join(self.tmp_dir, "fedpkg")
+        write_script(self.fedpkg, FAKE_FEDPKG % {'log': os.devnull,
+            'origin': os.devnull})
+        self.origin = create_origin(self.tmp_dir)[0]
+
+        self.checkout = os.path.join(self.tmp_dir, "checkout")
+        git(self.tmp_dir, "clone", "-q", "-b", "rawhide", self.origin,
+            self.checkout)
+        git(self.checkout, "config", "user.name", "Tito")
+        git(self.checkout, "config", "user.email", "tito@example.com")
+        with open(os.path.join(self.checkout, "foo.spec"), "w") as f:
+            f.write("Version: 1.0\n")
+        git(self.checkout, "add", "foo.spec")
+        git(self.checkout, "commit", "-q", "-m", "Update foo to 1.0")
+        self.head = git(self.checkout, "rev-parse", "HEAD")
+
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = FedoraGitReleaser.__new__(FedoraGitReleaser)
+        self.releaser.cli_tool = self.fedpkg
+        self.releaser.package_workdir = self.checkout
+        self.releaser.dry_run = False
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fast_forward_by_ref(self):
+        self.releaser._propagate_branch("rawhide", "f40", self.checkout)
+        self.assertEqual(self.head, git(self.checkout, "rev-parse", "f40"))
+        self.assertEqual("origin/f40", git(self.checkout, "rev-parse",
+            "--abbrev-ref", "f40@{upstream}"))
+        # The checkout was not touched:
+        self.assertEqual("rawhide", git(self.checkout, "rev-parse",
+            "--abbrev-ref", "HEAD"))
+
+    def test_diverged_branch_is_merged(self):
+        self.releaser._propagate_branch("rawhide", "f39", self.checkout)
+        self.assertEqual("f39", git(self.checkout, "rev-parse",
+            "--abbrev-ref", "HEAD"))
+        git(self.checkout, "merge-base", "--is-ancestor", self.head, "f39")
+        self.assertTrue(os.path.exists(os.path.join(self.checkout,
+            "f39-only")))
+
+    def test_single_push(self):
+        for branch in ["f40", "f39"]:
+            self.releaser._propagate_branch("rawhide", branch, self.checkout)
+        self.releaser._push("git push origin rawhide:rawhide f40:f40 f39:f39",
+            self.checkout)
+        for branch in ["rawhide", "f40", "f39"]:
+            git(self.origin, "merge-base", "--is-ancestor", self.head, branch)
+
+
+class MirrorCloneTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.origin, self.seed = create_origin(self.tmp_dir)
+        self.log = os.path.join(self.tmp_dir, "fedpkg.log")
+        self.fedpkg = os.path.join(self.tmp_dir, "fedpkg")
+        write_script(self.fedpkg, FAKE_FEDPKG % {'log': self.log,
+            'origin': self.origin})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _releaser(self, name, no_cache=False):
+        # Bypass the constructor, it needs a whole git repository:
+        releaser = FedoraGitReleaser.__new__(FedoraGitReleaser)
+        releaser.cli_tool = self.fedpkg
+        releaser.project_name = "foo"
+        releaser.user_config = {'CACHE_DIR': os.path.join(self.tmp_dir,
+            "cache")}
+        releaser.no_cache = no_cache
+        releaser.working_dir = os.path.join(self.tmp_dir, name)
+        releaser.package_workdir = os.path.join(releaser.working_dir, "foo")
+        os.makedirs(releaser.working_dir)
+        return releaser
+
+    def _clones(self):
+        with open(self.log) as f:
+            return len(f.read().split())
+
+    def test_mirror_is_reused(self):
+        first = self._releaser("first")
+        first._clone()
+        mirror = first._mirror_dir()
+        self.assertEqual("refs/heads/rawhide", git(mirror, "symbolic-ref",
+            "HEAD"))
+        self.assertEqual([], [ref for ref in git(mirror, "for-each-ref",
+            "--format=%(refname)").split() if ref.endswith("/HEAD")])
+
+        git(self.seed, "commit", "-q", "--allow-empty", "-m", "f39 update")
+        git(self.seed, "push", "-q", self.origin, "f39")
+
+        second = self._releaser("second")
+        second._clone()
+        self.assertEqual(1, self._clones())
+        workdir = second.package_workdir
+        self.assertEqual(self.origin, git(workdir, "config",
+            "remote.origin.url"))
+        self.assertEqual(git(self.seed, "rev-parse", "f39"),
+            git(workdir, "rev-parse", "origin/f39"))
+        self.assertEqual("rawhide", git(workdir, "rev-parse", "--abbrev-ref",
+            "HEAD"))
+
+    def test_broken_mirror_is_replaced(self):
+        self._releaser("first")._clone()
+        second = self._releaser("second")
+        second._clone()
+        git(second._mirror_dir(), "config", "remote.origin.url",
+            os.path.join(self.tmp_dir, "missing"))
+        releaser = self._releaser("third")
+        releaser._clone()
+        self.assertEqual(2, self._clones())
+        self.assertEqual(self.origin, git(releaser._mirror_dir(), "config",
+            "remote.origin.url"))
+        # Clones from the removed mirror still have all their objects:
+        git(second.package_workdir, "fsck", "--no-dangling")
+        self.assertFalse(os.path.exists(os.path.join(second.package_workdir,
+            ".git", "objects", "info", "alternates")))
+
+    def test_no_cache(self):
+        releaser = self._releaser("first", no_cache=True)
+        releaser._clone()
+        self.assertTrue(os.path.isdir(releaser.package_workdir))
+        self.assertFalse(os.path.exists(releaser._mirror_dir()))
@@ -0,0 +1,92 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for skipping lookaside uploads of unchanged sources. """
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from tito.release import FedoraGitReleaser
+from tito.release.distgit import parse_sources_file
+
+
+class LookasideUploadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.checkout = os.path.join(self.tmp_dir, "checkout")
+        os.makedirs(self.checkout)
+        self.tarball = self._source("foo-1.0.tar.gz", b"tarball")
+        self.patch = self._source("extra-1.0.tar.gz", b"extra")
+
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = FedoraGitReleaser.__new__(FedoraGitReleaser)
+        self.releaser.cli_tool = "fedpkg"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _source(self, name, contents):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(contents)
+        return path
+
+    def _write_sources(self, *lines):
+        with open(os.path.join(self.checkout, "sources"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _command(self, sources):
+        return self.releaser._lookaside_command(self.checkout, sources)
+
+    def test_parse_sources_file(self):
+        self._write_sources(
+            "SHA512 (foo-1.0.tar.gz) = ABC123",
+            "d41d8cd98f00b204e9800998ecf8427e  old-0.1.tar.gz",
+            "garbage")
+        self.assertEqual({
+            "foo-1.0.tar.gz": ("sha512", "abc123"),
+            "old-0.1.tar.gz": ("md5", "d41d8cd98f00b204e9800998ecf8427e"),
+        }, parse_sources_file(os.path.join(self.checkout, "sources")))
+
+    def test_unchanged_sources_are_skipped(self):
+        self._write_sources(
+            "SHA512 (foo-1.0.tar.gz) = %s" % hashlib.sha512(b"tarball").hexdigest(),
+            "%s  extra-1.0.tar.gz" % hashlib.md5(b"extra").hexdigest())
+        self.assertEqual(None, self._command([self.tarball, self.patch]))
+
+    def test_added_sources_are_uploaded(self):
+        self._write_sources("SHA512 (foo-1.0.tar.gz) = %s" %
+            hashlib.sha512(b"tarball").hexdigest())
+        self.assertEqual("fedpkg upload %s" % self.patch,
+            self._command([self.tarball, self.patch]))
+
+    def test_changed_sources_replace_the_list(self):
+        self._write_sources("SHA512 (foo-1.0.tar.gz) = %s" %
+            hashlib.sha512(b"old tarball").hexdigest())
+        self.assertEqual("fedpkg new-sources %s %s" % (self.tarball,
+            self.patch), self._command([self.tarball, self.patch]))
+
+    def test_dropped_sources_replace_the_list(self):
+        self._write_sources(
+            "SHA512 (foo-0.9.tar.gz) = abc",
+            "SHA512 (foo-1.0.tar.gz) = %s" % hashlib.sha512(b"tarball").hexdigest())
+        self.assertEqual("fedpkg new-sources %s" % self.tarball,
+            self._command([self.tarball]))
+
+    def test_no_sources_file(self):
+        self.assertEqual("fedpkg upload %s" % self.tarball,
+            self._command([self.tarball]))
@@ -0,0 +1,146 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for deciding between full and incremental rpm builds. """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from tito.builder import Builder
+from tito.common import run_command
+
+SPEC = """Name: foo
+Version: 1.0
+Release: 1
+Source0: foo-1.0.tar.gz
+Source1: foo.conf
+Patch0: fix-build.patch
+"""
+
+
+class IncrementalBuildTests(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.repo_dir, "foo", "src"))
+        self.write("foo.spec", SPEC)
+        self.write("foo.conf", "debug = 0\n")
+        self.write("fix-build.patch", "")
+        self.write("src/main.c", "int main() { return 0; }\n")
+        self.commit()
+
+        # Bypass the constructor, it needs a whole tito project:
+        self.builder = Builder.__new__(Builder)
+        self.builder.git_root = self.repo_dir
+        self.builder.relative_project_dir = "foo/"
+        self.builder.git_commit_id = self.head()
+        self.builder.rpmbuild_builddir = os.path.join(self.repo_dir, "BUILD")
+        os.makedirs(os.path.join(self.repo_dir, "BUILD", "foo-1.0"))
+
+        self.state = {
+            'options': 'opts',
+            'files': self.builder._git_tree_files(),
+            'srcdir': 'foo-1.0',
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, path, contents):
+        with open(os.path.join(self.repo_dir, "foo", path), "w") as f:
+            f.write(contents)
+
+    def commit(self):
+        run_command("git -C %s init -q" % self.repo_dir)
+        run_command("git -C %s add -A" % self.repo_dir)
+        run_command("git -C %s -c user.name=tito -c user.email=tito@example.com "
+            "commit -q -m update" % self.repo_dir)
+
+    def head(self):
+        return run_command("git -C %s rev-parse HEAD" % self.repo_dir)
+
+    def reason(self, options='opts'):
+        self.builder.git_commit_id = self.head()
+        return self.builder._incremental_full_build_reason(self.state,
+            self.builder._git_tree_files(), options)
+
+    def test_tree_files(self):
+        self.assertEqual(["fix-build.patch", "foo.conf", "foo.spec",
+            "src/main.c"], sorted(self.state['files']))
+
+    def test_first_build_is_full(self):
+        self.assertEqual("no previous incremental build",
+            self.builder._incremental_full_build_reason(None,
+                self.state['files'], 'opts'))
+
+    def test_source_change_is_incremental(self):
+        self.write("src/main.c", "int main() { return 1; }\n")
+        self.write("src/util.c", "")
+        self.commit()
+        self.assertEqual(None, self.reason())
+
+    def test_options_change_is_full(self):
+        self.assertEqual("build options changed", self.reason('other'))
+
+    def test_missing_build_tree_is_full(self):
+        shutil.rmtree(os.path.join(self.repo_dir, "BUILD", "foo-1.0"))
+        self.assertEqual("previous build tree not found", self.reason())
+
+    def test_spec_change_is_full(self):
+        self.write("foo.spec", SPEC + "BuildRequires: gcc\n")
+        self.commit()
+        self.assertEqual("spec file changed", self.reason())
+
+    def test_patch_and_source_changes_are_full(self):
+        self.write("fix-build.patch", "--- a\n+++ b\n")
+        self.write("foo.conf", "debug = 1\n")
+        self.commit()
+        self.assertEqual("sources or patches changed: fix-build.patch, "
+            "foo.conf", self.reason())
+
+    @patch.object(Builder, "_package_build_dir",
+        return_value="foo-1.0-1.git.2.def-build")
+    def test_sync_nested_build_tree(self, package_build_dir):
+        # Sources unpacked by rpm >= 4.20, for the previous test version:
+        old_srcdir = os.path.join(self.repo_dir, "BUILD",
+            "foo-1.0-1.git.1.abc-build", "foo-git-1.abc")
+        os.makedirs(os.path.join(old_srcdir, "src"))
+        sourcedir = os.path.join(self.repo_dir, "SOURCES")
+        os.makedirs(os.path.join(sourcedir, "foo-git-1.abc"))
+        self.state.update(srcdir=os.path.relpath(old_srcdir,
+            self.builder.rpmbuild_builddir), tgz_dir="foo-git-1.abc",
+            tgz="foo-git-1.abc.tar.gz")
+
+        self.write("src/main.c", "int main() { return 1; }\n")
+        self.commit()
+        self.builder.git_commit_id = self.head()
+        self.builder.test = False
+        self.builder.rpmbuild_sourcedir = sourcedir
+        self.builder.tgz_dir = "foo-git-2.def"
+        self.builder.tgz_filename = "foo-git-2.def.tar.gz"
+        self.builder.rpmbuild_gitcopy = os.path.join(sourcedir,
+            "foo-git-2.def")
+
+        srcdir = self.builder._incremental_sync(self.state,
+            self.builder._git_tree_files())
+
+        self.assertEqual(os.path.join("foo-1.0-1.git.2.def-build",
+            "foo-git-2.def"), srcdir)
+        self.assertFalse(os.path.exists(os.path.dirname(old_srcdir)))
+        with open(os.path.join(self.builder.rpmbuild_builddir, srcdir,
+                "src", "main.c")) as f:
+            self.assertEqual("int main() { return 1; }\n", f.read())
@@ -0,0 +1,230 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for submitting builds to Koji in process. """
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest.mock import Mock, patch
+from xmlrpc.client import Fault
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from tito.release import KojiReleaser, kojisession
+from tito.release.kojisession import KojiSession, UploadRecord, koji
+
+
+class FakeKojiHub(object):
+    """
+    Local XML-RPC stand-in for a Koji hub, recording the calls it gets.
+    """
+
+    def __init__(self, failing_targets=()):
+        self.failing_targets = failing_targets
+        self.uploads = []
+        self.builds = []
+        self.multicalls = 0
+        handler = type("Handler", (SimpleXMLRPCRequestHandler,),
+            {'rpc_paths': ()})
+        self.server = SimpleXMLRPCServer(("127.0.0.1", 0),
+            requestHandler=handler, allow_none=True, logRequests=False)
+        self.server.register_function(self.upload_file, "uploadFile")
+        self.server.register_function(self.check_upload, "checkUpload")
+        self.server.register_function(self.build, "build")
+        self.server.register_function(self.multicall, "multiCall")
+        self.url = "http://127.0.0.1:%s/kojihub" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def upload_file(self, path, name, *args):
+        # Called for every chunk and once more to finish the upload:
+        if (path, name) not in self.uploads:
+            self.uploads.append((path, name))
+        return True
+
+    def check_upload(self, path, name, *args):
+        # Failing for new files keeps clients using uploadFile:
+        if (path, name) not in self.uploads:
+            raise Fault(1000, "no upload at %s/%s" % (path, name))
+        return {'size': str(len("not really an srpm")), 'mtime': 0}
+
+    def build(self, source, target, opts=None):
+        if target in self.failing_targets:
+            raise Fault(1000, "no such target: %s" % target)
+        self.builds.append((source, target, opts))
+        return len(self.builds)
+
+    def multicall(self, calls):
+        self.multicalls += 1
+        return self.server.system_multicall(calls)
+
+
+@unittest.skipIf(koji is None, "koji library is not installed")
+class KojiSessionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.srpm = os.path.join(self.tmp_dir, "foo-1.0-1.fc40.src.rpm")
+        with open(self.srpm, "w") as f:
+            f.write("not really an srpm")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _submit(self, builds, hub, uploads=None):
+        session = KojiSession(koji.ClientSession(hub.url,
+            {'use_fast_upload': False}), "https://koji.example.com/koji/",
+            uploads)
+        return session.submit_builds(builds, {'scratch': True})
+
+    def _hub(self, **kwargs):
+        hub = FakeKojiHub(**kwargs)
+        self.addCleanup(hub.stop)
+        return hub
+
+    def test_one_multicall_and_upload(self):
+        hub = self._hub()
+        results = self._submit([("f40-candidate", self.srpm),
+            ("f40-updates", self.srpm)], hub)
+
+        self.assertEqual([("f40-candidate", 1, None),
+            ("f40-updates", 2, None)], results)
+        self.assertEqual(1, hub.multicalls)
+        self.assertEqual(1, len(set(hub.uploads)))
+        server_path = "%s/%s" % (hub.uploads[0][0], os.path.basename(
+            self.srpm))
+        self.assertEqual([(server_path, "f40-candidate", {'scratch': True}),
+            (server_path, "f40-updates", {'scratch': True})], hub.builds)
+
+    def test_failed_build(self):
+        hub = self._hub(failing_targets=["f40-updates"])
+        results = self._submit([("f40-candidate", "git+https://x/#abc"),
+            ("f40-updates", "git+https://x/#abc")], hub)
+
+        self.assertEqual([], hub.uploads)
+        self.assertEqual(("f40-candidate", 1, None), results[0])
+        self.assertEqual("f40-updates", results[1][0])
+        self.assertTrue(results[1][2])
+
+    def test_retry_reuses_upload(self):
+        hub = self._hub()
+        uploads = UploadRecord(os.path.join(self.tmp_dir, "uploads.json"))
+        self._submit([("f40-candidate", self.srpm)], hub, uploads)
+        self._submit([("f40-candidate", self.srpm)], hub, uploads)
+
+        self.assertEqual(1, len(hub.uploads))
+        self.assertEqual(hub.builds[0][0], hub.builds[1][0])
+
+    def test_upload_again_when_gone(self):
+        hub = self._hub()
+        uploads = UploadRecord(os.path.join(self.tmp_dir, "uploads.json"))
+        self._submit([("f40-candidate", self.srpm)], hub, uploads)
+        del hub.uploads[:]
+        self._submit([("f40-candidate", self.srpm)], hub, uploads)
+
+        self.assertEqual(1, len(hub.uploads))
+        self.assertNotEqual(hub.builds[0][0], hub.builds[1][0])
+
+
+class UploadRecordTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "tito", "koji-uploads.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_per_hub(self):
+        uploads = UploadRecord(self.path)
+        self.assertEqual(None, uploads.get("https://koji/kojihub", "abc"))
+
+        uploads.add("https://koji/kojihub", "abc", "tito-build/1/a.src.rpm")
+        uploads.add("https://brew/brewhub", "abc", "tito-build/2/a.src.rpm")
+        uploads = UploadRecord(self.path)
+        self.assertEqual("tito-build/1/a.src.rpm",
+            uploads.get("https://koji/kojihub", "abc"))
+        self.assertEqual("tito-build/2/a.src.rpm",
+            uploads.get("https://brew/brewhub", "abc"))
+        self.assertEqual(None, uploads.get("https://koji/kojihub", "def"))
+
+    def test_unreadable_record(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(None, UploadRecord(self.path).get("hub", "abc"))
+
+
+class KojiReleaserSessionTests(unittest.TestCase):
+
+    def setUp(self):
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = KojiReleaser.__new__(KojiReleaser)
+        self.releaser.dry_run = False
+        self.releaser.profile = None
+        self.releaser.conf_file = None
+        self.releaser.executable = "koji"
+        self.releaser.koji_client = "koji --profile stg"
+        self.releaser.tasks = []
+        self.releaser.no_cache = False
+        self.releaser.user_config = {'CACHE_DIR': "/nonexistent/cache"}
+        self.releaser.builder = Mock()
+        self.releaser.builder.user_config = {}
+
+    def test_command_without_library(self):
+        with patch.object(kojisession, "koji", None):
+            self.assertEqual(None, self.releaser._koji_session())
+
+    def test_command_with_koji_options(self):
+        self.releaser.builder.user_config = {'KOJI_OPTIONS': "build --wait"}
+        with patch.object(kojisession, "koji", Mock()):
+            self.assertEqual(None, self.releaser._koji_session())
+
+    def test_command_if_connecting_fails(self):
+        with patch.object(kojisession, "koji", Mock()), \
+                patch.object(KojiSession, "connect",
+                    side_effect=IOError("connection refused")):
+            self.assertEqual(None, self.releaser._koji_session())
+
+    def test_upload_record_in_cache(self):
+        with patch.object(kojisession, "koji", Mock()), \
+                patch.object(KojiSession, "connect") as connect:
+            self.releaser._koji_session()
+            self.releaser.no_cache = True
+            self.releaser._koji_session()
+        self.assertEqual("/nonexistent/cache/koji-uploads.json",
+            connect.call_args_list[0][0][2].path)
+        self.assertEqual(None, connect.call_args_list[1][0][2])
+
+    def test_failed_submissions(self):
+        session = Mock()
+        session.submit_builds.return_value = [("f40-candidate", 7, None),
+            ("f40-updates", None, Fault(1000, "no such target"))]
+        session.task_url.return_value = None
+        with patch("tito.release.main.error_out") as error_out:
+            self.releaser._submit_builds(session, [("f40-candidate", "a.rpm"),
+                ("f40-updates", "a.rpm")], {})
+        session.submit_builds.assert_called_once_with([
+            ("f40-candidate", "a.rpm"), ("f40-updates", "a.rpm")], {})
+        error_out.assert_called_once_with(
+            "Unable to submit builds to Koji: f40-updates")
+        self.assertEqual([("f40-candidate", "koji", "koji --profile stg", 7)],
+            self.releaser.tasks)
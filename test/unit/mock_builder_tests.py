@@ -0,0 +1,166 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for reusing mock roots in MockBuilder. """
+
+import errno
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from unittest.mock import patch
+
+from tito.builder import MockBuilder
+from tito.common import copy_file
+
+
+class MockRootReuseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.tmp_dir, "mock")
+        os.makedirs(self.config_dir)
+        self.root = os.path.join(self.tmp_dir, "root")
+        os.makedirs(self.root)
+        with open(os.path.join(self.config_dir, "fedora-40-x86_64.cfg"), "w") as f:
+            f.write("include('templates/fedora-branched.tpl')\n")
+        os.makedirs(os.path.join(self.config_dir, "templates"))
+        with open(os.path.join(self.config_dir, "templates",
+                "fedora-branched.tpl"), "w") as f:
+            f.write("config_opts['releasever'] = '40'\n")
+
+        # Bypass the constructor, it needs a whole git repository:
+        self.builder = MockBuilder.__new__(MockBuilder)
+        self.builder.mock_config_dir = self.config_dir
+        self.builder.mock_cmd_args = " --configdir=%s" % self.config_dir
+        self.builder.mock_max_age = 24
+        self.builder.speedup = False
+        self.builder.no_cache = False
+        self.builder.srpm_location = "/tmp/foo-1.0-1.src.rpm"
+        self.builder.user_config = {'CACHE_DIR': self.tmp_dir}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_config_files_follow_includes(self):
+        self.assertEqual([
+            os.path.join(self.config_dir, "fedora-40-x86_64.cfg"),
+            os.path.join(self.config_dir, "templates", "fedora-branched.tpl"),
+        ], [f for f in self.builder._mock_config_files("fedora-40-x86_64")
+            if f.startswith(self.config_dir)])
+
+    @patch("tito.builder.main.run_command")
+    def test_fingerprint_changes_with_build_requires(self, run_command):
+        run_command.return_value = "python3-devel\nmake"
+        first = self.builder._mock_fingerprint("fedora-40-x86_64")
+        run_command.return_value = "make\npython3-devel"
+        self.assertEqual(first,
+            self.builder._mock_fingerprint("fedora-40-x86_64"))
+        run_command.return_value = "make\npython3-devel\ngcc"
+        self.assertNotEqual(first,
+            self.builder._mock_fingerprint("fedora-40-x86_64"))
+
+    def test_root_freshness(self):
+        state = {'fingerprint': 'abc', 'initialized': time.time(),
+            'root': self.root}
+        self.assertTrue(self.builder._mock_root_is_fresh(state, 'abc'))
+        self.assertFalse(self.builder._mock_root_is_fresh(state, 'abd'))
+        self.assertFalse(self.builder._mock_root_is_fresh(None, 'abc'))
+
+        state['initialized'] = time.time() - 25 * 3600
+        self.assertFalse(self.builder._mock_root_is_fresh(state, 'abc'))
+
+        state['initialized'] = time.time()
+        shutil.rmtree(self.root)
+        self.assertFalse(self.builder._mock_root_is_fresh(state, 'abc'))
+
+    @patch("tito.builder.main.run_command")
+    def test_init_scrub_and_reuse(self, run_command):
+        run_command.return_value = self.root
+        mock = "mock -r fedora-40-x86_64"
+        ran = []
+
+        def record(cmd):
+            ran.append(cmd)
+        args = self.builder._prepare_mock_root(mock, "fedora-40-x86_64", record)
+        self.assertEqual(["%s --init" % mock], ran)
+        self.assertEqual("--no-clean --no-cleanup-after", args)
+
+        # Same inputs, the root is reused:
+        ran = []
+        self.builder._prepare_mock_root(mock, "fedora-40-x86_64", record)
+        self.assertEqual([], ran)
+
+        # Config changed, scrub and start over:
+        with open(os.path.join(self.config_dir, "fedora-40-x86_64.cfg"), "a") as f:
+            f.write("config_opts['macros']['%_smp_mflags'] = '-j1'\n")
+        self.builder._prepare_mock_root(mock, "fedora-40-x86_64", record)
+        self.assertEqual(["%s --scrub=chroot" % mock, "%s --init" % mock],
+            ran)
+
+    @patch("tito.builder.main.run_command")
+    def test_speedup_never_initializes(self, run_command):
+        self.builder.speedup = True
+        ran = []
+        args = self.builder._prepare_mock_root("mock -r fedora-40-x86_64",
+            "fedora-40-x86_64", ran.append)
+        self.assertEqual([], ran)
+        self.assertEqual("", args)
+
+
+class MockResultsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        for rpm in ["foo-1.0-1.fc40.src.rpm", "foo-1.0-1.fc40.noarch.rpm",
+                "foo-doc-1.0-1.fc40.noarch.rpm"]:
+            with open(os.path.join(self.result_dir, rpm), "w") as f:
+                f.write(rpm)
+        self.builder = MockBuilder.__new__(MockBuilder)
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def test_dir_name_of_config_paths(self):
+        for mock_tag in ["fedora-40-x86_64", "fedora-40-x86_64.cfg",
+                "/etc/mock/fedora-40-x86_64.cfg"]:
+            self.assertEqual("fedora-40-x86_64",
+                self.builder._mock_dir_name(mock_tag))
+
+    def test_results_from_build_log(self):
+        with open(os.path.join(self.result_dir, "build.log"), "w") as f:
+            f.write("Processing files: foo-1.0-1.fc40.noarch\n"
+                "Wrote: /builddir/build/SRPMS/foo-1.0-1.fc40.src.rpm\n"
+                "Wrote: /builddir/build/RPMS/foo-1.0-1.fc40.noarch.rpm\n")
+        self.assertEqual(["foo-1.0-1.fc40.noarch.rpm"],
+            self.builder._find_mock_results(self.result_dir))
+
+    def test_results_without_build_log(self):
+        self.assertEqual(["foo-1.0-1.fc40.noarch.rpm",
+            "foo-doc-1.0-1.fc40.noarch.rpm"],
+            self.builder._find_mock_results(self.result_dir))
+
+    # Without reflinks, which are tried first:
+    @patch("tito.common.fcntl.ioctl",
+        side_effect=OSError(errno.EOPNOTSUPP, "Operation not supported"))
+    def test_results_are_hardlinked(self, ioctl):
+        src = os.path.join(self.result_dir, "foo-1.0-1.fc40.noarch.rpm")
+        output_dir = os.path.join(self.result_dir, "output")
+        os.makedirs(output_dir)
+        dst = os.path.join(output_dir, "foo-1.0-1.fc40.noarch.rpm")
+        with open(dst, "w") as f:
+            f.write("previous build")
+        self.assertEqual(0, copy_file(src, dst, allow_link=True))
+        self.assertEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
@@ -0,0 +1,120 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for the cached OBS checkouts and syncing files into them. """
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from tito.release import ObsReleaser
+
+# Stand-in for osc, checks out a package with one file and logs updates:
+FAKE_OSC = """#!/bin/sh
+echo "$1" >> "%(log)s"
+if [ "$1" = "co" ]; then
+    mkdir -p "$2/.osc" "$2/$3/.osc"
+    echo "files" > "$2/$3/.osc/_files"
+    echo "Version: 1.0" > "$2/$3/foo.spec"
+fi
+"""
+
+
+def write_file(path, contents, mode=0o644):
+    with open(path, "w") as f:
+        f.write(contents)
+    os.chmod(path, mode)
+
+
+def read_file(path):
+    with open(path) as f:
+        return f.read()
+
+
+class ObsSyncTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, "osc.log")
+        osc = os.path.join(self.tmp_dir, "osc")
+        write_file(osc, FAKE_OSC % {'log': self.log}, 0o755)
+
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = ObsReleaser.__new__(ObsReleaser)
+        self.releaser.cli_tool = osc
+        self.releaser.no_cache = False
+        self.releaser.user_config = {'CACHE_DIR': os.path.join(self.tmp_dir,
+            "cache")}
+        self.releaser.obs_project_name = "home:tito"
+        self.releaser.obs_package_name = "foo"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _checkout(self, name):
+        self.releaser.working_dir = os.path.join(self.tmp_dir, name)
+        self.releaser.package_workdir = os.path.join(
+            self.releaser.working_dir, "home:tito", "foo")
+        os.makedirs(self.releaser.working_dir)
+        self.releaser._checkout()
+        return self.releaser.package_workdir
+
+    # Without reflinks, which are tried first:
+    @patch("tito.common.fcntl.ioctl",
+        side_effect=OSError(errno.EOPNOTSUPP, "Operation not supported"))
+    def test_cached_checkout_is_updated_and_linked(self, ioctl):
+        self._checkout("first")
+        checkout = self._checkout("second")
+        self.assertEqual(["co", "up"], read_file(self.log).split())
+
+        cached = os.path.join(self.tmp_dir, "cache", "obs", "home:tito",
+            "foo")
+        self.assertTrue(os.path.samefile(os.path.join(cached, "foo.spec"),
+            os.path.join(checkout, "foo.spec")))
+        self.assertFalse(os.path.samefile(os.path.join(cached, ".osc",
+            "_files"), os.path.join(checkout, ".osc", "_files")))
+        self.assertTrue(os.path.isdir(os.path.join(checkout, "..", ".osc")))
+
+    def test_sync_only_changed_files(self):
+        checkout = self._checkout("release")
+        cached_spec = os.path.join(self.tmp_dir, "cache", "obs", "home:tito",
+            "foo", "foo.spec")
+        write_file(os.path.join(checkout, "foo.tar.gz"), "tarball")
+        write_file(os.path.join(checkout, "old.patch"), "patch")
+        unchanged = os.stat(os.path.join(checkout, "foo.tar.gz"))
+
+        sources = os.path.join(self.tmp_dir, "sources")
+        os.makedirs(sources)
+        write_file(os.path.join(sources, "foo.spec"), "Version: 2.0")
+        write_file(os.path.join(sources, "foo.tar.gz"), "tarball")
+        write_file(os.path.join(sources, "build.sh"), "#!/bin/sh", 0o755)
+
+        new, copied, old = self.releaser._sync_files([
+            os.path.join(sources, name)
+            for name in ["foo.spec", "foo.tar.gz", "build.sh"]], checkout)
+
+        self.assertEqual(["build.sh"], new)
+        self.assertEqual(["foo.spec"], copied)
+        self.assertEqual(["old.patch"], old)
+        self.assertEqual("Version: 2.0", read_file(os.path.join(checkout,
+            "foo.spec")))
+        # The cached checkout shared the old file and must keep it:
+        self.assertEqual("Version: 1.0\n", read_file(cached_spec))
+        self.assertEqual(unchanged.st_mtime_ns, os.stat(os.path.join(
+            checkout, "foo.tar.gz")).st_mtime_ns)
+        self.assertTrue(os.access(os.path.join(checkout, "build.sh"),
+            os.X_OK))
@@ -0,0 +1,68 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for releasing to several targets at the same time. """
+
+import io
+import os
+import sys
+import unittest
+
+from contextlib import redirect_stdout
+
+from tito.cli import ReleaseModule
+
+
+def release_target(target):
+    print("releasing %s" % target)
+    sys.stderr.write("working in %s\n" % os.getcwd())
+    if target == "broken":
+        raise Exception("broken releaser")
+    if target == "exits":
+        sys.exit(3)
+    os.chdir("/")
+
+
+class ParallelReleaseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.module = ReleaseModule.__new__(ReleaseModule)
+        self.cwd = os.getcwd()
+
+    def release(self, targets, jobs=2):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.module._release_in_parallel(targets, jobs, release_target)
+        return output.getvalue()
+
+    def test_output_is_prefixed(self):
+        output = self.release(["yum-f40", "copr", "koji"])
+        for target in ["yum-f40", "copr", "koji"]:
+            self.assertIn("[%s] releasing %s\n" % (target, target), output)
+            self.assertIn("[%s] working in %s\n" % (target, self.cwd), output)
+        self.assertIn("Release summary:", output)
+        # Targets can not change the working directory of tito itself:
+        self.assertEqual(self.cwd, os.getcwd())
+
+    def test_failures_are_reported(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            with self.assertRaises(SystemExit):
+                self.module._release_in_parallel(["ok", "broken", "exits"],
+                    3, release_target)
+        output = output.getvalue()
+        self.assertIn("[broken] Exception: broken releaser", output)
+        summary = output.split("Release summary:")[1]
+        self.assertRegex(summary, r"ok +OK")
+        self.assertRegex(summary, r"broken +FAILED")
+        self.assertRegex(summary, r"exits +FAILED")
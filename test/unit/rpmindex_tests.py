@@ -0,0 +1,223 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for the RPM header index of yum repositories. """
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from unittest.mock import Mock, patch
+
+from tito.compat import RawConfigParser
+from tito.exception import RunCommandException
+from tito.release import YumRepoReleaser
+from tito.release.rpmindex import RpmIndex
+
+
+def fake_header(ts, path):
+    """ Stand-in for reading a header, the file holds "name epoch v r". """
+    with open(path) as f:
+        name, epoch, version, release = f.read().split()
+    return {'name': name, 'epoch': None if epoch == "-" else int(epoch),
+        'version': version, 'release': release}
+
+
+class RpmIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.repo_dir = os.path.join(self.tmp_dir, "repo")
+        os.makedirs(self.repo_dir)
+        self.index_path = os.path.join(self.tmp_dir, "repo.rpm-index.json")
+        self.reads = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _rpm(self, filename, contents, directory=None):
+        path = os.path.join(directory or self.repo_dir, filename)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def _read(self, ts, path):
+        self.reads.append(os.path.basename(path))
+        return fake_header(ts, path)
+
+    def _index(self):
+        index = RpmIndex(self.repo_dir, self.index_path, self._read)
+        index.update()
+        return index
+
+    def test_headers_are_read_once(self):
+        self._rpm("foo-1.0-1.noarch.rpm", "foo - 1.0 1")
+        self._rpm("foo-1.1-1.noarch.rpm", "foo 0 1.1 1")
+        self._rpm("bar-2.0-1.noarch.rpm", "bar 1 2.0 1")
+        self._rpm("repomd.xml", "not an rpm")
+
+        index = self._index()
+        self.assertEqual(3, len(self.reads))
+        self.assertEqual(["foo-1.0-1.noarch.rpm", "foo-1.1-1.noarch.rpm"],
+            sorted(entry['file'] for entry in index.lookup("foo")))
+        self.assertEqual("1", index.lookup("bar")[0]['epoch'])
+        self.assertEqual("0", index.lookup("foo")[0]['epoch'])
+
+        self.reads = []
+        self._index()
+        self.assertEqual([], self.reads)
+
+    def test_changed_and_removed_files(self):
+        path = self._rpm("foo-1.0-1.noarch.rpm", "foo - 1.0 1")
+        self._rpm("bar-2.0-1.noarch.rpm", "bar - 2.0 1")
+        self._index()
+
+        self._rpm("foo-1.0-1.noarch.rpm", "foo - 1.0 2")
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        os.unlink(os.path.join(self.repo_dir, "bar-2.0-1.noarch.rpm"))
+        self.reads = []
+        index = self._index()
+        self.assertEqual(["foo-1.0-1.noarch.rpm"], self.reads)
+        self.assertEqual("2", index.lookup("foo")[0]['release'])
+        self.assertEqual([], index.lookup("bar"))
+
+    def test_prune_other_versions(self):
+        self._rpm("foo-0.9-1.noarch.rpm", "foo - 0.9 1")
+        self._rpm("foo-1.0-1.noarch.rpm", "foo - 1.0 1")
+        self._rpm("foo-1.1-1.noarch.rpm", "foo - 1.1 1")
+        self._rpm("bar-1.0-1.noarch.rpm", "bar - 1.0 1")
+
+        # Bypass the constructor, it needs a whole git repository:
+        releaser = YumRepoReleaser.__new__(YumRepoReleaser)
+        releaser.no_cache = False
+        releaser.builder = Mock()
+        releaser.builder.artifacts = [
+            self._rpm("foo-1.0-1.noarch.rpm", "foo - 1.0 1", self.tmp_dir),
+            self._rpm("foo-1.0-1.src.rpm", "foo - 1.0 1", self.tmp_dir),
+        ]
+        with patch.object(YumRepoReleaser, "_read_rpm_header",
+                lambda self, ts, path: fake_header(ts, path)), \
+                patch("tito.release.main.run_command",
+                    lambda cmd: os.unlink(cmd.split()[1])):
+            releaser.prune_other_versions(self.repo_dir)
+
+        self.assertEqual(["bar-1.0-1.noarch.rpm", "foo-1.0-1.noarch.rpm"],
+            sorted(os.listdir(self.repo_dir)))
+        self.assertTrue(os.path.exists(self.index_path))
+
+
+class RepodataUpdateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.repo_dir = os.path.join(self.tmp_dir, "repo")
+        os.makedirs(os.path.join(self.repo_dir, "repodata"))
+        os.makedirs(os.path.join(self.repo_dir, "el8"))
+        for path in ["foo-1.0-1.noarch.rpm", "bar-1.0-1.noarch.rpm",
+                "el8/baz-1.0-1.noarch.rpm", "repodata/repomd.xml"]:
+            open(os.path.join(self.repo_dir, path), "w").close()
+
+        releaser = YumRepoReleaser.__new__(YumRepoReleaser)
+        releaser.no_cache = False
+        releaser.build_dir = self.tmp_dir
+        releaser.prefix = "yumrepo-"
+        releaser.target = "yum"
+        releaser.releaser_config = RawConfigParser()
+        releaser.releaser_config.add_section("yum")
+        releaser.builder = Mock()
+        releaser.builder.artifacts = ["/tmp/foo-1.0-1.noarch.rpm"]
+        releaser.new_files = {self.repo_dir: ["foo-1.0-1.noarch.rpm",
+            "foo-1.0.tar.gz"]}
+        self.releaser = releaser
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _process(self, recycles=True, fail_delta=False):
+        ran = []
+
+        def run_command(cmd, print_on_success=False, cwd=None):
+            words = cmd.split()
+            packages = None
+            if "--pkglist" in words:
+                with open(words[words.index("--pkglist") + 1]) as f:
+                    packages = f.read().split()
+            ran.append((cmd, packages))
+            if fail_delta and "--recycle-pkglist" in words:
+                raise RunCommandException(cmd, 2, "Cannot stat")
+            return ""
+        with patch.object(YumRepoReleaser, "prune_other_versions",
+                return_value=["foo-0.9-1.noarch.rpm"]), \
+                patch.object(YumRepoReleaser, "_createrepo_recycles_pkglist",
+                    return_value=recycles), \
+                patch("tito.release.main.run_command", run_command):
+            self.releaser.process_packages(self.repo_dir)
+        return ran
+
+    def _pkglist(self, cmd):
+        words = cmd.split()
+        return words[words.index("--pkglist") + 1]
+
+    def test_incremental_update(self):
+        ran = self._process()
+        self.assertEqual(1, len(ran))
+        cmd, packages = ran[0]
+        pkglist = self._pkglist(cmd)
+        self.assertEqual("createrepo_c --update --cachedir "
+            "%s.createrepo-cache --recycle-pkglist --excludes "
+            "foo-0.9-1.noarch.rpm --pkglist %s ." % (self.repo_dir, pkglist),
+            cmd)
+        self.assertEqual(["foo-1.0-1.noarch.rpm"], packages)
+        self.assertFalse(os.path.exists(pkglist))
+        self.assertTrue(os.path.isdir("%s.createrepo-cache" % self.repo_dir))
+
+    def test_replaced_package_is_not_listed_twice(self):
+        # The old metadata lists it already, --update reads it again:
+        self.releaser.new_files = {}
+        self.assertEqual([("createrepo_c --update --cachedir "
+            "%s.createrepo-cache --recycle-pkglist --excludes "
+            "foo-0.9-1.noarch.rpm ." % self.repo_dir, None)], self._process())
+
+    def test_all_packages_without_recycling(self):
+        ran = self._process(recycles=False)
+        self.assertEqual(1, len(ran))
+        cmd, packages = ran[0]
+        self.assertEqual("createrepo_c --update --cachedir "
+            "%s.createrepo-cache --pkglist %s ." % (self.repo_dir,
+                self._pkglist(cmd)), cmd)
+        self.assertEqual(["bar-1.0-1.noarch.rpm", "el8/baz-1.0-1.noarch.rpm",
+            "foo-1.0-1.noarch.rpm"], packages)
+
+    def test_all_packages_without_repodata(self):
+        os.unlink(os.path.join(self.repo_dir, "repodata", "repomd.xml"))
+        cmd, packages = self._process()[0]
+        self.assertFalse("--recycle-pkglist" in cmd)
+        self.assertEqual(3, len(packages))
+
+    def test_all_packages_if_old_metadata_is_stale(self):
+        with patch("tito.release.main.warn_out"):
+            ran = self._process(fail_delta=True)
+        self.assertEqual(2, len(ran))
+        self.assertEqual(["bar-1.0-1.noarch.rpm", "el8/baz-1.0-1.noarch.rpm",
+            "foo-1.0-1.noarch.rpm"], ran[1][1])
+
+    def test_full_rebuild(self):
+        self.releaser.releaser_config.set("yum", "createrepo_full", "true")
+        self.assertEqual([("createrepo_c .", None)], self._process())
+
+    def test_custom_command(self):
+        self.releaser.releaser_config.set("yum", "createrepo_command",
+            "createrepo_c -s sha1 .")
+        self.assertEqual([("createrepo_c -s sha1 .", None)], self._process())
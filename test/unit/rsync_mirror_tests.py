@@ -0,0 +1,120 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for the local rsync mirrors of RsyncReleaser. """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import Mock, patch
+
+from tito.exception import RunCommandException
+from tito.release import RsyncReleaser
+
+
+class RsyncMirrorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Bypass the constructor, it needs a whole git repository:
+        self.releaser = RsyncReleaser.__new__(RsyncReleaser)
+        self.releaser.user_config = {'CACHE_DIR': self.tmp_dir}
+        self.releaser.rsync_args = "-rlvz"
+        self.releaser.no_cache = False
+        self.releaser.no_cleanup = False
+        self.releaser.dry_run = False
+        self.releaser.filetypes = ['rpm']
+        self.releaser.releaser_config = None
+        self.releaser.target = "rsync"
+        self.location = "example.com:/srv/repo/"
+        self.mirror = self.releaser._mirror_dir(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _release(self, side_effect=None):
+        ran = []
+
+        def run_command(cmd, print_on_success=False, cwd=None):
+            ran.append(cmd)
+            if side_effect:
+                side_effect(cmd)
+            return ""
+        with patch("tito.release.main.run_command", run_command), \
+                patch.object(RsyncReleaser, "_copy_files_to_temp_dir"):
+            self.releaser._release_to_location(self.location)
+        return ran
+
+    def test_mirror_location(self):
+        self.assertEqual(os.path.join(self.tmp_dir, "rsync",
+            "example.com_srv_repo"), self.mirror)
+
+    def test_delta_pull_and_push(self):
+        ran = self._release()
+        self.assertEqual([
+            "rsync -rlvz -t --delete %s %s" % (self.location, self.mirror),
+            "rsync -rlvz -t --delete %s/ %s" % (self.mirror, self.location),
+        ], ran)
+        self.assertFalse(os.path.exists("%s.dirty" % self.mirror))
+
+    def test_unfinished_release_compares_checksums(self):
+        self.releaser.dry_run = True
+        self._release()
+        self.assertTrue(os.path.exists("%s.dirty" % self.mirror))
+
+        self.releaser.dry_run = False
+        ran = self._release()
+        self.assertEqual("rsync -rlvz -t --delete --checksum %s %s" % (
+            self.location, self.mirror), ran[0])
+        self.assertFalse(os.path.exists("%s.dirty" % self.mirror))
+
+    def test_broken_mirror_is_downloaded_again(self):
+        os.makedirs(self.mirror)
+        stale = os.path.join(self.mirror, "stale.rpm")
+        open(stale, "w").close()
+
+        def fail_first_pull(cmd):
+            if "--delete %s" % self.location in cmd:
+                raise RunCommandException(cmd, 23, "partial transfer")
+        ran = self._release(fail_first_pull)
+        self.assertEqual("rsync -rlvz -t %s %s" % (self.location, self.mirror),
+            ran[1])
+        self.assertFalse(os.path.exists(stale))
+
+    def test_no_cache_uses_a_temporary_directory(self):
+        self.releaser.no_cache = True
+        self.releaser.build_dir = self.tmp_dir
+        self.releaser.prefix = "temp_dir="
+        ran = self._release()
+        self.assertFalse(os.path.exists(self.mirror))
+        self.assertTrue(ran[0].startswith("rsync -rlvz %s %s" % (
+            self.location, os.path.join(self.tmp_dir, "temp_dir="))))
+
+    def test_new_files_are_recorded(self):
+        os.makedirs(self.mirror)
+        open(os.path.join(self.mirror, "foo-1.0-1.noarch.rpm"), "w").close()
+        self.releaser.new_files = {}
+        self.releaser.releaser_config = Mock()
+        self.releaser.releaser_config.has_option.return_value = False
+        self.releaser.builder = Mock()
+        self.releaser.builder.artifacts = []
+        for name in ["foo-1.0-1.noarch.rpm", "foo-doc-1.0-1.noarch.rpm",
+                "foo-1.0-1.src.rpm"]:
+            path = os.path.join(self.tmp_dir, name)
+            open(path, "w").close()
+            self.releaser.builder.artifacts.append(path)
+        self.releaser._copy_files_to_temp_dir(self.mirror)
+        self.assertEqual(["foo-doc-1.0-1.noarch.rpm"],
+            self.releaser.new_files[self.mirror])
@@ -0,0 +1,154 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for tagging all changed packages with tito tag --changed. """
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tito.compat import getoutput
+from tito.tagger.batch import find_changed_packages, read_package_metadata, \
+    tag_packages
+
+
+class FakeTagger(object):
+    """
+    Stand-in for a tagger with deferred commits, bumping a version file.
+    """
+
+    def __init__(self, name, project_dir, rel_eng_dir, running):
+        self.name = name
+        self.project_dir = project_dir
+        self.rel_eng_dir = rel_eng_dir
+        self.running = running
+        self.defer_commit = False
+        self.new_version = None
+        self._files_to_add = []
+        self._files_to_remove = []
+
+    def run(self, options):
+        with self.running['lock']:
+            self.running['now'] += 1
+            self.running['max'] = max(self.running['max'],
+                self.running['now'])
+        assert self.defer_commit
+        version_file = os.path.join(self.project_dir, "VERSION")
+        with open(version_file, "w") as f:
+            f.write("2.0\n")
+        metadata_file = os.path.join(self.rel_eng_dir, "packages", self.name)
+        with open(metadata_file, "w") as f:
+            f.write("2.0-1 %s/\n" % os.path.basename(self.project_dir))
+        self._files_to_add.extend([version_file, metadata_file])
+        self.new_version = "2.0-1"
+        with self.running['lock']:
+            self.running['now'] -= 1
+
+    def _commit_message(self, new_version):
+        return "Automatic commit of package [%s] release [%s]." % (
+            self.name, new_version)
+
+    def _create_tag(self, new_version):
+        tag = "%s-%s" % (self.name, new_version)
+        getoutput("git tag -m %s %s" % (tag, tag))
+        return tag
+
+
+class TagChangedTests(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.rel_eng_dir = os.path.join(self.repo, ".tito")
+        os.makedirs(os.path.join(self.rel_eng_dir, "packages"))
+        self._write(".tito/packages/.readme", "metadata")
+        for name in ["foo", "bar", "baz"]:
+            os.makedirs(os.path.join(self.repo, name))
+            self._write("%s/VERSION" % name, "1.0\n")
+            self._write(".tito/packages/%s" % name, "1.0-1 %s/\n" % name)
+        self.old_cwd = os.getcwd()
+        os.chdir(self.repo)
+        getoutput("git init -q && git config user.name Tito && "
+            "git config user.email tito@example.com")
+        getoutput("git add . && git commit -q -m tagged")
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.repo)
+
+    def _write(self, path, contents):
+        with open(os.path.join(self.repo, path), "w") as f:
+            f.write(contents)
+
+    def _commit(self, path, contents):
+        self._write(path, contents)
+        getoutput("git add %s && git commit -q -m change" % path)
+
+    def test_read_package_metadata(self):
+        self.assertEqual([("bar", "bar/"), ("baz", "baz/"), ("foo", "foo/")],
+            read_package_metadata(self.rel_eng_dir))
+
+    def test_find_changed_packages(self):
+        self.assertEqual([], find_changed_packages(self.repo,
+            self.rel_eng_dir))
+        self._commit("foo/README", "changed")
+        self._commit("baz/VERSION", "1.1\n")
+        self._commit("README", "outside of all packages")
+        self.assertEqual([("baz", "baz/"), ("foo", "foo/")],
+            find_changed_packages(self.repo, self.rel_eng_dir))
+
+    def test_removed_package_is_skipped(self):
+        getoutput("git rm -q -r bar && git commit -q -m removed")
+        self.assertEqual([], find_changed_packages(self.repo,
+            self.rel_eng_dir))
+
+    def test_one_commit_for_all_packages(self):
+        self._commit("foo/README", "changed")
+        self._commit("bar/README", "changed")
+        packages = find_changed_packages(self.repo, self.rel_eng_dir)
+        head = getoutput("git rev-parse HEAD")
+        running = {'lock': threading.Lock(), 'now': 0, 'max': 0}
+
+        def create_tagger(name, project_dir):
+            self.assertEqual(os.path.join(self.repo, name), project_dir)
+            return FakeTagger(name, project_dir, self.rel_eng_dir, running)
+
+        tags = tag_packages(create_tagger, packages, None, self.repo)
+
+        self.assertEqual(["bar-2.0-1", "foo-2.0-1"], tags)
+        self.assertEqual(head, getoutput("git rev-parse HEAD^"))
+        self.assertEqual("", getoutput("git status --porcelain"))
+        self.assertEqual(sorted([".tito/packages/bar", ".tito/packages/foo",
+            "bar/VERSION", "foo/VERSION"]), sorted(getoutput(
+                "git show --format= --name-only HEAD").splitlines()))
+        message = getoutput("git log -1 --format=%B")
+        self.assertTrue(message.startswith("Automatic commit of 2 packages."))
+        self.assertTrue("[bar] release [2.0-1]" in message)
+        for tag in tags:
+            self.assertEqual(getoutput("git rev-parse HEAD"),
+                getoutput("git rev-list -n 1 %s" % tag))
+        self.assertEqual([], find_changed_packages(self.repo,
+            self.rel_eng_dir))
+
+    def test_serial_tagging(self):
+        for name in ["foo", "bar", "baz"]:
+            self._commit("%s/README" % name, "changed")
+        running = {'lock': threading.Lock(), 'now': 0, 'max': 0}
+
+        def create_tagger(name, project_dir):
+            return FakeTagger(name, project_dir, self.rel_eng_dir, running)
+
+        tag_packages(create_tagger, find_changed_packages(self.repo,
+            self.rel_eng_dir), None, self.repo, max_workers=1)
+        self.assertEqual(1, running['max'])
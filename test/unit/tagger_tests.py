@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 from unittest import mock
 from datetime import datetime
@@ -39,3 +40,12 @@ def test_today_datetime(self):
         self.config["buildconfig"] = {"changelog_date_with_time": True}
         tagger = VersionTagger(self.config)
         assert tagger.today == "Wed Apr 22 15:02:00 UTC 2020"
+
+    def test_version_file_in_project_dir(self):
+        self.config["version_template"] = {"destination_file": "version.txt"}
+        tagger = VersionTagger(self.config, project_dir=srcdir)
+        # Tagging many packages at once runs from somewhere else:
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tempfile.gettempdir())
+        self.assertEqual(os.path.join(srcdir, "version.txt"),
+            tagger._version_file_path())
@@ -0,0 +1,146 @@
+# Copyright (c) 2008-2024 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+""" Unit tests for following Koji and Copr tasks with tito release --watch. """
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from tito.cli import ReleaseModule
+from tito.release.tasks import CoprBuilds, KojiTasks, TaskWatcher, \
+    extract_copr_build_ids, task_service
+
+# Stand-in for koji, a task is open for as many queries as its ID says,
+# then task 2 fails and all others succeed:
+FAKE_KOJI = """#!/bin/sh
+count="%(dir)s/koji-$2"
+echo x >> "$count"
+echo "Task: $2"
+if [ "$(wc -l < "$count")" -le "$2" ]; then
+    echo "State: open"
+elif [ "$2" = "2" ]; then
+    echo "State: failed"
+else
+    echo "State: closed"
+fi
+"""
+
+# Stand-in for copr-cli, build 7 is still running on the first query:
+FAKE_COPR = """#!/bin/sh
+count="%(dir)s/copr-$2"
+echo x >> "$count"
+if [ "$2" = "7" ] && [ "$(wc -l < "$count")" -le 1 ]; then
+    echo "running"
+else
+    echo "succeeded"
+fi
+"""
+
+
+async def no_sleep(seconds):
+    pass
+
+
+def write_script(path, contents):
+    with open(path, "w") as f:
+        f.write(contents)
+    os.chmod(path, 0o755)
+
+
+class TaskWatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.koji = os.path.join(self.tmp_dir, "koji")
+        self.copr = os.path.join(self.tmp_dir, "copr-cli")
+        write_script(self.koji, FAKE_KOJI % {'dir': self.tmp_dir})
+        write_script(self.copr, FAKE_COPR % {'dir': self.tmp_dir})
+        self.sleeps = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _wait(self, watcher):
+        async def sleep(seconds):
+            self.sleeps.append(seconds)
+        with patch("tito.release.tasks.asyncio.sleep", sleep):
+            return watcher.wait()
+
+    def test_koji_and_copr_tasks(self):
+        watcher = TaskWatcher(poll_interval=5, max_interval=15)
+        watcher.add("koji f40", 3, KojiTasks(self.koji))
+        watcher.add("koji f39", 2, KojiTasks(self.koji))
+        watcher.add("copr fedora-40", 7, CoprBuilds(self.copr))
+
+        self.assertEqual({3: "closed", 2: "failed", 7: "succeeded"},
+            self._wait(watcher))
+        self.assertEqual(["koji f39"], watcher.failed())
+        # Each task backs off exponentially, task 3 was queried four times:
+        self.assertEqual([5, 5, 5, 10, 10, 15], sorted(self.sleeps))
+
+    def test_unknown_tasks_fail(self):
+        watcher = TaskWatcher(poll_interval=1)
+        watcher.add("missing", 1, KojiTasks(os.path.join(self.tmp_dir,
+            "no-such-koji")))
+        self.assertEqual({1: None}, self._wait(watcher))
+        self.assertEqual(["missing"], watcher.failed())
+
+    def test_task_service(self):
+        service = task_service("copr", "copr-cli --config ~/.copr")
+        self.assertTrue(isinstance(service, CoprBuilds))
+        self.assertEqual("copr-cli --config ~/.copr status 12",
+            service.command(12))
+        self.assertEqual("koji --profile stg taskinfo 12",
+            task_service("koji", "koji --profile stg").command(12))
+
+    def test_extract_copr_build_ids(self):
+        self.assertEqual([123, 124], extract_copr_build_ids(
+            "Uploading package foo.src.rpm\nCreated builds: 123 124\n"))
+        self.assertEqual([], extract_copr_build_ids("Build was not created"))
+
+
+class ReleaseWatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.koji = os.path.join(self.tmp_dir, "koji")
+        write_script(self.koji, FAKE_KOJI % {'dir': self.tmp_dir})
+        self.module = ReleaseModule()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_collect_tasks_in_target_order(self):
+        tasks_dir = os.path.join(self.tmp_dir, "tasks")
+        os.makedirs(tasks_dir)
+        for index in [10, 2]:
+            with open(os.path.join(tasks_dir, "%s.json" % index), "w") as f:
+                json.dump([["target%s f40" % index, "koji", "koji", index]],
+                    f)
+        self.assertEqual([["target2 f40", "koji", "koji", 2],
+            ["target10 f40", "koji", "koji", 10]],
+            self.module._collect_tasks(tasks_dir))
+        self.assertFalse(os.path.exists(tasks_dir))
+
+    def test_watch_fails_for_failed_tasks(self):
+        with patch("tito.release.tasks.asyncio.sleep", no_sleep):
+            self.assertRaises(SystemExit, self.module._watch_tasks,
+                [["fedora f39", "koji", self.koji, 2]])
+
+    def test_watch_without_tasks(self):
+        self.module._watch_tasks([])